@@ -0,0 +1 @@
+"""Shared infrastructure for the crewai and openai-agents SWE-Bench-Lite runners."""
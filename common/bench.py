@@ -0,0 +1,298 @@
+"""End-to-end throughput benchmark of the sweep runners.
+
+A fixed range of instances is run through a runner (``crewai`` or ``openai``) once
+per concurrency level. Each run is a separate process with its own working
+directory, so results store, trace and checkouts of different levels never mix.
+The LLM backend is selected with ``--llm``:
+
+- ``stub``: replay mode on an empty cache, so every LLM call gets an immediate
+  final answer. This measures pure runner and tool overhead.
+- ``replay``: replay of the responses recorded in ``LLM_CACHE_DIR``.
+- ``live``: the real proxy.
+
+With ``--dataset`` the local task server and mock test service
+(``common/local_services.py``) are started in-process, otherwise ``TASK_API_URL``
+and ``TEST_SERVICE_URL`` are used. Every level is stored in ``bench.db``
+with the git commit: instances/hour, p50/p95 per stage, tokens per
+instance, peak RSS, peak disk use and the span summary of the trace.
+``compare`` reports the change from the previous commit::
+
+    python -m common.bench run --framework openai --start 1 --end 10 --levels 1,4,8 --dataset lite.jsonl
+    python -m common.bench compare --threshold 10
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from common.results import ResultsStore, summarize
+from common.tracing import load_spans, summarize_spans
+
+BENCH_DB = os.environ.get("BENCH_DB", "bench.db")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNNERS = {
+    "crewai": os.path.join(ROOT, "crewai", "main.py"),
+    "openai": os.path.join(ROOT, "openai", "openaisdk.py"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bench (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    git_commit TEXT NOT NULL,
+    framework TEXT NOT NULL,
+    llm TEXT NOT NULL,
+    concurrency INTEGER NOT NULL,
+    instances INTEGER NOT NULL,
+    ok INTEGER NOT NULL,
+    wall_time REAL NOT NULL,
+    instances_per_hour REAL NOT NULL,
+    stages TEXT NOT NULL,
+    tokens_per_instance REAL,
+    peak_rss_mb REAL,
+    peak_disk_mb REAL,
+    spans TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# Metrics compared by ``compare``, True if higher is better
+COMPARED = {"instances_per_hour": True, "agent_p95": False, "total_p95": False, "peak_rss_mb": False,
+            "peak_disk_mb": False, "tokens_per_instance": False}
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return "unknown"
+
+
+def disk_usage(*paths):
+    total = 0
+    for path in paths:
+        for dirpath, _, filenames in os.walk(path):
+            for name in filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, name)).st_size
+                except OSError:
+                    pass
+    return total
+
+
+class DiskSampler(threading.Thread):
+    def __init__(self, paths, interval):
+        super().__init__(daemon=True)
+        self.paths = paths
+        self.interval = interval
+        self.peak = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, disk_usage(*self.paths))
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.peak = max(self.peak, disk_usage(*self.paths))
+
+
+def run_level(framework, start, end, concurrency, workdir, env, timeout, sample_interval):
+    """Runs one sweep in ``workdir``; returns ``(wall_time, peak_rss_mb, peak_disk_mb)``."""
+    os.makedirs(workdir, exist_ok=True)
+    command = [sys.executable, RUNNERS[framework], "--start", str(start), "--end", str(end),
+               "--concurrency", str(concurrency), "--timeout", str(timeout)]
+    sampler = DiskSampler([workdir, env["REPO_CACHE_DIR"]], sample_interval)
+    sampler.start()
+    started = time.monotonic()
+    with open(os.path.join(workdir, "runner.log"), "w", encoding="utf-8") as log:
+        process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 reports the peak RSS of this runner (and its waited-for children) only
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    wall_time = time.monotonic() - started
+    sampler.stop()
+    if process.returncode != 0:
+        print(f"Runner exited with {process.returncode}, see {os.path.join(workdir, 'runner.log')}")
+    return wall_time, usage.ru_maxrss / 1024, sampler.peak / 1024 / 1024
+
+
+def level_metrics(workdir):
+    store = ResultsStore(os.path.join(workdir, "results.db"))
+    records = store.records(store.latest_run())
+    summary = summarize(records)
+    tokens = [(r["prompt_tokens"] or 0) + (r["completion_tokens"] or 0) for r in records
+              if r["prompt_tokens"] is not None or r["completion_tokens"] is not None]
+    trace = os.path.join(workdir, "trace.jsonl")
+    spans = summarize_spans(load_spans(trace)) if os.path.exists(trace) else []
+    return summary, (sum(tokens) / len(tokens) if tokens else None), spans
+
+
+class BenchStore:
+    def __init__(self, path=BENCH_DB):
+        self.path = path
+        conn = sqlite3.connect(path)
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def record(self, **fields):
+        fields.setdefault("created_at", time.time())
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                conn.execute(f"INSERT INTO bench ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})",
+                             list(fields.values()))
+        finally:
+            conn.close()
+
+    def rows(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = [dict(r) for r in conn.execute("SELECT * FROM bench ORDER BY id")]
+        finally:
+            conn.close()
+        for row in rows:
+            row["stages"] = json.loads(row["stages"])
+            row["spans"] = json.loads(row["spans"])
+        return rows
+
+
+def _metric(row, name):
+    if name.endswith("_p95"):
+        stage = row["stages"].get(name[:-4])
+        return stage["p95"] if stage else None
+    return row[name]
+
+
+def run(args):
+    store = BenchStore(args.db)
+    commit = git_commit()
+    bench_dir = os.path.abspath(args.bench_dir)
+    env = dict(os.environ, PYTHONUNBUFFERED="1", TRACE_FILE="trace.jsonl")
+    env.setdefault("REPO_CACHE_DIR", os.path.join(bench_dir, "repo-cache"))
+    env["REPO_CACHE_DIR"] = os.path.abspath(env["REPO_CACHE_DIR"])
+    if args.llm == "stub":
+        env.update(LLM_CACHE_MODE="replay", LLM_REPLAY_MISS="stub", LLM_CACHE_DIR=tempfile.mkdtemp(prefix="llm-stub-"))
+    elif args.llm == "replay":
+        env.update(LLM_CACHE_MODE="replay")
+
+    servers = []
+    if args.dataset:
+        from common.local_services import eval_server, task_server
+        servers = [task_server(args.dataset, port=0, repo_base=args.repo_base),
+                   eval_server(port=0, latency=args.eval_latency, slots=args.eval_slots)]
+        for server in servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        env["TASK_API_URL"] = f"http://127.0.0.1:{servers[0].server_address[1]}/task/index/"
+        env["TEST_SERVICE_URL"] = f"http://127.0.0.1:{servers[1].server_address[1]}/test"
+    try:
+        for level in args.levels:
+            workdir = os.path.join(bench_dir, f"{args.framework}-c{level}-{time.strftime('%Y%m%d-%H%M%S')}")
+            print(f"[bench] {args.framework} concurrency {level}: instances {args.start}-{args.end} in {workdir}")
+            wall_time, rss, disk = run_level(args.framework, args.start, args.end, level, workdir, env,
+                                             args.timeout, args.sample_interval)
+            summary, tokens, spans = level_metrics(workdir)
+            instances = summary["instances"]
+            store.record(git_commit=commit, framework=args.framework, llm=args.llm, concurrency=level,
+                         instances=instances, ok=summary["statuses"].get("ok", 0), wall_time=wall_time,
+                         instances_per_hour=instances / wall_time * 3600 if wall_time else 0.0,
+                         stages=json.dumps(summary["stages"]), tokens_per_instance=tokens, peak_rss_mb=rss,
+                         peak_disk_mb=disk, spans=json.dumps(spans))
+            print(f"[bench] {instances} instances in {wall_time:.1f}s = {instances / wall_time * 3600:.1f}/h, "
+                  f"peak RSS {rss:.0f} MB, peak disk {disk:.0f} MB")
+    finally:
+        for server in servers:
+            server.shutdown()
+    print_table([r for r in store.rows() if r["git_commit"] == commit and r["framework"] == args.framework])
+
+
+def print_table(rows):
+    print(f"{'commit':<14}{'framework':<10}{'llm':<8}{'conc':>5}{'n':>5}{'ok':>5}{'inst/h':>9}"
+          f"{'agent p50':>11}{'agent p95':>11}{'total p95':>11}{'tok/inst':>10}{'RSS MB':>8}{'disk MB':>9}")
+    for r in rows:
+        agent = r["stages"].get("agent") or {}
+        total = r["stages"].get("total") or {}
+        print(f"{r['git_commit']:<14}{r['framework']:<10}{r['llm']:<8}{r['concurrency']:>5}{r['instances']:>5}"
+              f"{r['ok']:>5}{r['instances_per_hour']:>9.1f}{agent.get('p50') or 0:>11.1f}{agent.get('p95') or 0:>11.1f}"
+              f"{total.get('p95') or 0:>11.1f}{r['tokens_per_instance'] or 0:>10.0f}{r['peak_rss_mb'] or 0:>8.0f}"
+              f"{r['peak_disk_mb'] or 0:>9.0f}")
+
+
+def compare(args):
+    """Compares the latest commit with the one before, per framework, LLM backend and concurrency."""
+    rows = BenchStore(args.db).rows()
+    commits = list(dict.fromkeys(r["git_commit"] for r in rows))
+    if len(commits) < 2:
+        print("Need results of two commits to compare")
+        return 0
+    old, new = (args.base or commits[-2]), (args.head or commits[-1])
+    latest = {}
+    for r in rows:
+        latest[(r["git_commit"], r["framework"], r["llm"], r["concurrency"])] = r
+    regressions = 0
+    print(f"{old} -> {new}")
+    for (commit, framework, llm, concurrency), after in sorted(latest.items()):
+        before = latest.get((old, framework, llm, concurrency))
+        if commit != new or before is None:
+            continue
+        for name, higher_is_better in COMPARED.items():
+            a, b = _metric(before, name), _metric(after, name)
+            if not a or b is None:
+                continue
+            change = (b - a) / a * 100
+            worse = change < -args.threshold if higher_is_better else change > args.threshold
+            regressions += worse
+            print(f"  {framework:<8}{llm:<8}c={concurrency:<4}{name:<20}{a:>10.1f} -> {b:>10.1f} ({change:+.1f}%)"
+                  f"{'  REGRESSION' if worse else ''}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmark of the sweep runners")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("--framework", choices=sorted(RUNNERS), required=True)
+    run_parser.add_argument("--start", type=int, default=1)
+    run_parser.add_argument("--end", type=int, default=10)
+    run_parser.add_argument("--levels", type=lambda s: [int(v) for v in s.split(",")], default=[1, 4, 8],
+                            help="comma separated concurrency levels")
+    run_parser.add_argument("--llm", choices=["stub", "replay", "live"], default="stub")
+    run_parser.add_argument("--dataset", help="serve tasks from this file with the local task and test services")
+    run_parser.add_argument("--repo-base", default="https://github.com",
+                            help="base URL for clone URLs of raw dataset rows, e.g. a directory with local mirrors")
+    run_parser.add_argument("--eval-latency", type=float, default=1.0, help="latency of the mock test service")
+    run_parser.add_argument("--eval-slots", type=int, default=4, help="parallel evaluations of the mock test service")
+    run_parser.add_argument("--timeout", type=float, default=1800, help="agent timeout per instance")
+    run_parser.add_argument("--bench-dir", default="bench")
+    run_parser.add_argument("--sample-interval", type=float, default=5.0, help="seconds between disk samples")
+    run_parser.add_argument("--db", default=BENCH_DB)
+    compare_parser = sub.add_parser("compare")
+    compare_parser.add_argument("--db", default=BENCH_DB)
+    compare_parser.add_argument("--base", help="commit to compare against (default: second to last)")
+    compare_parser.add_argument("--head", help="commit to compare (default: last)")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="allowed change in percent")
+    show_parser = sub.add_parser("show")
+    show_parser.add_argument("--db", default=BENCH_DB)
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    elif args.command == "compare":
+        sys.exit(compare(args))
+    else:
+        print_table(BenchStore(args.db).rows())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Context compaction and token budgets for LLM requests of long agent runs.
+
+Agent frameworks resend the whole conversation on every turn, including every
+file read and tool output so far. Before a request leaves the process, its
+messages are compacted (chat completions ``messages`` and responses ``input``,
+native tool calls as well as crewai's ``Action/Observation`` text):
+
+1. reads of a file that was read again or changed later are replaced by a stub,
+2. while the prompt is above ``LLM_PROMPT_BUDGET`` tokens, the oldest tool outputs
+   (all but the newest ``LLM_KEEP_RECENT / 2``) are cut to a short summary, then
+   long messages older than the last ``LLM_KEEP_RECENT`` messages are shortened.
+
+System messages and the first user message (issue and task) are never touched,
+and neither are the assistant's own messages with the plan.
+The tokens of every attempt of an instance are counted, and once
+``LLM_INSTANCE_BUDGET`` (split evenly between speculative attempts) is used up,
+requests get a final answer instead of being sent. Tokens are
+estimated at four characters each.
+"""
+import json
+import os
+import re
+import threading
+
+LLM_PROMPT_BUDGET = int(os.environ.get("LLM_PROMPT_BUDGET", "24000"))
+LLM_INSTANCE_BUDGET = int(os.environ.get("LLM_INSTANCE_BUDGET", "2000000"))  # 0 for no limit
+LLM_KEEP_RECENT = int(os.environ.get("LLM_KEEP_RECENT", "6"))
+
+SUMMARY_CHARS = 300
+BUDGET_ANSWER = ("Thought: The token budget of this task is used up.\n"
+                 "Final Answer: Stopped, the token budget for this task is exhausted.")
+_OBSERVATION_RE = re.compile(r"Action:\s*(.+?)\s*\nAction Input:\s*(.*?)\s*\nObservation:\s?", re.DOTALL)
+_READ_NAMES = re.compile(r"read", re.IGNORECASE)
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1 if text else 0
+
+
+def _text(content):
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+def _paths(arguments):
+    """File paths in the arguments of a tool call (JSON string or dict, crewai nests them in ``data``)."""
+    if isinstance(arguments, str):
+        try:
+            arguments = json.loads(arguments)
+        except ValueError:
+            return set()
+    if not isinstance(arguments, dict):
+        return set()
+    found = set()
+    for value in [arguments, *[v for v in arguments.values() if isinstance(v, dict)]]:
+        if isinstance(value.get("path"), str):
+            found.add(os.path.normpath(value["path"]))
+    return found
+
+
+class _Output:
+    """A tool output inside a message, with accessors to replace its text."""
+
+    def __init__(self, position, name, arguments, get, put):
+        self.position = position
+        self.name = name
+        self.paths = _paths(arguments)
+        self.get = get
+        self.put = put
+
+
+def _chat_outputs(messages):
+    calls = {}
+    outputs = []
+    for position, message in enumerate(messages):
+        role = message.get("role")
+        for call in message.get("tool_calls") or []:
+            function = call.get("function") or {}
+            calls[call.get("id")] = (function.get("name", ""), function.get("arguments"))
+        if role == "tool" and isinstance(message.get("content"), str):
+            name, arguments = calls.get(message.get("tool_call_id"), ("", None))
+            outputs.append(_Output(position, name, arguments, lambda m=message: m["content"],
+                                   lambda text, m=message: m.__setitem__("content", text)))
+        elif role in ("assistant", "user") and isinstance(message.get("content"), str):
+            outputs += _observation_outputs(position, message)
+    return outputs
+
+
+def _observation_outputs(position, message):
+    """crewai's text based tool use: ``Action: x / Action Input: {...} / Observation: result`` segments."""
+    content = message["content"]
+    matches = list(_OBSERVATION_RE.finditer(content))
+    if not matches:
+        return []
+    # parts alternate between surrounding text and observations, so each can be replaced on its own
+    parts, last = [], 0
+    for n, match in enumerate(matches):
+        limit = matches[n + 1].start() if n + 1 < len(matches) else len(content)
+        thought = content.find("\nThought:", match.end(), limit)
+        end = thought if thought != -1 else limit
+        parts += [content[last:match.end()], content[match.end():end]]
+        last = end
+    parts.append(content[last:])
+
+    def put(text, index):
+        parts[index] = text
+        message["content"] = "".join(parts)
+    return [_Output(position, match.group(1), match.group(2), lambda i=2 * n + 1: parts[i],
+                    lambda text, i=2 * n + 1: put(text, i)) for n, match in enumerate(matches)]
+
+
+def _responses_outputs(items):
+    calls = {}
+    outputs = []
+    for position, item in enumerate(items):
+        if item.get("type") == "function_call":
+            calls[item.get("call_id")] = (item.get("name", ""), item.get("arguments"))
+        elif item.get("type") == "function_call_output" and isinstance(item.get("output"), str):
+            name, arguments = calls.get(item.get("call_id"), ("", None))
+            outputs.append(_Output(position, name, arguments, lambda i=item: i["output"],
+                                   lambda text, i=item: i.__setitem__("output", text)))
+    return outputs
+
+
+def _item_tokens(item):
+    if "content" in item:
+        return estimate_tokens(_text(item["content"])) + 4
+    return estimate_tokens(json.dumps(item)) + 4
+
+
+def _summary(text, reason):
+    head = "\n".join(text.splitlines()[:3])[:SUMMARY_CHARS]
+    return f"{head}\n[{reason}: {estimate_tokens(text)} tokens of old tool output removed, call the tool again if needed]"
+
+
+def compact(items, outputs, budget=LLM_PROMPT_BUDGET, keep_recent=LLM_KEEP_RECENT):
+    """Compacts ``items`` in place; returns the number of tokens saved."""
+    before = sum(_item_tokens(i) for i in items)
+    # 1. reads superseded by a later read or change of the same file
+    touched_later = set()
+    for output in reversed(outputs):
+        if output.paths and _READ_NAMES.search(output.name) and len(output.paths) == 1 and output.paths <= touched_later:
+            text = output.get()
+            if not text.startswith("[superseded"):
+                output.put(f"[superseded: {next(iter(output.paths))} was read again or changed later, "
+                           "see the newer tool output]")
+        touched_later |= output.paths
+    # 2. oldest tool outputs first, then other long messages, until the prompt fits
+    total = sum(_item_tokens(i) for i in items)
+    recent = max(0, len(items) - keep_recent)
+    # the newest outputs are kept even if they share a message with older ones (crewai's scratchpad)
+    for output in outputs[:-max(1, keep_recent // 2)]:
+        if total <= budget:
+            break
+        text = output.get()
+        if estimate_tokens(text) > SUMMARY_CHARS // 2 and "old tool output removed" not in text:
+            summary = _summary(text, "evicted")
+            total -= estimate_tokens(text) - estimate_tokens(summary)
+            output.put(summary)
+    first_user = next((n for n, i in enumerate(items) if i.get("role") == "user"), None)
+    for position, item in enumerate(items[:recent]):
+        if total <= budget:
+            break
+        if position == first_user or item.get("role") in ("system", "developer", "assistant"):
+            continue
+        text = item.get("content")
+        if isinstance(text, str) and estimate_tokens(text) > 2 * SUMMARY_CHARS:
+            shortened = text[:SUMMARY_CHARS * 2] + "\n[... shortened to save context ...]\n" + text[-SUMMARY_CHARS:]
+            total -= estimate_tokens(text) - estimate_tokens(shortened)
+            item["content"] = shortened
+    return before - sum(_item_tokens(i) for i in items)
+
+
+def compact_request(body, budget=LLM_PROMPT_BUDGET, keep_recent=LLM_KEEP_RECENT):
+    """Compacts the conversation of a chat completions or responses request body in place."""
+    if isinstance(body.get("messages"), list):
+        items = body["messages"]
+        return compact(items, _chat_outputs(items), budget, keep_recent)
+    if isinstance(body.get("input"), list):
+        items = body["input"]
+        return compact(items, _responses_outputs(items), budget, keep_recent)
+    return 0
+
+
+def prompt_tokens(body):
+    items = body.get("messages") if isinstance(body.get("messages"), list) else body.get("input")
+    if isinstance(items, list):
+        return sum(_item_tokens(i) for i in items if isinstance(i, dict))
+    return estimate_tokens(_text(items))
+
+
+class TokenBudget:
+    """Tokens used per instance, so a single runaway instance cannot burn the sweep's budget.
+
+    Keys are instance indices or tuples starting with one, e.g. ``(index, attempt, speculative attempt)``.
+    """
+
+    def __init__(self, limit=LLM_INSTANCE_BUDGET):
+        self.limit = limit
+        self._used = {}
+        self._lock = threading.Lock()
+
+    def exhausted(self, instance, share=1.0):
+        return bool(self.limit) and instance is not None and self.used(instance) >= self.limit * share
+
+    def used(self, instance):
+        with self._lock:
+            return self._used.get(instance, 0)
+
+    def add(self, instance, tokens):
+        if instance is None:
+            return
+        with self._lock:
+            self._used[instance] = self._used.get(instance, 0) + tokens
+
+    def reset(self, instance):
+        """Forgets the tokens of ``instance`` and of all its attempts."""
+        with self._lock:
+            for key in [k for k in self._used if k == instance or (isinstance(k, tuple) and k[0] == instance)]:
+                del self._used[key]
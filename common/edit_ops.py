@@ -0,0 +1,201 @@
+"""Patch based editing for the agent tools of both frameworks.
+
+Instead of re-emitting a whole file, an agent sends search/replace hunks or a
+unified diff. Edits are applied in memory, validated (Python files must still
+compile) and written atomically, so a failed edit never leaves a truncated or
+half-edited file behind. The result is a short summary, not the file.
+``apply_edits_many`` does the same for several files in one call.
+"""
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from common.file_ops import invalidate
+from common.repo_index import notify_changed
+
+
+class EditError(Exception):
+    pass
+
+
+def validate(path, content):
+    """Raises EditError if ``content`` is not valid for the type of ``path``."""
+    if path.endswith(".py"):
+        try:
+            compile(content, path, "exec", dont_inherit=True)
+        except SyntaxError as e:
+            raise EditError(f"Syntax error in {path} line {e.lineno}: {e.msg}")
+    elif path.endswith(".json"):
+        try:
+            json.loads(content)
+        except ValueError as e:
+            raise EditError(f"Invalid JSON in {path}: {e}")
+
+
+def write_atomic(path, content):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".edit-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+        if os.path.exists(path):
+            shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+        invalidate(path)
+        notify_changed(path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _find_loose(content, search):
+    """Finds ``search`` ignoring trailing whitespace per line, returns ``(start, end)`` offsets or None."""
+    lines = content.splitlines(keepends=True)
+    wanted = [line.rstrip() for line in search.strip("\n").splitlines()]
+    if not wanted:
+        return None
+    matches = []
+    for i in range(len(lines) - len(wanted) + 1):
+        if all(lines[i + j].rstrip() == wanted[j] for j in range(len(wanted))):
+            matches.append(i)
+    if len(matches) != 1:
+        return None
+    start = sum(len(line) for line in lines[:matches[0]])
+    end = start + sum(len(line) for line in lines[matches[0]:matches[0] + len(wanted)])
+    return start, end
+
+
+def replace_once(content, search, replace, hunk=1):
+    if not search:
+        raise EditError(f"Hunk {hunk}: 'search' must not be empty")
+    count = content.count(search)
+    if count == 1:
+        start = content.index(search)
+        return content[:start] + replace + content[start + len(search):], content.count("\n", 0, start) + 1
+    if count > 1:
+        raise EditError(f"Hunk {hunk}: search text found {count} times, add more context to make it unique")
+    loose = _find_loose(content, search)
+    if loose is None:
+        raise EditError(f"Hunk {hunk}: search text not found")
+    start, end = loose
+    if content[start:end].endswith("\n") and not replace.endswith("\n"):
+        replace += "\n"
+    return content[:start] + replace + content[end:], content.count("\n", 0, start) + 1
+
+
+def prepare_edits(path, edits):
+    """Applies hunks in memory and validates the result, returns ``(original, content, changed_lines)``."""
+    if not os.path.isfile(path):
+        raise EditError(f"File not found: {path}")
+    if not edits:
+        raise EditError("No edits given")
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        original = f.read()
+    content, changed_lines = original, []
+    for number, edit in enumerate(edits, start=1):
+        content, line = replace_once(content, edit.get("search", ""), edit.get("replace", ""), number)
+        changed_lines.append(line)
+    validate(path, content)
+    return original, content, changed_lines
+
+
+def _summary(path, edits, original, content, changed_lines):
+    delta = len(content.splitlines()) - len(original.splitlines())
+    return (f"Applied {len(edits)} edit(s) to {path} at line(s) {', '.join(map(str, changed_lines))} "
+            f"({delta:+d} lines)")
+
+
+def apply_edits(path, edits):
+    """Applies search/replace hunks ``[{"search": ..., "replace": ...}]`` to a file, all or nothing."""
+    original, content, changed_lines = prepare_edits(path, edits)
+    write_atomic(path, content)
+    return _summary(path, edits, original, content, changed_lines)
+
+
+def apply_edits_many(files):
+    """Applies hunks to several files ``[{"path": ..., "edits": [...]}]``, all files or none.
+
+    Every file is edited and validated in memory first; if writing one of them fails,
+    the files already written are restored.
+    """
+    if not files:
+        raise EditError("No files given")
+    paths = [f.get("path") for f in files]
+    if len(set(paths)) != len(paths):
+        raise EditError("Every file may only appear once, put all hunks of a file into one entry")
+    with ThreadPoolExecutor(max_workers=min(8, len(files))) as pool:
+        futures = [pool.submit(prepare_edits, f.get("path") or "", f.get("edits")) for f in files]
+    prepared, errors = [], []
+    for f, future in zip(files, futures):
+        try:
+            prepared.append(future.result())
+        except EditError as e:
+            errors.append(f"{f.get('path')}: {e}")
+    if errors:
+        raise EditError("; ".join(errors))
+    written = []
+    try:
+        for path, (original, content, _) in zip(paths, prepared):
+            write_atomic(path, content)
+            written.append((path, original))
+    except OSError:
+        for path, original in written:
+            write_atomic(path, original)
+        raise
+    return "\n".join(_summary(path, f.get("edits"), *p) for path, f, p in zip(paths, files, prepared))
+
+
+def _recount(repo_dir, patch):
+    """``["--recount"]`` if the hunk line counts are wrong, as in hand-written patches, else no option.
+
+    Without ``diff --git`` headers a recount takes the ``---`` line of the next file for a removed line,
+    so correct patches are applied as they are.
+    """
+    result = subprocess.run(["git", "apply", "--check", "-"], cwd=repo_dir, input=patch, capture_output=True,
+                            text=True)
+    return [] if result.returncode == 0 else ["--recount"]
+
+
+def _patched_files(repo_dir, patch, recount):
+    result = subprocess.run(["git", "apply", *recount, "--numstat", "-"], cwd=repo_dir, input=patch,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise EditError(f"Invalid patch: {result.stderr.strip()}")
+    stats = []
+    for line in result.stdout.splitlines():
+        added, removed, name = line.split("\t", 2)
+        stats.append((name, added, removed))
+    return stats
+
+
+def apply_patch(repo_dir, patch):
+    """Applies a unified diff inside ``repo_dir`` with ``git apply``, all files or none."""
+    if not patch.endswith("\n"):
+        patch += "\n"
+    recount = _recount(repo_dir, patch)
+    stats = _patched_files(repo_dir, patch, recount)
+    for args in (["--check"], []):
+        result = subprocess.run(["git", "apply", *recount, "--whitespace=nowarn", *args, "-"], cwd=repo_dir,
+                                input=patch, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise EditError(f"Patch does not apply: {result.stderr.strip()}")
+    try:
+        for name, _, _ in stats:
+            path = os.path.join(repo_dir, name)
+            if os.path.isfile(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    validate(name, f.read())
+    except (EditError, UnicodeDecodeError, OSError) as e:
+        subprocess.run(["git", "apply", *recount, "-R", "-"], cwd=repo_dir, input=patch,
+                       capture_output=True, text=True)
+        if isinstance(e, EditError):
+            raise
+        raise EditError(f"Cannot check {name}: {e}") from e
+    for name, _, _ in stats:
+        invalidate(os.path.join(repo_dir, name))
+        notify_changed(os.path.join(repo_dir, name))
+    return "Patch applied: " + ", ".join(f"{name} (+{added} -{removed})" for name, added, removed in stats)
@@ -0,0 +1,230 @@
+"""File access helpers behind the agent tools of both frameworks.
+
+Reads are ranged and capped: a read returns at most ``MAX_READ_CHARS``
+characters and ends with a continuation cursor (``line:<n>`` or ``byte:<n>``)
+that can be passed back to read the next slice. ``outline`` lists classes and
+functions with their line spans so agents can read only the part they need.
+``read_many`` reads several files or ranges in one tool call. File contents
+are cached in memory and checked against mtime and size on every read.
+"""
+import ast
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_READ_CHARS = int(os.environ.get("MAX_READ_CHARS", "20000"))
+FILE_CACHE_BYTES = int(os.environ.get("FILE_CACHE_MB", "256")) * 1024 * 1024
+
+# Definitions in languages other than Python, good enough for an outline
+_DEFINITION_RE = re.compile(
+    r"^\s*(?:export\s+)?(?:public\s+|private\s+|protected\s+|static\s+|async\s+)*"
+    r"(class|def|function|func|fn|interface|struct|enum)\s+([A-Za-z_$][\w$]*)"
+)
+_PYTHON_DEFINITION_RE = re.compile(r"^([ \t]*)(?:async[ \t]+)?(def|class)[ \t]+([A-Za-z_]\w*)", re.MULTILINE)
+
+
+class FileCache:
+    """Contents of recently read files, LRU up to ``max_bytes``; a changed mtime or size means a new read."""
+
+    def __init__(self, max_bytes=FILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # path -> ((mtime_ns, size), data)
+        self._lock = threading.Lock()
+
+    def read(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(path)
+                return entry[1]
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) <= self.max_bytes // 8:
+            with self._lock:
+                old = self._entries.pop(path, None)
+                self.size += len(data) - (len(old[1]) if old else 0)
+                self._entries[path] = (key, data)
+                while self.size > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.size -= len(evicted)
+        return data
+
+    def invalidate(self, path):
+        with self._lock:
+            old = self._entries.pop(os.path.abspath(path), None)
+            if old:
+                self.size -= len(old[1])
+
+
+_file_cache = FileCache()
+
+
+def invalidate(path):
+    """Drops ``path`` from the cache after a write; an edit of the same size within the mtime granularity
+    would otherwise not be noticed."""
+    _file_cache.invalidate(path)
+
+
+def read_text(path):
+    """The text of ``path`` through the cache, with universal newlines like ``open(path, "r")``."""
+    data = _file_cache.read(path).decode("utf-8", errors="replace")
+    return data.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def parse_cursor(cursor):
+    """Returns ``(kind, offset)`` for a cursor like ``line:120`` or ``byte:4096``."""
+    kind, _, offset = (cursor or "").partition(":")
+    if kind not in ("line", "byte") or not offset.isdigit():
+        raise ValueError(f"Invalid cursor: {cursor!r} (expected 'line:<n>' or 'byte:<n>')")
+    return kind, int(offset)
+
+
+def read_lines(path, start_line=None, end_line=None, max_chars=MAX_READ_CHARS):
+    """Reads lines ``start_line..end_line`` (1-based, inclusive), capped at ``max_chars``."""
+    start_line = max(1, start_line or 1)
+    chunks, size, total, next_line = [], 0, 0, None
+    for number, line in enumerate(io.StringIO(read_text(path)), start=1):
+        total = number
+        if number < start_line or (end_line and number > end_line) or next_line:
+            continue
+        if size + len(line) > max_chars:
+            if chunks:
+                next_line = number
+                continue
+            # A single line longer than the cap (minified code, data files)
+            line = line[:max_chars] + " [line cut, use a byte range for the rest]\n"
+        chunks.append(line)
+        size += len(line)
+    last = start_line + len(chunks) - 1
+    header = f"[{path}: lines {start_line}-{last} of {total}]\n" if chunks else f"[{path}: no lines in range, file has {total} lines]\n"
+    text = header + "".join(chunks)
+    if next_line:
+        text += f"\n[truncated at {max_chars} characters, continue with cursor='line:{next_line}']"
+    return text
+
+
+def read_bytes(path, start_byte=None, end_byte=None, max_chars=MAX_READ_CHARS):
+    """Reads the byte range ``[start_byte, end_byte)``, capped at ``max_chars`` bytes."""
+    start_byte = max(0, start_byte or 0)
+    content = _file_cache.read(path)
+    total = len(content)
+    end = min(total, end_byte if end_byte is not None else total)
+    stop = min(end, start_byte + max_chars)
+    data = content[start_byte:max(start_byte, stop)]
+    text = f"[{path}: bytes {start_byte}-{stop} of {total}]\n" + data.decode("utf-8", errors="replace")
+    if stop < end:
+        text += f"\n[truncated at {max_chars} bytes, continue with cursor='byte:{stop}']"
+    return text
+
+
+def read_range(path, start_line=None, end_line=None, start_byte=None, end_byte=None, cursor=None,
+               max_chars=MAX_READ_CHARS):
+    """Entry point of the read tools: line range, byte range or continuation cursor."""
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    if cursor:
+        kind, offset = parse_cursor(cursor)
+        if kind == "byte":
+            return read_bytes(path, offset, end_byte, max_chars)
+        return read_lines(path, offset, end_line, max_chars)
+    if start_byte is not None or end_byte is not None:
+        return read_bytes(path, start_byte, end_byte, max_chars)
+    return read_lines(path, start_line, end_line, max_chars)
+
+
+def read_many(requests, max_chars=MAX_READ_CHARS * 2):
+    """Reads several files or ranges concurrently and returns one combined text.
+
+    ``requests`` are paths or dicts with ``path`` and the arguments of ``read_range``.
+    The character budget is split evenly, every part keeps its own continuation cursor.
+    """
+    requests = [{"path": r} if isinstance(r, str) else dict(r) for r in requests]
+    if not requests:
+        raise ValueError("No files given")
+    budget = max(2000, max_chars // len(requests))
+
+    def read_one(request):
+        path = request.get("path")
+        try:
+            return read_range(path, request.get("start_line"), request.get("end_line"), request.get("start_byte"),
+                              request.get("end_byte"), request.get("cursor"), budget)
+        except FileNotFoundError:
+            return f"[{path}: file not found]"
+        except (OSError, ValueError) as e:
+            return f"[{path}: {e}]"
+
+    with ThreadPoolExecutor(max_workers=min(8, len(requests))) as pool:
+        return "\n\n".join(pool.map(read_one, requests))
+
+
+def _python_outline(source):
+    tree = ast.parse(source)
+    entries = []
+
+    def visit(node, depth):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                kind = "class" if isinstance(child, ast.ClassDef) else "def"
+                entries.append((depth, kind, child.name, child.lineno, child.end_lineno))
+                visit(child, depth + 1)
+    visit(tree, 0)
+    return entries
+
+
+def _generic_outline(source):
+    entries = []
+    for number, line in enumerate(source.splitlines(), start=1):
+        match = _DEFINITION_RE.match(line)
+        if match:
+            depth = (len(line) - len(line.lstrip())) // 4
+            entries.append((depth, match.group(1), match.group(2), number, None))
+    return entries
+
+
+def _python_outline_fast(source):
+    """Indentation based variant of ``_python_outline``, much faster but without end lines."""
+    entries, stack = [], []
+    position, line = 0, 1
+    for match in _PYTHON_DEFINITION_RE.finditer(source):
+        indent = len(match.group(1).expandtabs())
+        while stack and stack[-1] >= indent:
+            stack.pop()
+        line += source.count("\n", position, match.start())
+        position = match.start()
+        entries.append((len(stack), match.group(2), match.group(3), line, None))
+        stack.append(indent)
+    return entries
+
+
+def list_definitions(path, source, precise=True):
+    """Returns ``(depth, kind, name, start_line, end_line)`` for every class and function in ``source``.
+
+    With ``precise=False`` Python files are scanned with a regex instead of being parsed,
+    which is what the repository index uses to stay fast on large checkouts.
+    """
+    if path.endswith(".py"):
+        if not precise:
+            return _python_outline_fast(source)
+        try:
+            return _python_outline(source)
+        except (SyntaxError, ValueError):
+            pass
+    return _generic_outline(source)
+
+
+def outline(path):
+    """Lists classes and functions of a file with their line numbers."""
+    source = read_text(path)
+    entries = list_definitions(path, source)
+    lines = [f"[{path}: {len(source.splitlines())} lines, {len(entries)} definitions]"]
+    for depth, kind, name, start, end in entries:
+        span = f"{start}-{end}" if end else f"{start}"
+        lines.append(f"{'  ' * depth}{kind} {name}  (lines {span})")
+    return "\n".join(lines)
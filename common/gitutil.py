@@ -0,0 +1,55 @@
+import asyncio
+import os
+import subprocess
+
+
+def git_env():
+    env = os.environ.copy()
+    env["GIT_TERMINAL_PROMPT"] = "0"
+    return env
+
+
+async def git(*args, cwd=None):
+    """Runs a git command without blocking the event loop and returns its stdout.
+
+    Raises subprocess.CalledProcessError if git exits with a non-zero status.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "git", *args,
+        cwd=cwd,
+        env=git_env(),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        # Do not leave a half-finished clone running after a timeout
+        if proc.returncode is None:
+            proc.kill()
+        raise
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, ["git", *args], stdout, stderr)
+    return stdout.decode("utf-8", errors="replace")
+
+
+def stage_files(repo_dir, paths):
+    """Stages exactly ``paths`` (relative to ``repo_dir``, deletions included) with one ``git add``.
+
+    Returns the list of staged paths. Raises ValueError for paths outside the
+    repository or unknown to git and the working tree.
+    """
+    root = os.path.abspath(repo_dir)
+    relative = []
+    for path in paths:
+        full = os.path.abspath(os.path.join(root, path))
+        if not full.startswith(root + os.sep):
+            raise ValueError(f"Not a file inside the repository: {path}")
+        relative.append(os.path.relpath(full, root))
+    if not relative:
+        raise ValueError("No files given")
+    result = subprocess.run(["git", "add", "--all", "--", *relative], cwd=root, env=git_env(),
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ValueError(result.stderr.strip())
+    return relative
@@ -0,0 +1,84 @@
+"""Async HTTP client for the task API (8081) and the SWE-Bench test service (8082).
+
+One pooled ``httpx.AsyncClient`` is shared by every instance of a sweep, so
+connections are kept alive and concurrent instances overlap their I/O instead
+of blocking the event loop like ``requests`` did.
+"""
+import asyncio
+import os
+import random
+
+import httpx
+
+TASK_API_URL = os.environ.get("TASK_API_URL", "http://localhost:8081/task/index/")
+TEST_SERVICE_URL = os.environ.get("TEST_SERVICE_URL", "http://localhost:8082/test")
+
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "30"))  # task API, seconds
+EVAL_TIMEOUT = float(os.environ.get("EVAL_TIMEOUT", "1800"))  # evaluations can take minutes
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", "1.0"))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "32"))
+
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class ServiceClient:
+    def __init__(self, timeout=HTTP_TIMEOUT, eval_timeout=EVAL_TIMEOUT, retries=HTTP_RETRIES,
+                 backoff=HTTP_BACKOFF, max_connections=HTTP_MAX_CONNECTIONS):
+        self.timeout = timeout
+        self.eval_timeout = eval_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+        )
+
+    async def request(self, method, url, timeout=None, **kwargs):
+        """Sends a request, retrying transport errors and 429/5xx with exponential backoff."""
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.request(method, url, timeout=timeout or self.timeout, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    response.raise_for_status()
+                    return response
+                reason = f"status {response.status_code}"
+            except httpx.TransportError as e:
+                if attempt >= self.retries:
+                    raise
+                reason = f"{type(e).__name__}: {e}"
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            attempt += 1
+            print(f"[http] {method} {url} failed ({reason}), retry {attempt}/{self.retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def fetch_testcase(self, index):
+        response = await self.request("GET", f"{TASK_API_URL}{index}")
+        return response.json()
+
+    async def submit_evaluation(self, payload):
+        response = await self.request("POST", TEST_SERVICE_URL, json=payload, timeout=self.eval_timeout)
+        return response.json()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_shared_client = None
+
+
+def shared_client():
+    """Returns the process-wide client, created lazily inside the running event loop."""
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = ServiceClient()
+    return _shared_client
+
+
+async def close_shared_client():
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.aclose()
+        _shared_client = None
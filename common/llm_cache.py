@@ -0,0 +1,242 @@
+"""Content-addressed on-disk cache for LLM requests, with record/replay.
+
+Requests to the OpenAI-compatible proxy are keyed by the SHA-256 of the
+endpoint path and the canonical JSON body (model, parameters, messages,
+tools). The cache sits in the HTTP transport of the clients used by both
+frameworks, so crewai (langchain) and openai-agents share it.
+
+Modes (``LLM_CACHE_MODE``):
+
+- ``off``: every request goes to the proxy.
+- ``readwrite`` (default): cached responses are served, misses go to the proxy and are stored.
+- ``record``: every request goes to the proxy and the response is stored.
+- ``replay``: fully offline, only cached responses are served. Misses return a
+  stub completion that ends the agent's turn (``LLM_REPLAY_MISS=stub``,
+  default) or fail the request (``LLM_REPLAY_MISS=error``).
+
+The cache is evicted least-recently-used once it exceeds ``LLM_CACHE_MAX_MB``::
+
+    python -m common.llm_cache stats
+    python -m common.llm_cache prune --max-mb 500
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import httpx
+
+LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "aes-llm"))
+LLM_CACHE_MODE = os.environ.get("LLM_CACHE_MODE", "readwrite")
+LLM_CACHE_MAX_MB = float(os.environ.get("LLM_CACHE_MAX_MB", "2048"))
+LLM_REPLAY_MISS = os.environ.get("LLM_REPLAY_MISS", "stub")
+
+MODES = ("off", "readwrite", "record", "replay")
+# Fields that do not change the answer of the model
+IGNORED_FIELDS = ("user", "metadata", "store")
+STUB_ANSWER = "Thought: No recorded response for this request.\nFinal Answer: No recorded response available."
+
+
+def request_key(path, body):
+    payload = {k: v for k, v in body.items() if k not in IGNORED_FIELDS}
+    canonical = json.dumps({"path": path, "body": payload}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def stub_response(path, body, text=STUB_ANSWER):
+    """A minimal completion without tool calls, so agent loops finish on a replay miss."""
+    model = body.get("model", "stub")
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    if path.endswith("/responses"):
+        return {"id": "resp_replay_miss", "object": "response", "created_at": int(time.time()), "model": model,
+                "status": "completed", "output": [{"type": "message", "id": "msg_replay_miss", "role": "assistant",
+                                                   "status": "completed",
+                                                   "content": [{"type": "output_text", "text": text,
+                                                                "annotations": []}]}],
+                "usage": {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}}
+    return {"id": "chatcmpl-replay-miss", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": usage}
+
+
+class LLMCache:
+    def __init__(self, directory=LLM_CACHE_DIR, max_mb=LLM_CACHE_MAX_MB):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()  # guards the size and pruning
+        self._stats_lock = threading.Lock()
+        self._size = None
+        self.hits = self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._stats_lock:
+                self.misses += 1
+            return None
+        os.utime(path)  # mtime is the LRU clock
+        with self._stats_lock:
+            self.hits += 1
+        return entry
+
+    def put(self, key, status, body, content_type="application/json"):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"status": status, "content_type": content_type, "body": body, "stored_at": time.time()})
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data)
+            if self._size is None or self._size > self.max_bytes:
+                self._size = self.prune()
+
+    def entries(self):
+        result = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                if name.endswith(".json"):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    result.append((stat.st_mtime, stat.st_size, path))
+        return result
+
+    def prune(self, max_bytes=None):
+        """Deletes least recently used entries until the cache fits, returns the remaining size."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self.entries())
+        size = sum(e[1] for e in entries)
+        for _, entry_size, path in entries:
+            if size <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                size -= entry_size
+            except OSError:
+                pass
+        return size
+
+
+def _parse_body(request):
+    if request.method != "POST":
+        return None
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        return None
+    if not isinstance(body, dict) or body.get("stream"):
+        return None  # streamed responses are passed through
+    return body
+
+
+def _cached_response(request, entry):
+    return httpx.Response(entry["status"], headers={"content-type": entry["content_type"], "x-llm-cache": "hit"},
+                          json=entry["body"], request=request)
+
+
+def _lookup(cache, mode, request):
+    """Returns ``(key, response)``; response is set when the request can be answered without the proxy."""
+    body = _parse_body(request)
+    if mode == "off" or body is None:
+        return None, None
+    key = request_key(request.url.path, body)
+    if mode in ("readwrite", "replay"):
+        entry = cache.get(key)
+        if entry is not None:
+            return key, _cached_response(request, entry)
+    if mode == "replay":
+        if LLM_REPLAY_MISS == "error":
+            return key, httpx.Response(503, json={"error": {"message": f"Replay miss for request {key}"}},
+                                       request=request)
+        print(f"[llm-cache] replay miss {key[:12]}, returning stub answer")
+        return key, httpx.Response(200, headers={"x-llm-cache": "stub"}, json=stub_response(request.url.path, body),
+                                   request=request)
+    return key, None
+
+
+def _store(cache, key, response):
+    if key is None or response.status_code != 200:
+        return
+    try:
+        cache.put(key, response.status_code, response.json(), response.headers.get("content-type", "application/json"))
+    except ValueError:
+        pass
+
+
+class CachingTransport(httpx.BaseTransport):
+    def __init__(self, cache, mode=LLM_CACHE_MODE, transport=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown LLM cache mode: {mode}")
+        self.cache = cache
+        self.mode = mode
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        request.read()
+        key, response = _lookup(self.cache, self.mode, request)
+        if response is not None:
+            return response
+        response = self.transport.handle_request(request)
+        response.read()
+        _store(self.cache, key, response)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncCachingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cache, mode=LLM_CACHE_MODE, transport=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown LLM cache mode: {mode}")
+        self.cache = cache
+        self.mode = mode
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        # the cache reads, writes and prunes files, that must not block the event loop
+        await request.aread()
+        key, response = await asyncio.to_thread(_lookup, self.cache, self.mode, request)
+        if response is not None:
+            return response
+        response = await self.transport.handle_async_request(request)
+        await response.aread()
+        await asyncio.to_thread(_store, self.cache, key, response)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or prune the LLM response cache")
+    parser.add_argument("command", choices=["stats", "prune"])
+    parser.add_argument("--dir", default=LLM_CACHE_DIR)
+    parser.add_argument("--max-mb", type=float, default=LLM_CACHE_MAX_MB)
+    args = parser.parse_args()
+    cache = LLMCache(args.dir, args.max_mb)
+    if args.command == "prune":
+        cache.prune()
+    entries = cache.entries()
+    size = sum(e[1] for e in entries)
+    print(f"{args.dir}: {len(entries)} responses, {size / 1024 / 1024:.1f} MB (limit {args.max_mb:.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""HTTP clients for the OpenAI-compatible LLM proxy used by both frameworks.
+
+crewai (langchain ``ChatOpenAI``) talks to the proxy with a sync and an async
+httpx client, openai-agents with an ``AsyncOpenAI`` client. All of them are
+built here so every LLM request goes through the same transport chain
+(span instrumentation, context compaction and token budget of
+``common/context_budget.py``, model routing of ``common/routing.py``, the response cache of
+``common/llm_cache.py`` and, for requests that are really sent, the rate limits
+and retries of ``common/rate_limit.py``, shared by all clients of the process).
+"""
+import json
+import os
+
+import httpx
+
+from common.context_budget import BUDGET_ANSWER, TokenBudget, compact_request, prompt_tokens
+from common.llm_cache import AsyncCachingTransport, CachingTransport, LLMCache, LLM_CACHE_MODE, stub_response
+from common.rate_limit import AsyncRateLimitedTransport, RateLimitedTransport, Scheduler
+from common.results import normalize_usage
+from common.routing import Router, current_route, load_policy
+from common.tracing import current_span, record_llm_response, span
+from common.watchdog import ABORT_ANSWER, NUDGE, current_watch
+
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL", "http://188.245.32.59:4000/v1")
+LLM_API_KEY = os.environ.get("LLM_API_KEY", "sk-")
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "600"))
+
+CANCELLED_ANSWER = ("Thought: Another attempt already solved this task.\n"
+                    "Final Answer: Stopped, another attempt already fixed the problem.")
+
+_cache = None
+_budget = TokenBudget()
+_scheduler = Scheduler()
+_policy = load_policy()
+_router = Router(_policy) if _policy else None
+
+
+def llm_cache():
+    global _cache
+    if _cache is None:
+        _cache = LLMCache()
+    return _cache
+
+
+def token_budget():
+    return _budget
+
+
+def llm_scheduler():
+    return _scheduler
+
+
+class TracingTransport(httpx.BaseTransport):
+    """Records every LLM request (one agent turn) as a span with tokens and bytes."""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def handle_request(self, request):
+        with span("llm", "llm") as s:
+            response = self.transport.handle_request(request)
+            response.read()
+            record_llm_response(s, request, response)
+            return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncTracingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        with span("llm", "llm") as s:
+            response = await self.transport.handle_async_request(request)
+            await response.aread()
+            record_llm_response(s, request, response)
+            return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def _compact(request):
+    """Returns ``(request, body, response)``: the compacted request (with the watchdog's nudge), or a final
+    answer if the budget is used up, the attempt was cancelled or the watchdog aborted it."""
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        return request, None, None
+    if not isinstance(body, dict) or not ("messages" in body or "input" in body):
+        return request, None, None
+    current = current_span()
+    instance = current.instance if current else None
+    route = current_route()
+    key, share = _budget_key(instance, route), route.budget_share if route is not None else 1.0
+    if route is not None and route.cancelled:
+        return request, body, httpx.Response(200, headers={"x-llm-stopped": "cancelled"},
+                                             json=stub_response(request.url.path, body, CANCELLED_ANSWER),
+                                             request=request)
+    if _budget.exhausted(key, share):
+        print(f"[llm] token budget of instance {instance} exhausted ({_budget.used(key)} tokens), stopping agent")
+        return request, body, httpx.Response(200, headers={"x-llm-budget": "exhausted"},
+                                             json=stub_response(request.url.path, body, BUDGET_ANSWER), request=request)
+    saved = compact_request(body)
+    if current:
+        current.set(compacted_tokens=saved or None)
+    action = None
+    watching = current_watch()
+    if watching is not None:
+        action = watching.on_request(prompt_tokens(body))
+    if action and action[0] == "abort":
+        return request, body, httpx.Response(200, headers={"x-llm-stopped": "stalled"},
+                                             json=stub_response(request.url.path, body,
+                                                                ABORT_ANSWER.format(reason=action[1])),
+                                             request=request)
+    if action and action[0] == "nudge":
+        _append_user_message(body, NUDGE.format(reason=action[1]))
+    if saved or action:
+        headers = [(k, v) for k, v in request.headers.raw if k.lower() != b"content-length"]
+        request = httpx.Request(request.method, request.url, headers=headers,
+                                content=json.dumps(body).encode("utf-8"), extensions=request.extensions)
+    return request, body, None
+
+
+def _append_user_message(body, text):
+    items = body.get("messages") if isinstance(body.get("messages"), list) else body.get("input")
+    if isinstance(items, list):
+        items.append({"role": "user", "content": text})
+    elif isinstance(body.get("input"), str):
+        body["input"] += "\n\n" + text
+
+
+def _budget_key(instance, route):
+    """Every attempt and speculative attempt of an instance has its own budget."""
+    if route is None or instance is None:
+        return instance
+    return instance, route.attempt, route.branch
+
+
+def _account(body, response):
+    current = current_span()
+    if body is None or current is None:
+        return
+    try:
+        prompt, completion = normalize_usage(response.json().get("usage"))
+    except ValueError:
+        prompt, completion = None, None
+    _budget.add(_budget_key(current.instance, current_route()),
+                (prompt if prompt is not None else prompt_tokens(body)) + (completion or 0))
+
+
+class CompactingTransport(httpx.BaseTransport):
+    """Keeps the prompt of long agent runs flat and stops instances that used up their token budget."""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def handle_request(self, request):
+        request.read()
+        request, body, response = _compact(request)
+        if response is not None:
+            return response
+        response = self.transport.handle_request(request)
+        response.read()
+        _account(body, response)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncCompactingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        request, body, response = _compact(request)
+        if response is not None:
+            return response
+        response = await self.transport.handle_async_request(request)
+        await response.aread()
+        _account(body, response)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def _route(request):
+    """Sends the request to the model the routing policy picks for this agent and turn."""
+    if _router is None:
+        return request
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        return request
+    if not isinstance(body, dict) or "model" not in body:
+        return request
+    context = current_route()
+    watching = current_watch()
+    model, role, reason = _router.route(body, context, stalled=watching is not None and watching.escalated)
+    current = current_span()
+    if current:
+        current.set(requested_model=body["model"], model=model, role=role, route_reason=reason)
+    if context is not None:
+        context.models.add(model)
+    if model == body["model"]:
+        return request
+    body["model"] = model
+    headers = [(k, v) for k, v in request.headers.raw if k.lower() != b"content-length"]
+    return httpx.Request(request.method, request.url, headers=headers,
+                         content=json.dumps(body).encode("utf-8"), extensions=request.extensions)
+
+
+class RoutingTransport(httpx.BaseTransport):
+    def __init__(self, transport):
+        self.transport = transport
+
+    def handle_request(self, request):
+        request.read()
+        return self.transport.handle_request(_route(request))
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRoutingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        return await self.transport.handle_async_request(_route(request))
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def llm_http_client():
+    """Sync httpx client for ``ChatOpenAI(http_client=...)``."""
+    transport = TracingTransport(CompactingTransport(
+        RoutingTransport(CachingTransport(llm_cache(), LLM_CACHE_MODE, RateLimitedTransport(_scheduler)))))
+    return httpx.Client(transport=transport, timeout=LLM_TIMEOUT)
+
+
+def llm_async_http_client():
+    """Async httpx client for ``ChatOpenAI(http_async_client=...)`` and ``AsyncOpenAI(http_client=...)``."""
+    transport = AsyncTracingTransport(AsyncCompactingTransport(
+        AsyncRoutingTransport(AsyncCachingTransport(llm_cache(), LLM_CACHE_MODE,
+                                                    AsyncRateLimitedTransport(_scheduler)))))
+    return httpx.AsyncClient(transport=transport, timeout=LLM_TIMEOUT)
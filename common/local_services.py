@@ -0,0 +1,180 @@
+"""Local stand-ins for the task API (8081) and the SWE-Bench test service (8082).
+
+They allow a full sweep (or a load test of the pipeline) on one machine without
+network access to the real services:
+
+- the task server answers ``GET /task/index/<n>`` from a local SWE-Bench-Lite
+  dataset file (JSON list or JSON lines). Rows can already have the task API's
+  shape (``git_clone``, ``Problem_statement``, ...) or be raw dataset rows
+  (``repo``, ``base_commit``, ``problem_statement``, ...). Those are converted, and
+  ``--repo-base`` points the clone URLs at local mirrors if needed.
+- the mock test service answers ``POST /test`` with a ``harnessOutput`` in the
+  ``tests_status`` shape of the real harness. Latency, the number of parallel
+  evaluations, resolve rate and error rate can be tuned. Results are
+  deterministic per instance id and ``--seed``.
+
+Usage::
+
+    python -m common.local_services --dataset swe-bench-lite.jsonl --eval-latency 20 --eval-jitter 10
+    TASK_API_URL=http://localhost:8081/task/index/ TEST_SERVICE_URL=http://localhost:8082/test python main.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def load_dataset(path):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _json_list(value):
+    return value if isinstance(value, str) else json.dumps(value or [])
+
+
+def to_task(row, repo_base="https://github.com"):
+    """Converts a dataset row into the response format of the task API."""
+    if "git_clone" in row:
+        return row
+    task = dict(row)
+    url = f"{repo_base.rstrip('/')}/{row['repo']}.git"
+    task.update(instance_id=row["instance_id"],
+                Problem_statement=row.get("problem_statement", ""),
+                git_clone=f"git clone {url} . && git checkout {row['base_commit']}",
+                FAIL_TO_PASS=_json_list(row.get("FAIL_TO_PASS")),
+                PASS_TO_PASS=_json_list(row.get("PASS_TO_PASS")))
+    task.pop("problem_statement", None)
+    return task
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class TaskHandler(_Handler):
+    def do_GET(self):
+        match = re.fullmatch(r"/task/index/(-?\d+)/?", self.path)
+        if not match:
+            return self._reply(404, {"error": f"Unknown path {self.path}"})
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        task = self.server.tasks.get(int(match.group(1)))
+        if task is None:
+            return self._reply(404, {"error": f"No task with index {match.group(1)}"})
+        self._reply(200, task)
+
+
+class EvalHandler(_Handler):
+    def do_POST(self):
+        if self.path.rstrip("/") != "/test":
+            return self._reply(404, {"error": f"Unknown path {self.path}"})
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            return self._reply(400, {"error": "Invalid JSON"})
+        server = self.server
+        with server.slots:
+            rng = random.Random(f"{server.seed}:{payload.get('instance_id')}")
+            time.sleep(max(0.0, server.latency + rng.uniform(-server.jitter, server.jitter)))
+            # The error draw uses its own generator so retries can succeed
+            if server.error_rate and random.random() < server.error_rate:
+                return self._reply(503, {"error": "Injected evaluation failure"})
+            self._reply(200, {"harnessOutput": json.dumps(mock_harness_output(payload, rng, server.resolve_rate))})
+
+
+def mock_harness_output(payload, rng, resolve_rate):
+    """Builds the harness result for ``payload``: resolved instances pass every test, the rest fail one F2P test."""
+    fail, keep = list(payload.get("FAIL_TO_PASS", [])), list(payload.get("PASS_TO_PASS", []))
+    resolved = rng.random() < resolve_rate
+    failed = set() if resolved or not fail else {rng.choice(fail)}
+    status = {
+        "FAIL_TO_PASS": {"success": [t for t in fail if t not in failed], "failure": sorted(failed)},
+        "PASS_TO_PASS": {"success": keep, "failure": []},
+        "FAIL_TO_FAIL": {"success": [], "failure": []},
+        "PASS_TO_FAIL": {"success": [], "failure": []},
+    }
+    return {payload.get("instance_id", "unknown"): {"patch_is_None": False, "patch_exists": True,
+                                                    "patch_successfully_applied": True, "resolved": resolved,
+                                                    "tests_status": status}}
+
+
+def task_server(dataset, host="127.0.0.1", port=8081, index_base=1, repo_base="https://github.com", latency=0.0,
+                verbose=False):
+    server = ThreadingHTTPServer((host, port), TaskHandler)
+    server.tasks = {index_base + i: to_task(row, repo_base) for i, row in enumerate(load_dataset(dataset))}
+    server.latency = latency
+    server.verbose = verbose
+    return server
+
+
+def eval_server(host="127.0.0.1", port=8082, latency=1.0, jitter=0.0, slots=4, resolve_rate=0.5, error_rate=0.0,
+                seed=0, verbose=False):
+    server = ThreadingHTTPServer((host, port), EvalHandler)
+    server.latency, server.jitter = latency, jitter
+    server.slots = threading.BoundedSemaphore(max(1, slots))
+    server.resolve_rate, server.error_rate, server.seed = resolve_rate, error_rate, seed
+    server.verbose = verbose
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local stand-ins for the task API and the SWE-Bench test service")
+    parser.add_argument("--dataset", help="SWE-Bench-Lite instances as JSON list or JSON lines (task server)")
+    parser.add_argument("--only", choices=["tasks", "eval"], help="start only one of the two services")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--task-port", type=int, default=8081)
+    parser.add_argument("--eval-port", type=int, default=8082)
+    parser.add_argument("--index-base", type=int, default=1, help="task index of the first row of the dataset")
+    parser.add_argument("--repo-base", default="https://github.com",
+                        help="base URL for clone URLs of raw dataset rows, e.g. a directory with local mirrors")
+    parser.add_argument("--task-latency", type=float, default=0.0, help="seconds per task request")
+    parser.add_argument("--eval-latency", type=float, default=1.0, help="mean seconds per evaluation")
+    parser.add_argument("--eval-jitter", type=float, default=0.0, help="uniform +- jitter of the evaluation latency")
+    parser.add_argument("--eval-slots", type=int, default=4, help="evaluations running at the same time")
+    parser.add_argument("--resolve-rate", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of evaluations answered with 503")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    servers = []
+    if args.only != "eval":
+        if not args.dataset:
+            parser.error("--dataset is required for the task server")
+        servers.append(task_server(args.dataset, args.host, args.task_port, args.index_base, args.repo_base,
+                                   args.task_latency, args.verbose))
+        print(f"Task server with {len(servers[-1].tasks)} instances on http://{args.host}:{args.task_port}/task/index/")
+    if args.only != "tasks":
+        servers.append(eval_server(args.host, args.eval_port, args.eval_latency, args.eval_jitter, args.eval_slots,
+                                   args.resolve_rate, args.error_rate, args.seed, args.verbose))
+        print(f"Mock test service on http://{args.host}:{args.eval_port}/test")
+    threads = [threading.Thread(target=s.serve_forever, daemon=True) for s in servers]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Fault localization from the issue text, without an LLM.
+
+Right after the checkout, files and functions of the repository are ranked by
+their relevance to the problem statement, and the top candidates with line
+spans go into the planner's prompt, so the agents start reading in the right
+place instead of exploring the tree. The ranking combines:
+
+- BM25 over the identifiers of the repository (``common/repo_index.py``) with
+  the identifiers, words and code spans of the issue as query,
+- paths and dotted module names mentioned in the issue,
+- frames of tracebacks in the issue (file, line and function),
+- classes and functions defined in a file whose names appear in the issue.
+
+Test files are ranked down, the fix is rarely in them.
+"""
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from common.file_ops import list_definitions
+from common.repo_index import TOKEN_RE, get_index
+
+LOCALIZE_TOP_K = int(os.environ.get("LOCALIZE_TOP_K", "5"))
+
+SPANS_PER_FILE = 3
+STOP_WORDS = set("""
+a an and are as at be been but by can could do does for from has have how i if in into is it its may
+me my no not of on or our should so some such that the their then there these this to use used using
+was we were what when where which while will with would you your also only other than them they one
+self cls none true false return def class import none get set value values error issue bug problem
+""".split())
+
+_TRACE_RE = re.compile(r'File "([^"]+)", line (\d+), in ([\w<>]+)')
+_PATH_RE = re.compile(r"[\w./\\-]+\.(?:py|pyx|js|ts|cfg|toml|rst|txt|html)\b")
+_DOTTED_RE = re.compile(r"\b[A-Za-z_]\w*(?:\.[A-Za-z_]\w*){1,}\b")
+_CODE_RE = re.compile(r"`([^`\n]+)`|\b([A-Za-z_]\w*)\(|\b([a-z]+_[a-z_]+|[A-Z][a-z]+[A-Z]\w*)\b")
+
+
+@dataclass
+class Candidate:
+    path: str
+    score: float
+    reasons: list = field(default_factory=list)
+    spans: list = field(default_factory=list)  # (qualname, start line, end line)
+
+
+def _query(issue):
+    """Query terms of the issue with weights; identifiers that look like code count twice."""
+    terms = Counter(t for t in TOKEN_RE.findall(issue.lower()) if len(t) > 2 and t not in STOP_WORDS)
+    code = set()
+    for match in _CODE_RE.finditer(issue):
+        code.update(t.lower() for t in TOKEN_RE.findall(next(g for g in match.groups() if g)))
+    return {t: min(n, 3) * (2.0 if t in code else 1.0) for t, n in terms.items()}
+
+
+def _mentioned_paths(issue, paths):
+    """Repository paths that the issue names as a file, traceback frame or dotted module."""
+    found = {}
+    mentions = [m.replace("\\", "/").lstrip("./") for m in _PATH_RE.findall(issue)]
+    frames = [(f.replace("\\", "/"), int(line), name) for f, line, name in _TRACE_RE.findall(issue)]
+    modules = [m.replace(".", "/") for m in _DOTTED_RE.findall(issue)]
+    for path in paths:
+        reasons = []
+        if any(m and (path.endswith("/" + m) or path == m or m.endswith("/" + path)) for m in mentions):
+            reasons.append("named in the issue")
+        if any(f.endswith("/" + path) or f == path for f, _, _ in frames):
+            reasons.append("in the traceback")
+        stem = path[:-3] if path.endswith(".py") else None
+        if stem and any(m == stem or m.startswith(stem + "/") or stem.endswith("/__init__") and m == stem[:-9]
+                        for m in modules):
+            reasons.append("module named in the issue")
+        if reasons:
+            found[path] = reasons
+    return found, frames
+
+
+def _spans(path, text, query, idf, issue_names, frames):
+    """The functions and classes of a file that match the issue best, with their line spans."""
+    lines = text.splitlines()
+    ranked = []
+    frame_names = {name for f, _, name in frames if f.endswith("/" + path) or f == path}
+    for depth, kind, name, start, end in list_definitions(path, text):
+        end = end or start
+        body = "\n".join(lines[start - 1:end]).lower()
+        counts = Counter(TOKEN_RE.findall(body))
+        score = sum(idf.get(t, 0) * query[t] * math.log(1 + counts[t]) for t in query if counts.get(t))
+        score /= math.log(2 + end - start)  # do not favor whole classes over the method inside
+        if name.lower() in issue_names:
+            score += 2 if kind == "class" else 5  # a named method says more than its class
+        if name in frame_names:
+            score += 10
+        if score > 0:
+            ranked.append((score, depth, name, start, end))
+    ranked.sort(key=lambda r: (-r[0], -r[1]))
+    return [(name, start, end) for _, _, name, start, end in ranked[:SPANS_PER_FILE]]
+
+
+def localize(repo_dir, issue, k=LOCALIZE_TOP_K):
+    """Returns the ``k`` files most likely to need a change for ``issue``, best first."""
+    index = get_index(repo_dir)
+    index.refresh(force=True)
+    query = _query(issue)
+    mentioned, frames = _mentioned_paths(issue, index.live_paths())
+    scores, idf = index.bm25(query)
+    top = max(scores.values(), default=0.0) or 1.0
+    issue_names = {t.lower() for t in TOKEN_RE.findall(issue)}
+    candidates = {}
+    for path, score in scores.items():
+        candidates[path] = Candidate(path, score / top, ["matches the issue text"] if score else [])
+    for path, reasons in mentioned.items():
+        candidate = candidates.setdefault(path, Candidate(path, 0.0))
+        candidate.score += 1.0 + 0.5 * (len(reasons) - 1)
+        candidate.reasons = reasons + candidate.reasons
+    for name, files in index.defined_in(issue_names).items():
+        for path in files:
+            candidate = candidates.get(path)
+            if candidate is not None:
+                candidate.score += 0.3
+                candidate.reasons.append(f"defines {name}")
+    for candidate in candidates.values():
+        if "test" in candidate.path.lower():
+            candidate.score *= 0.5
+    ranked = sorted(candidates.values(), key=lambda c: (-c.score, c.path))[:k]
+    for candidate in ranked:
+        text = index.read_text(candidate.path)
+        if text is not None:
+            candidate.spans = _spans(candidate.path, text, query, idf, issue_names, frames)
+    return [c for c in ranked if c.score > 0]
+
+
+def format_candidates(candidates, prefix=""):
+    if not candidates:
+        return ""
+    lines = ["Candidate locations from a local search over the issue text (a starting point, verify them):"]
+    for number, candidate in enumerate(candidates, start=1):
+        reasons = list(dict.fromkeys(candidate.reasons))
+        defines = [r for r in reasons if r.startswith("defines ")]
+        reasons = ", ".join([r for r in reasons if not r.startswith("defines ")] + defines[:3])
+        lines.append(f"{number}. {os.path.join(prefix, candidate.path)}" + (f" ({reasons})" if reasons else ""))
+        for name, start, end in candidate.spans:
+            lines.append(f"   - {name}: lines {start}-{end}")
+    return "\n".join(lines)
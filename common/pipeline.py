@@ -0,0 +1,306 @@
+"""Staged sweep pipeline: fetch -> checkout -> agent -> evaluate -> log.
+
+Every stage has its own workers and stages are connected by bounded queues.
+While the agent workers are busy with instance N, the fetch and checkout
+workers already prepare N+1..N+prefetch, and finished instances are evaluated
+by separate workers, so the expensive LLM stage never waits on git or HTTP.
+A single log worker records the results in the results store. With
+``processes`` > 0 the agent stage runs in worker processes
+(``common/worker_pool.py``). With
+``attempts`` > 1, an instance the test service did not resolve gets a fresh
+checkout and goes back to the agents, which the model router
+(``common/routing.py``) answers with the stronger model. With
+``REPOS_QUOTA_GB`` old checkouts are removed once ``repos`` grows beyond it.
+"""
+import asyncio
+import functools
+import json
+import os
+import time
+from dataclasses import dataclass, field
+
+from common.http_client import shared_client
+from common.llm_client import token_budget
+from common.localize import localize
+from common.repo_cache import REPOS_QUOTA_GB, parse_git_clone, shared_repo_cache
+from common.repo_index import drop_index, get_index
+from common.results import ResultsStore, is_resolved, new_run_id, record_instance
+from common.routing import route_context
+from common.runner import DEFAULT_ATTEMPTS, DEFAULT_CONCURRENCY, DEFAULT_TIMEOUT, InstanceOutcome, print_summary
+from common.speculative import SWEEP_SPECULATE, speculative
+from common.tracing import span, tracer
+from common.watchdog import StalledError, watch
+from common.worker_pool import SWEEP_PROCESSES, WorkerPool
+from common.workspace import resolve
+
+
+@dataclass
+class Instance:
+    index: int
+    repo_dir: str
+    testcase: dict = None
+    issue: str = ""
+    instance_id: str = ""
+    fail_tests: list = field(default_factory=list)
+    pass_tests: list = field(default_factory=list)
+    candidates: list = field(default_factory=list)  # ranked ``common.localize.Candidate`` for the prompt
+    agent_output: object = None
+    model: str = ""
+    usage: object = None  # token usage reported by the agent framework
+    tests_status: dict = None
+    status: str = "pending"  # ok | error | timeout | stalled, retry for attempts followed by another one
+    error: str = ""
+    timings: dict = field(default_factory=dict)
+    attempt: int = 1
+    previous_failure: bool = False  # unresolved in an earlier run of the framework
+
+
+def parse_harness_output(evaluation):
+    """Returns the ``tests_status`` dict of the SWE-Bench test service response."""
+    result_json = json.loads(evaluation.get("harnessOutput", "{}"))
+    if not result_json:
+        raise ValueError("No data in harnessOutput – possible evaluation error or empty result")
+    instance_id = next(iter(result_json))
+    return result_json[instance_id]["tests_status"]
+
+
+async def fetch_stage(instance):
+    print(f"Fetching test case {instance.index}...")
+    testcase = await shared_client().fetch_testcase(instance.index)
+    instance.testcase = testcase
+    instance.issue = testcase["Problem_statement"]
+    instance.instance_id = testcase["instance_id"]
+    instance.fail_tests = json.loads(testcase.get("FAIL_TO_PASS", "[]"))
+    instance.pass_tests = json.loads(testcase.get("PASS_TO_PASS", "[]"))
+
+
+def prepare_workspace(instance):
+    """Builds the search index and localizes the issue, in the process that runs the agents."""
+    # Build the search index now so the agents' first lookups are answered from memory
+    with span("index", "stage"):
+        get_index(instance.repo_dir)
+    # Candidate files for the planner, so the agents do not have to explore the tree first
+    try:
+        with span("localize", "stage"):
+            instance.candidates = localize(instance.repo_dir, instance.issue)
+    except Exception as e:
+        print(f"Localization of test case {instance.index} failed: {e}")
+
+
+async def checkout_stage(instance, prepare=True):
+    repo_url, commit_hash = parse_git_clone(instance.testcase["git_clone"])
+    print(f"Provisioning {repo_url} at {commit_hash} into {instance.repo_dir}...")
+    drop_index(instance.repo_dir)
+    await shared_repo_cache().provision(repo_url, commit_hash, instance.repo_dir, reuse=True)
+    if prepare:
+        await asyncio.to_thread(prepare_workspace, instance)
+
+
+async def evaluate_stage(instance):
+    print(f"Calling SWE-Bench REST service with repo: {instance.repo_dir}")
+    test_payload = {
+        "instance_id": instance.instance_id,
+        "repoDir": f"/repos/repo_{instance.index}",  # mount with docker
+        "FAIL_TO_PASS": instance.fail_tests,
+        "PASS_TO_PASS": instance.pass_tests
+    }
+    evaluation = await shared_client().submit_evaluation(test_payload)
+    instance.tests_status = parse_harness_output(evaluation)
+
+
+class Pipeline:
+    def __init__(self, agent_stage, framework, results_db, concurrency=DEFAULT_CONCURRENCY,
+                 timeout=DEFAULT_TIMEOUT, prefetch=2, eval_workers=2, repos_dir="repos", run_id=None,
+                 attempts=DEFAULT_ATTEMPTS, speculate=SWEEP_SPECULATE, processes=SWEEP_PROCESSES):
+        """
+        Args:
+            agent_stage: coroutine ``agent_stage(instance)`` that runs the agents on a prepared checkout.
+            framework: name of the frontend stored with every result.
+            results_db: path of the results store.
+            concurrency: number of agent workers.
+            timeout: limit for the agent stage of a single instance in seconds.
+            prefetch: how many instances are fetched and checked out ahead of the agents.
+            eval_workers: number of workers submitting evaluations.
+            run_id: id of the run. An existing run (or 'latest') is resumed: its finished
+                instances are skipped and only unfinished or failed ones are run again.
+            attempts: agent attempts per instance; an unresolved instance is reset and retried.
+            speculate: parallel agent runs per attempt in worktrees of the checkout, the best one is kept.
+            processes: run the agent stage in this many worker processes, 0 runs it in this process.
+        """
+        self.framework = framework
+        self.store = ResultsStore(results_db)
+        if run_id == "latest":
+            run_id = self.store.latest_run(framework)
+            if run_id is None:
+                raise ValueError(f"No run of {framework} to resume in {results_db}")
+        self.run_id = run_id or new_run_id()
+        self.timeout = timeout
+        self.attempts = max(1, attempts)
+        self.repos_dir = resolve(repos_dir)
+        prefetch = max(1, prefetch)
+        self.pool = None
+        self._active = set()  # checkouts of the instances in the pipeline, never garbage collected
+        self._gc = None
+        checkout, agent = checkout_stage, speculative(agent_stage, speculate)
+        if processes > 0:
+            # index, localization and agents run in the worker processes
+            self.pool = WorkerPool(agent_stage, processes, speculate, timeout, self.run_id)
+            checkout, agent = functools.partial(checkout_stage, prepare=False), self.pool
+        # (name, stage, workers, size of the queue in front of the stage)
+        self.stages = [
+            ("fetch", fetch_stage, prefetch, prefetch),
+            ("checkout", checkout, prefetch, prefetch),
+            ("agent", self._with_timeout(agent), max(1, concurrency), prefetch),
+            # Unbounded, a backlog of evaluations must never block the agent workers
+            ("evaluate", evaluate_stage, max(1, eval_workers), 0),
+        ]
+
+    def _with_timeout(self, agent_stage):
+        async def run(instance):
+            with route_context(instance.index, instance.attempt, instance.previous_failure) as route, \
+                    watch(instance.index, instance.repo_dir) as watching:
+                try:
+                    await asyncio.wait_for(agent_stage(instance), self.timeout)
+                    if watching is not None:
+                        await asyncio.to_thread(watching.check)
+                except asyncio.TimeoutError:
+                    # a crewai run in a thread cannot be cancelled, its next request gets a final answer
+                    route.cancelled = True
+                    instance.status = "timeout"
+                    raise TimeoutError(f"Agent stage timed out after {self.timeout:.0f}s")
+                except asyncio.CancelledError:
+                    route.cancelled = True
+                    raise
+                except StalledError:
+                    instance.status = "stalled"
+                    raise
+                finally:
+                    if route.models:
+                        instance.model = ",".join(sorted(route.models))
+        return run
+
+    async def _worker(self, name, stage, inbox, outbox):
+        while True:
+            instance = await inbox.get()
+            try:
+                if not instance.error:
+                    start = time.monotonic()
+                    try:
+                        with span(name, "stage", instance.index):
+                            await stage(instance)
+                    except Exception as e:
+                        if instance.status == "pending":
+                            instance.status = "error"
+                        instance.error = f"{name}: {e}"
+                        print(f"Error in test case {instance.index} ({name}): {e}")
+                    instance.timings[name] = instance.timings.get(name, 0.0) + time.monotonic() - start
+                await outbox.put(instance)
+            finally:
+                inbox.task_done()
+
+    def _should_retry(self, instance):
+        return (not instance.error and instance.tests_status is not None and instance.attempt < self.attempts
+                and not is_resolved(instance.tests_status))
+
+    async def _retry(self, instance, agents):
+        instance.status = "retry"
+        await asyncio.to_thread(record_instance, self.store, self.run_id, self.framework, instance)
+        _, commit_hash = parse_git_clone(instance.testcase["git_clone"])
+        await shared_repo_cache().reset(instance.repo_dir, commit_hash)
+        drop_index(instance.repo_dir)
+        token_budget().reset(instance.index)
+        instance.attempt += 1
+        instance.status = "pending"
+        instance.agent_output = instance.usage = instance.tests_status = None
+        print(f"Test case {instance.index} not resolved, starting attempt {instance.attempt}")
+        await agents.put(instance)
+
+    def _collect(self):
+        """Removes old checkouts beyond the disk quota in the background, one collection at a time."""
+        if REPOS_QUOTA_GB > 0 and (self._gc is None or self._gc.done()):
+            self._gc = asyncio.create_task(shared_repo_cache().collect(self.repos_dir, keep=set(self._active)))
+            self._gc.add_done_callback(_report_gc_error)
+
+    async def _logger(self, inbox, agents, outcomes, remaining, done):
+        while True:
+            instance = await inbox.get()
+            try:
+                if self._should_retry(instance):
+                    try:
+                        await self._retry(instance, agents)
+                        continue
+                    except Exception as e:
+                        instance.status = "pending"
+                        print(f"Could not reset test case {instance.index} for another attempt: {e}")
+                if not instance.error:
+                    instance.status = "ok"
+                await asyncio.to_thread(record_instance, self.store, self.run_id, self.framework, instance)
+                drop_index(instance.repo_dir)
+                self._active.discard(instance.repo_dir)
+                self._collect()
+                outcomes[instance.index] = InstanceOutcome(
+                    instance.index, instance.status, sum(instance.timings.values()), instance.error, instance)
+                print(f"Test case {instance.index} finished: {instance.status}")
+                remaining[0] -= 1
+                if remaining[0] <= 0:
+                    done.set()
+            finally:
+                inbox.task_done()
+
+    async def run(self, indices):
+        indices = self.store.start_run(self.run_id, self.framework, indices)
+        finished = self.store.finished_indices(self.run_id)
+        if finished:
+            print(f"Resuming run {self.run_id}: skipping {len(finished)} finished instances")
+        indices = [i for i in indices if i not in finished]
+        previous_failures = self.store.unresolved_indices(self.framework, exclude_run=self.run_id)
+        queues = [asyncio.Queue(maxsize=size) for _, _, _, size in self.stages] + [asyncio.Queue()]
+        outcomes = {}
+        remaining, done = [len(indices)], asyncio.Event()
+        groups = []
+        for i, (name, stage, workers, _) in enumerate(self.stages):
+            groups.append([asyncio.create_task(self._worker(name, stage, queues[i], queues[i + 1]))
+                           for _ in range(workers)])
+        groups.append([asyncio.create_task(self._logger(queues[-1], queues[2], outcomes, remaining, done))])
+
+        started = time.monotonic()
+        tracer().run_id = self.run_id
+        print(f"Starting run {self.run_id}, results are stored in {self.store.path}")
+        self._active = {os.path.join(self.repos_dir, f"repo_{index}") for index in indices}
+        self._collect()
+        try:
+            for index in indices:
+                await queues[0].put(Instance(index, os.path.join(self.repos_dir, f"repo_{index}"),
+                                             previous_failure=index in previous_failures))
+            # Retries move instances back to the agents, so wait for the logger instead of the queues
+            if indices:
+                await done.wait()
+        finally:
+            for group in groups:
+                for task in group:
+                    task.cancel()
+            await asyncio.gather(*(t for group in groups for t in group), return_exceptions=True)
+            if self.pool is not None:
+                self.pool.shutdown()
+            if self._gc is not None:
+                await asyncio.gather(self._gc, return_exceptions=True)
+            result = [outcomes.get(i, InstanceOutcome(i, "cancelled")) for i in indices]
+            print_summary(result, time.monotonic() - started)
+            print_stage_times(result)
+        return result
+
+
+def _report_gc_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[gc] collecting old checkouts failed: {task.exception()}")
+
+
+def print_stage_times(outcomes):
+    totals = {}
+    for outcome in outcomes:
+        if outcome.result is None:
+            continue
+        for stage, seconds in outcome.result.timings.items():
+            totals.setdefault(stage, []).append(seconds)
+    for stage, values in totals.items():
+        print(f"  {stage:<9} avg {sum(values) / len(values):7.1f}s  max {max(values):7.1f}s  (n={len(values)})")
@@ -0,0 +1,308 @@
+"""Client-side rate limiting and retries for the shared LLM proxy.
+
+All agents of all concurrent instances share one proxy. Instead of letting
+bursts run into 429s and timeouts that end the whole instance, every request
+that is not answered by the cache passes the ``Scheduler``:
+
+- at most ``LLM_MAX_INFLIGHT`` requests are sent at the same time,
+- token buckets limit requests (``LLM_RPM``) and estimated tokens (``LLM_TPM``)
+  per minute, 0 disables a limit,
+- waiting requests are admitted by priority: retries first, then instances that
+  made the most requests so far (they are closest to finishing),
+- 429, 502-504 and connection errors are retried up to ``LLM_RETRIES`` times
+  with exponential backoff and full jitter (or the proxy's ``Retry-After``);
+  a 429 also pauses the request bucket, so the other requests back off too.
+
+Queue wait, queue depth and retries are recorded on the request's span.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from common.context_budget import prompt_tokens
+from common.tracing import current_span
+
+LLM_RPM = float(os.environ.get("LLM_RPM", "0"))
+LLM_TPM = float(os.environ.get("LLM_TPM", "0"))
+LLM_MAX_INFLIGHT = int(os.environ.get("LLM_MAX_INFLIGHT", "8"))
+LLM_RETRIES = int(os.environ.get("LLM_RETRIES", "5"))
+LLM_RETRY_BASE = float(os.environ.get("LLM_RETRY_BASE", "1"))
+LLM_RETRY_MAX = float(os.environ.get("LLM_RETRY_MAX", "60"))
+
+RETRY_STATUS = {429, 502, 503, 504}
+DEFAULT_COMPLETION_TOKENS = 1000
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units per minute up to a burst of one minute; 0 means unlimited."""
+
+    def __init__(self, per_minute):
+        self.per_second = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.per_second)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Takes ``amount`` units (possibly on credit) and returns the seconds to wait until they are covered."""
+        if not self.per_second:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level -= min(amount, self.capacity)
+            return max(0.0, -self.level / self.per_second)
+
+    def refund(self, amount):
+        """Corrects an estimate after the fact, ``amount`` may be negative."""
+        if self.per_second:
+            with self._lock:
+                self.level = min(self.capacity, self.level + amount)
+
+    def scale(self, factor):
+        with self._lock:
+            self.per_second *= factor
+            self.capacity *= factor
+            self.level = min(self.level, self.capacity)
+
+    def pause(self, seconds):
+        """Empties the bucket so the next requests wait at least ``seconds``."""
+        if self.per_second:
+            with self._lock:
+                self._refill(time.monotonic())
+                self.level = min(self.level, -seconds * self.per_second)
+
+
+class Scheduler:
+    """Admission of LLM requests from threads (crewai) and event loops (openai-agents)."""
+
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, max_inflight=LLM_MAX_INFLIGHT, retries=LLM_RETRIES):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_inflight = max(1, max_inflight)
+        self.retries = retries
+        self._inflight = 0
+        self._waiting = []  # heap of (priority, seq, wake)
+        self._seq = itertools.count()
+        self._turns = {}
+        self._pause_until = 0.0
+        self._lock = threading.Lock()
+
+    def share(self, parts):
+        """Reduces the limits to the share of one of ``parts`` processes using the same proxy."""
+        if parts <= 1:
+            return
+        self.requests.scale(1 / parts)
+        self.tokens.scale(1 / parts)
+        with self._lock:
+            self.max_inflight = max(1, self.max_inflight // parts)
+
+    def priority(self, instance, retry):
+        with self._lock:
+            turns = self._turns.get(instance, 0)
+            if not retry:
+                self._turns[instance] = turns + 1
+        return (0 if retry else 1, -turns)
+
+    def depth(self):
+        with self._lock:
+            return len(self._waiting)
+
+    def _enqueue(self, priority, wake):
+        """Returns True if the request may start right away, otherwise ``wake`` is called once it may."""
+        with self._lock:
+            if self._inflight < self.max_inflight and not self._waiting:
+                self._inflight += 1
+                return True
+            heapq.heappush(self._waiting, (priority, next(self._seq), wake))
+            return False
+
+    def release(self):
+        """Hands the slot of a finished request to the next waiting one."""
+        with self._lock:
+            if not self._waiting:
+                self._inflight -= 1
+                return
+            _, _, wake = heapq.heappop(self._waiting)
+        wake()
+
+    def _delay(self, tokens):
+        delay = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        return max(delay, self._pause_until - time.monotonic())
+
+    def acquire(self, priority, tokens):
+        """Blocks until the request may be sent; returns the seconds waited."""
+        start = time.monotonic()
+        granted = threading.Event()
+        if not self._enqueue(priority, granted.set):
+            granted.wait()
+        time.sleep(self._delay(tokens))
+        return time.monotonic() - start
+
+    async def acquire_async(self, priority, tokens):
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant():
+            if granted.cancelled():
+                self.release()  # the waiting request was cancelled, pass the slot on
+            else:
+                granted.set_result(None)
+        if not self._enqueue(priority, lambda: loop.call_soon_threadsafe(grant)):
+            try:
+                await granted
+            except asyncio.CancelledError:
+                if not granted.cancelled():
+                    self.release()  # cancelled right after the slot was granted
+                raise
+        try:
+            await asyncio.sleep(self._delay(tokens))
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        return time.monotonic() - start
+
+    def throttled(self, seconds):
+        """The proxy answered 429: nobody sends for ``seconds``."""
+        self._pause_until = max(self._pause_until, time.monotonic() + seconds)
+        self.requests.pause(seconds)
+
+    def backoff(self, attempt, response=None):
+        """Seconds to wait before retry ``attempt`` (1-based), honoring ``Retry-After``."""
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), LLM_RETRY_MAX)
+        except ValueError:
+            pass
+        return random.uniform(0, min(LLM_RETRY_MAX, LLM_RETRY_BASE * 2 ** attempt))
+
+
+def _estimate(request):
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        return 0
+    if not isinstance(body, dict):
+        return 0
+    completion = (body.get("max_tokens") or body.get("max_completion_tokens") or body.get("max_output_tokens")
+                  or DEFAULT_COMPLETION_TOKENS)
+    return prompt_tokens(body) + completion
+
+
+def _used_tokens(response):
+    try:
+        usage = response.json().get("usage") or {}
+    except (ValueError, AttributeError):
+        return None
+    total = usage.get("total_tokens")
+    if total is None and usage:
+        total = sum(usage.get(k) or 0 for k in ("prompt_tokens", "completion_tokens", "input_tokens", "output_tokens"))
+    return total
+
+
+def _record(waited, depth, retries):
+    current = current_span()
+    if current:
+        current.set(queue_wait=round(waited, 3), queue_depth=depth, retries=retries or None)
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    def __init__(self, scheduler, transport=None):
+        self.scheduler = scheduler
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        request.read()
+        current = current_span()
+        scheduler, tokens = self.scheduler, _estimate(request)
+        instance = current.instance if current else None
+        waited, depth = 0.0, scheduler.depth()
+        for attempt in range(scheduler.retries + 1):
+            waited += scheduler.acquire(scheduler.priority(instance, attempt > 0), tokens)
+            try:
+                response = self.transport.handle_request(request)
+                response.read()
+            except httpx.TransportError:
+                if attempt == scheduler.retries:
+                    _record(waited, depth, attempt)
+                    raise
+                response = None
+            finally:
+                scheduler.release()
+            if response is not None and response.status_code not in RETRY_STATUS:
+                used = _used_tokens(response)
+                if used is not None:
+                    scheduler.tokens.refund(tokens - used)
+                _record(waited, depth, attempt)
+                return response
+            if attempt == scheduler.retries:
+                break
+            delay = scheduler.backoff(attempt + 1, response)
+            if response is not None and response.status_code == 429:
+                scheduler.throttled(delay)
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+            waited += delay
+        _record(waited, depth, scheduler.retries)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, scheduler, transport=None):
+        self.scheduler = scheduler
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        current = current_span()
+        scheduler, tokens = self.scheduler, _estimate(request)
+        instance = current.instance if current else None
+        waited, depth = 0.0, scheduler.depth()
+        for attempt in range(scheduler.retries + 1):
+            waited += await scheduler.acquire_async(scheduler.priority(instance, attempt > 0), tokens)
+            try:
+                response = await self.transport.handle_async_request(request)
+                await response.aread()
+            except httpx.TransportError:
+                if attempt == scheduler.retries:
+                    _record(waited, depth, attempt)
+                    raise
+                response = None
+            finally:
+                scheduler.release()
+            if response is not None and response.status_code not in RETRY_STATUS:
+                used = _used_tokens(response)
+                if used is not None:
+                    scheduler.tokens.refund(tokens - used)
+                _record(waited, depth, attempt)
+                return response
+            if attempt == scheduler.retries:
+                break
+            delay = scheduler.backoff(attempt + 1, response)
+            if response is not None and response.status_code == 429:
+                scheduler.throttled(delay)
+            if response is not None:
+                await response.aclose()
+            await asyncio.sleep(delay)
+            waited += delay
+        _record(waited, depth, scheduler.retries)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,297 @@
+"""Local bare-mirror cache for the upstream repositories of SWE-Bench-Lite.
+
+Many instances share the same upstream (django, sympy, ...). Instead of a full
+``git clone`` per instance, one bare mirror per URL is kept in the cache and
+every ``repos/repo_{index}`` is provisioned from it at the requested commit:
+
+- ``shared`` (default): ``git clone --shared`` that borrows the mirror's objects
+  through a *relative* alternates entry, so the checkout still works when
+  ``repos/`` is mounted somewhere else (e.g. ``/repos`` in the test container).
+- ``worktree``: ``git worktree add`` on the mirror. Cheapest, but the worktree
+  points to the mirror with an absolute path, so only use it if the test
+  service sees the same paths as the runner.
+
+In ``shared`` mode on a filesystem with reflinks (btrfs, xfs, APFS via GNU cp
+``--reflink``), every commit is checked out only once into a pristine snapshot
+(``snapshots/<repo>/<commit>`` in the cache) and checkouts are copy-on-write
+copies of it: no file data is copied and nothing is written until an agent
+changes a file. Speculative attempts get such copies of the instance's
+checkout as their writable layer. ``REPO_SNAPSHOTS=off`` disables snapshots.
+
+Checkouts and snapshots are never removed by a sweep itself; with
+``REPOS_QUOTA_GB`` the least recently used ones are removed once they take more
+disk space than the quota (blocks shared by copies are counted for each copy).
+The mirrors are kept, so a removed checkout is provisioned again without
+network access.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from common.gitutil import git
+from common.tracing import span
+
+REPO_CACHE_DIR = os.environ.get("REPO_CACHE_DIR", os.path.join("repos", ".cache"))
+REPO_CACHE_MODE = os.environ.get("REPO_CACHE_MODE", "shared")  # shared | worktree
+REPO_SNAPSHOTS = os.environ.get("REPO_SNAPSHOTS", "auto")  # auto | off
+REPOS_QUOTA_GB = float(os.environ.get("REPOS_QUOTA_GB", "0"))  # 0 = never remove checkouts
+
+
+def parse_git_clone(git_clone):
+    """Extracts repo URL and commit from the task's ``git clone <url> && ... git checkout <sha>``."""
+    parts = git_clone.split("&&")
+    clone_part = parts[0].strip()
+    checkout_part = parts[-1].strip() if len(parts) > 1 else None
+
+    repo_url = clone_part.split()[2]
+    commit_hash = checkout_part.split()[-1] if checkout_part else None
+    return repo_url, commit_hash
+
+
+def _mirror_name(repo_url):
+    name = re.sub(r"\.git$", "", repo_url.rstrip("/")).split("/")[-2:]
+    digest = hashlib.sha1(repo_url.encode("utf-8")).hexdigest()[:8]
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", "__".join(name)) + f"-{digest}.git"
+
+
+def _supports_reflinks(directory):
+    """Whether ``cp --reflink=always`` works in ``directory``."""
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=directory, prefix=".reflink-") as tmp:
+        source = os.path.join(tmp, "a")
+        with open(source, "w", encoding="utf-8") as f:
+            f.write("reflink")
+        try:
+            return subprocess.run(["cp", "--reflink=always", source, os.path.join(tmp, "b")],
+                                  capture_output=True).returncode == 0
+        except OSError:
+            return False
+
+
+def _relink_objects(source, target):
+    """Points the relative alternates of the copy ``target`` to the objects ``source`` borrows."""
+    alternates = os.path.join(target, ".git", "objects", "info", "alternates")
+    if not os.path.isfile(alternates):
+        return
+    with open(alternates, "r", encoding="utf-8") as f:
+        entries = [line.strip() for line in f if line.strip()]
+    objects = os.path.join(source, ".git", "objects")
+    absolute = [os.path.normpath(os.path.join(objects, entry)) for entry in entries]
+    with open(alternates, "w", encoding="utf-8") as f:
+        f.writelines(os.path.relpath(path, os.path.join(target, ".git", "objects")) + "\n" for path in absolute)
+
+
+def _last_used(path):
+    stamps = [path, os.path.join(path, ".git"), os.path.join(path, ".git", "index")]
+    return max((os.path.getmtime(p) for p in stamps if os.path.exists(p)), default=0.0)
+
+
+def _disk_usage(path):
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in dirnames + filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_blocks * 512
+            except OSError:
+                pass
+    return total
+
+
+class RepoCache:
+    def __init__(self, cache_dir=REPO_CACHE_DIR, mode=REPO_CACHE_MODE, snapshots=REPO_SNAPSHOTS):
+        if mode not in ("shared", "worktree"):
+            raise ValueError(f"Unknown repo cache mode: {mode}")
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.snapshot_dir = os.path.join(self.cache_dir, "snapshots")
+        self.mode = mode
+        self.snapshots = snapshots
+        self._reflinks = None
+        self._locks = {}
+        self._sizes = {}  # path -> (last used, bytes)
+
+    def reflinks(self):
+        """Whether checkouts are copy-on-write copies of snapshots (probed once per cache)."""
+        if self._reflinks is None:
+            self._reflinks = self.mode == "shared" and self.snapshots != "off" and _supports_reflinks(self.cache_dir)
+        return self._reflinks
+
+    def mirror_path(self, repo_url):
+        return os.path.join(self.cache_dir, _mirror_name(repo_url))
+
+    async def _has_commit(self, mirror, commit):
+        try:
+            await git("cat-file", "-e", f"{commit}^{{commit}}", cwd=mirror)
+            return True
+        except subprocess.CalledProcessError:
+            return False
+
+    async def ensure_mirror(self, repo_url, commit=None):
+        """Creates the bare mirror on first use and fetches only if ``commit`` is missing."""
+        mirror = self.mirror_path(repo_url)
+        lock = self._locks.setdefault(mirror, asyncio.Lock())
+        async with lock:
+            if not os.path.isdir(mirror):
+                print(f"Creating mirror of {repo_url} in {mirror}...")
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp = mirror + ".tmp"
+                if os.path.isdir(tmp):
+                    await asyncio.to_thread(_rmtree, tmp)
+                await git("clone", "--bare", repo_url, tmp)
+                os.replace(tmp, mirror)
+            elif commit and not await self._has_commit(mirror, commit):
+                print(f"Updating mirror {mirror}...")
+                await git("fetch", "--tags", "origin", "+refs/heads/*:refs/heads/*", cwd=mirror)
+            if commit and not await self._has_commit(mirror, commit):
+                # Commits that are no longer on a branch can still be fetched by id
+                await git("fetch", "origin", commit, cwd=mirror)
+        return mirror
+
+    async def provision(self, repo_url, commit, target_dir, reuse=False):
+        """Materializes ``target_dir`` as a checkout of ``repo_url`` at ``commit``.
+
+        With ``reuse`` an existing checkout (e.g. from an interrupted sweep) is reset
+        to ``commit`` and cleaned instead of being provisioned again.
+        """
+        target = os.path.abspath(target_dir)
+        if reuse and os.path.exists(os.path.join(target, ".git")):
+            try:
+                await self.reset(target, commit)
+                print(f"Reusing existing checkout {target_dir}")
+                return target
+            except subprocess.CalledProcessError as e:
+                print(f"Cannot reuse {target_dir} ({e}), provisioning it again")
+                await self.remove(target)
+        if os.path.exists(target):
+            raise FileExistsError(f"Target directory already exists: {target_dir}")
+        if self.reflinks():
+            snapshot = self.snapshot_path(repo_url, commit)
+            async with self._locks.setdefault(snapshot, asyncio.Lock()):
+                if not os.path.isdir(os.path.join(snapshot, ".git")):
+                    await self._create_snapshot(repo_url, commit, snapshot)
+                os.utime(snapshot)
+                await self.layer(snapshot, target)
+            return target
+        with span("clone", "git", repo=repo_url):
+            mirror = await self.ensure_mirror(repo_url, commit)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        revision = commit or "HEAD"
+
+        if self.mode == "worktree":
+            await git("worktree", "prune", cwd=mirror)
+            await git("worktree", "add", "--detach", target, revision, cwd=mirror)
+            return target
+        await self._clone_shared(mirror, repo_url, revision, target)
+        return target
+
+    async def _clone_shared(self, mirror, repo_url, revision, target):
+        await git("clone", "--shared", "--no-checkout", mirror, target)
+        alternates = os.path.join(target, ".git", "objects", "info", "alternates")
+        with open(alternates, "w", encoding="utf-8") as f:
+            f.write(os.path.relpath(os.path.join(mirror, "objects"), os.path.dirname(os.path.dirname(alternates))) + "\n")
+        await git("remote", "set-url", "origin", repo_url, cwd=target)
+        await git("checkout", "--quiet", "--detach", revision, cwd=target)
+
+    def snapshot_path(self, repo_url, commit):
+        return os.path.join(self.snapshot_dir, os.path.basename(self.mirror_path(repo_url))[:-len(".git")],
+                            commit or "HEAD")
+
+    async def _create_snapshot(self, repo_url, commit, path):
+        """Checks out the pristine snapshot ``path``; the caller holds its lock."""
+        with span("clone", "git", repo=repo_url):
+            mirror = await self.ensure_mirror(repo_url, commit)
+        tmp = path + ".tmp"
+        await asyncio.to_thread(_rmtree, tmp)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        await self._clone_shared(mirror, repo_url, commit or "HEAD", tmp)
+        # Copies get new inodes and ctimes, git must not re-read every file because of that
+        await git("config", "core.checkStat", "minimal", cwd=tmp)
+        await git("config", "core.trustctime", "false", cwd=tmp)
+        os.replace(tmp, path)  # a sibling, the relative alternates stay valid
+
+    async def layer(self, source, target):
+        """Writable copy-on-write copy of the checkout ``source`` (needs ``reflinks()``)."""
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        proc = await asyncio.create_subprocess_exec("cp", "-a", "--reflink=always", source, target,
+                                                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+        _, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, ["cp", source, target], None, stderr)
+        _relink_objects(source, target)
+        return target
+
+    async def reset(self, target_dir, commit=None):
+        """Discards every change in the checkout, including staged and untracked files."""
+        await git("reset", "--quiet", "--hard", commit or "HEAD", cwd=target_dir)
+        await git("clean", "-fdxq", cwd=target_dir)
+
+    async def collect(self, repos_dir, quota_gb=REPOS_QUOTA_GB, keep=()):
+        """Removes the least recently used checkouts of ``repos_dir`` and snapshots beyond ``quota_gb``.
+
+        Checkouts in ``keep`` (and their speculative attempts) are skipped, mirrors are never removed.
+        Returns the removed paths.
+        """
+        if quota_gb <= 0:
+            return []
+        repos_dir = os.path.abspath(repos_dir)
+        entries = [os.path.join(repos_dir, name) for name in os.listdir(repos_dir)] if os.path.isdir(repos_dir) else []
+        if os.path.isdir(self.snapshot_dir):
+            for repo in os.listdir(self.snapshot_dir):
+                entries += [os.path.join(self.snapshot_dir, repo, c)
+                            for c in os.listdir(os.path.join(self.snapshot_dir, repo)) if not c.endswith(".tmp")]
+        entries = [p for p in entries if os.path.isdir(p) and not os.path.islink(p)
+                   and p != self.cache_dir and not self.cache_dir.startswith(p + os.sep)]
+        usage = await asyncio.to_thread(self._usage, entries)
+        total, limit, removed = sum(size for _, size in usage.values()), quota_gb * 1024 ** 3, []
+        for path in sorted(entries, key=lambda p: usage[p][0]):
+            if total <= limit:
+                break
+            if any(path == k or path.startswith(k + ".") for k in keep):
+                continue
+            async with self._locks.setdefault(path, asyncio.Lock()):
+                await self.remove(path)
+            self._sizes.pop(path, None)
+            total -= usage[path][1]
+            removed.append(path)
+        if removed:
+            print(f"[gc] removed {len(removed)} checkouts and snapshots, {total / 1024 ** 3:.1f} of {quota_gb:g} GB used")
+        return removed
+
+    def _usage(self, entries):
+        """``{path: (last used, bytes)}``, sizes are only measured again for checkouts used since the last time."""
+        result = {}
+        for path in entries:
+            used = _last_used(path)
+            cached = self._sizes.get(path)
+            if cached is None or cached[0] != used:
+                cached = self._sizes[path] = (used, _disk_usage(path))
+            result[path] = cached
+        return result
+
+    async def remove(self, target_dir):
+        target = os.path.abspath(target_dir)
+        if self.mode == "worktree":
+            for mirror in os.listdir(self.cache_dir) if os.path.isdir(self.cache_dir) else []:
+                try:
+                    await git("worktree", "remove", "--force", target, cwd=os.path.join(self.cache_dir, mirror))
+                    return
+                except subprocess.CalledProcessError:
+                    continue
+        await asyncio.to_thread(_rmtree, target)
+
+
+def _rmtree(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+_shared_cache = None
+
+
+def shared_repo_cache():
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = RepoCache()
+    return _shared_cache
@@ -0,0 +1,338 @@
+"""Per-repository index for file lookup, code search and symbol lookup.
+
+The index is built once per checkout (the pipeline does it right after the
+checkout stage) and kept in memory for the lifetime of the process:
+
+- the list of files (``git ls-files``, tracked and untracked but not ignored),
+- an inverted index from identifier tokens to the files containing them, used
+  to narrow ``grep`` down to a few candidate files before they are scanned,
+- a symbol table with the classes and functions defined in every file,
+- BM25 ranking of files for a weighted set of terms (``common/localize.py``).
+
+Edits made through the tools call ``notify_changed`` so the file is re-indexed
+immediately; other changes are picked up by a cheap mtime check before queries.
+"""
+import fnmatch
+import math
+import os
+import re
+import subprocess
+import threading
+import time
+from array import array
+from collections import Counter
+
+from common.file_ops import list_definitions
+
+MAX_INDEXED_BYTES = 1024 * 1024
+REFRESH_INTERVAL = 2.0  # seconds between mtime checks
+BM25_K1, BM25_B = 1.2, 0.75
+BM25_MAX_FILES = 400  # files read to compute term frequencies
+BM25_MAX_COMMON = 0.25  # terms in a larger fraction of the files carry no signal
+TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def _is_test_path(path):
+    """Whether ``path`` is in a test directory or named like a test module, e.g. not ``contest.py``."""
+    *directories, name = path.replace(os.sep, "/").lower().split("/")
+    return (any(d in ("test", "tests", "testing") for d in directories) or name.startswith("test_")
+            or name.endswith("_test.py") or name in ("tests.py", "conftest.py"))
+
+
+def find_repo_root(path):
+    """Returns the enclosing git checkout of ``path``, or ``path`` itself if there is none."""
+    current = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(current, ".git")):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return os.path.abspath(path)
+        current = parent
+
+
+class RepoIndex:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._lock = threading.RLock()
+        self.paths = []          # file id -> relative path
+        self.ids = {}            # relative path -> file id
+        self.mtimes = {}         # file id -> mtime of the indexed version
+        self.postings = {}       # lowercased token -> array of file ids
+        self.tokens = {}         # file id -> tokens of the indexed version, to update the postings
+        self.symbols = {}        # file id -> [(qualname, kind, line)]
+        self.definitions = {}    # symbol name -> set of file ids
+        self._last_refresh = 0.0
+        self.version = 0         # incremented whenever a file is (re-)indexed
+        self.built = False
+
+    # -- building ---------------------------------------------------------
+
+    def _list_files(self):
+        try:
+            output = subprocess.run(["git", "ls-files", "-co", "--exclude-standard", "-z"], cwd=self.root,
+                                    capture_output=True, check=True).stdout
+            return [p for p in output.decode("utf-8", errors="replace").split("\0") if p]
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            result = []
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                dirnames[:] = [d for d in dirnames if d != ".git"]
+                rel = os.path.relpath(dirpath, self.root)
+                result += [os.path.normpath(os.path.join(rel, f)) for f in filenames]
+            return result
+
+    def _read_text(self, path):
+        full = os.path.join(self.root, path)
+        try:
+            if os.path.getsize(full) > MAX_INDEXED_BYTES:
+                return None
+            with open(full, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if b"\0" in data[:8192]:
+            return None
+        return data.decode("utf-8", errors="replace")
+
+    def _index_file(self, path):
+        file_id = self.ids.get(path)
+        if file_id is None:
+            file_id = len(self.paths)
+            self.paths.append(path)
+            self.ids[path] = file_id
+        self.version += 1
+        self._forget(file_id)
+        try:
+            self.mtimes[file_id] = os.path.getmtime(os.path.join(self.root, path))
+        except OSError:
+            self.mtimes[file_id] = None
+            return
+        text = self._read_text(path)
+        if text is None:
+            return
+        tokens = tuple(set(TOKEN_RE.findall(text.lower())))
+        for token in tokens:
+            self.postings.setdefault(token, array("I")).append(file_id)
+        self.tokens[file_id] = tokens
+        symbols, stack = [], []
+        for depth, kind, name, line, _ in list_definitions(path, text, precise=False):
+            del stack[depth:]
+            stack.append(name)
+            symbols.append((".".join(stack), kind, line))
+            self.definitions.setdefault(name, set()).add(file_id)
+        self.symbols[file_id] = symbols
+
+    def _forget(self, file_id):
+        """Removes the postings and symbols of the previously indexed version of a file."""
+        for token in self.tokens.pop(file_id, ()):
+            ids = self.postings.get(token)
+            if ids is not None and file_id in ids:
+                ids.remove(file_id)
+                if not ids:
+                    del self.postings[token]
+        for qualname, _, _ in self.symbols.pop(file_id, []):
+            self.definitions.get(qualname.rsplit(".", 1)[-1], set()).discard(file_id)
+
+    def build(self):
+        start = time.monotonic()
+        with self._lock:
+            for path in self._list_files():
+                self._index_file(path)
+            self._last_refresh = time.monotonic()
+            self.built = True
+        print(f"Indexed {len(self.paths)} files of {self.root} in {time.monotonic() - start:.2f}s")
+        return self
+
+    def notify_changed(self, path):
+        rel = os.path.relpath(os.path.abspath(path), self.root)
+        with self._lock:
+            self._index_file(rel)
+
+    def refresh(self, force=False):
+        """Re-indexes files whose mtime changed and picks up new files."""
+        if not force and time.monotonic() - self._last_refresh < REFRESH_INTERVAL:
+            return
+        with self._lock:
+            for path in self._list_files():
+                file_id = self.ids.get(path)
+                try:
+                    mtime = os.path.getmtime(os.path.join(self.root, path))
+                except OSError:
+                    continue
+                if file_id is None or self.mtimes.get(file_id) != mtime:
+                    self._index_file(path)
+            self._last_refresh = time.monotonic()
+
+    def _live_paths(self):
+        return [p for i, p in enumerate(self.paths) if self.mtimes.get(i) is not None]
+
+    # -- queries ----------------------------------------------------------
+
+    def glob(self, pattern, limit=50):
+        """Matches ``pattern`` against relative paths, or against file names if it has no slash."""
+        self.refresh()
+        key = (lambda p: os.path.basename(p)) if "/" not in pattern else (lambda p: p)
+        matches = [p for p in self._live_paths() if fnmatch.fnmatch(key(p), pattern)]
+        matches.sort(key=lambda p: (_is_test_path(p), p.count("/"), len(p), p))
+        return matches[:limit], len(matches)
+
+    def _candidates(self, literal):
+        """File ids that can contain ``literal`` (case-insensitive), None if the index cannot narrow it down."""
+        text = literal.lower()
+        result = None
+        for match in TOKEN_RE.finditer(text):
+            fragment = match.group()
+            # A fragment at the edge of the query may be part of a longer identifier in the file
+            at_start = match.start() == 0 or text[match.start() - 1].isdigit()
+            at_end = match.end() == len(text)
+            if at_start and at_end:
+                tokens = [t for t in self.postings if fragment in t]
+            elif at_start:
+                tokens = [t for t in self.postings if t.endswith(fragment)]
+            elif at_end:
+                tokens = [t for t in self.postings if t.startswith(fragment)]
+            else:
+                tokens = [fragment] if fragment in self.postings else []
+            ids = set()
+            for token in tokens:
+                ids.update(self.postings[token])
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return result
+
+    def grep(self, query, regex=False, ignore_case=False, path_glob=None, limit=50, per_file=5):
+        """Searches file contents. Returns ``(hits, total_matches, files_matched)``, hits ranked by file."""
+        self.refresh()
+        flags = re.IGNORECASE if ignore_case else 0
+        pattern = re.compile(query if regex else re.escape(query), flags)
+        with self._lock:
+            candidates = None if regex else self._candidates(query)
+            if candidates is None:
+                paths = self._live_paths()
+            else:
+                paths = [self.paths[i] for i in sorted(candidates) if self.mtimes.get(i) is not None]
+        if path_glob:
+            paths = [p for p in paths if fnmatch.fnmatch(p, path_glob)]
+        per_path, total = [], 0
+        for path in paths:
+            text = self._read_text(path)
+            if text is None:
+                continue
+            lines = [(n, line) for n, line in enumerate(text.splitlines(), start=1) if pattern.search(line)]
+            if lines:
+                total += len(lines)
+                per_path.append((path, lines))
+        per_path.sort(key=lambda item: (_is_test_path(item[0]), -len(item[1]), item[0]))
+        hits = []
+        for path, lines in per_path:
+            for number, line in lines[:per_file]:
+                hits.append((path, number, line.strip()[:200]))
+            if len(hits) >= limit:
+                break
+        return hits[:limit], total, len(per_path)
+
+    def find_definition(self, name, limit=20):
+        """Looks up classes and functions by name or dotted name, e.g. ``QuerySet.filter``."""
+        self.refresh()
+        short = name.rsplit(".", 1)[-1]
+        hits = []
+        with self._lock:
+            for file_id in self.definitions.get(short, ()):
+                for qualname, kind, line in self.symbols.get(file_id, []):
+                    if qualname == name or qualname.endswith("." + name) or ("." not in name and qualname.rsplit(".", 1)[-1] == name):
+                        hits.append((self.paths[file_id], line, kind, qualname))
+        hits.sort(key=lambda h: (_is_test_path(h[0]), h[3].count("."), h[0].count("/"), h[0], h[1]))
+        return hits[:limit]
+
+    def bm25(self, query):
+        """BM25 scores ``{path: score}`` for ``query`` (``{lowercased token: weight}``), and the idf of its terms.
+
+        Only the files with the highest summed weight of matching terms are read to count term frequencies.
+        """
+        self.refresh()
+        with self._lock:
+            live = [p for i, p in enumerate(self.paths) if self.mtimes.get(i) is not None]
+            postings = {t: {self.paths[i] for i in self.postings.get(t, ()) if self.mtimes.get(i) is not None}
+                        for t in query}
+        documents = len(live) or 1
+        idf = {t: math.log(1 + (documents - len(files) + 0.5) / (len(files) + 0.5))
+               for t, files in postings.items() if files and len(files) / documents <= BM25_MAX_COMMON}
+        rough = Counter()
+        for term, weight in idf.items():
+            for path in postings[term]:
+                rough[path] += weight * query[term]
+        counts = {}
+        for path, _ in rough.most_common(BM25_MAX_FILES):
+            text = self._read_text(path)
+            if text is not None:
+                counts[path] = Counter(TOKEN_RE.findall(text.lower()))
+        if not counts:
+            return {}, idf
+        average = sum(sum(c.values()) for c in counts.values()) / len(counts)
+        scores = {}
+        for path, tokens in counts.items():
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * sum(tokens.values()) / average)
+            scores[path] = sum(weight * query[t] * tokens[t] * (BM25_K1 + 1) / (tokens[t] + norm)
+                               for t, weight in idf.items() if tokens.get(t))
+        return scores, idf
+
+    def defined_in(self, names, max_files=5):
+        """``{name: paths}`` for the names defined as a class or function in at most ``max_files`` files."""
+        with self._lock:
+            return {name: [self.paths[i] for i in ids] for name, ids in self.definitions.items()
+                    if name.lower() in names and 0 < len(ids) <= max_files}
+
+    def read_text(self, path):
+        """The text of an indexed file, None for binary or very large files."""
+        return self._read_text(path)
+
+    def live_paths(self):
+        with self._lock:
+            return self._live_paths()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path):
+    """Returns the index of the checkout containing ``path``, building it on first use."""
+    root = find_repo_root(path)
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = RepoIndex(root)
+    # Build outside the global lock so different checkouts are indexed in parallel
+    with index._lock:
+        if not index.built:
+            index.build()
+    return index
+
+
+def drop_index(path):
+    with _indexes_lock:
+        _indexes.pop(find_repo_root(path), None)
+
+
+def notify_changed(path):
+    """Tells the index of an already indexed checkout that ``path`` was written."""
+    root = find_repo_root(os.path.dirname(os.path.abspath(path)))
+    index = _indexes.get(root)
+    if index is not None:
+        index.notify_changed(path)
+
+
+def format_grep(hits, total, files, prefix=""):
+    if not hits:
+        return "No matches"
+    lines = [f"{os.path.join(prefix, path)}:{number}: {text}" for path, number, text in hits]
+    if total > len(hits):
+        lines.append(f"[{len(hits)} of {total} matches in {files} files shown, narrow the query or use path_glob]")
+    return "\n".join(lines)
+
+
+def format_definitions(hits, name, prefix=""):
+    if not hits:
+        return f"No definition of '{name}' found"
+    return "\n".join(f"{os.path.join(prefix, path)}:{line}: {kind} {qualname}" for path, line, kind, qualname in hits)
@@ -0,0 +1,268 @@
+"""Structured results store for SWE-Bench-Lite sweeps.
+
+Every finished instance is stored as one row in a SQLite database. Each record
+is written in a single transaction, so concurrent writers (several pipelines or
+processes sharing one file) never produce partial or interleaved entries, and a
+sweep can be aggregated with SQL instead of scraping ``results.log``.
+
+The ``runs`` table is the manifest of a sweep (which indices it covers). Together
+with the records it is the checkpoint used to resume an interrupted sweep: an
+instance is finished once its latest record has status ``ok``. Queries only look
+at the latest record per instance, so retried instances are not counted twice.
+
+Summary of a results file::
+
+    python -m common.results summary --db crewai/results.db [--run RUN_ID] [--framework crewai]
+    python -m common.results list --db crewai/results.db
+"""
+import argparse
+import json
+import math
+import os
+import sqlite3
+import time
+
+RESULTS_DB = os.environ.get("RESULTS_DB", "results.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    framework TEXT NOT NULL,
+    task_index INTEGER NOT NULL,
+    instance_id TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    fail_to_pass_passed INTEGER,
+    fail_to_pass_total INTEGER,
+    pass_to_pass_passed INTEGER,
+    pass_to_pass_total INTEGER,
+    resolved INTEGER NOT NULL DEFAULT 0,
+    durations TEXT NOT NULL DEFAULT '{}',
+    total_duration REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    model TEXT,
+    finished_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id, task_index);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    framework TEXT NOT NULL,
+    indices TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+COLUMNS = ["run_id", "framework", "task_index", "instance_id", "status", "error",
+           "fail_to_pass_passed", "fail_to_pass_total", "pass_to_pass_passed", "pass_to_pass_total",
+           "resolved", "durations", "total_duration", "prompt_tokens", "completion_tokens", "model",
+           "finished_at"]
+
+
+def new_run_id():
+    return time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+
+
+def normalize_usage(usage):
+    """Returns ``(prompt_tokens, completion_tokens)`` from a dict or usage object of either framework."""
+    if usage is None:
+        return None, None
+    get = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+    prompt = get("prompt_tokens") if get("prompt_tokens") is not None else get("input_tokens")
+    completion = get("completion_tokens") if get("completion_tokens") is not None else get("output_tokens")
+    return prompt, completion
+
+
+class ResultsStore:
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record(self, **fields):
+        """Inserts one record atomically. Unknown keys raise, missing ones are stored as NULL."""
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown result fields: {', '.join(sorted(unknown))}")
+        fields.setdefault("finished_at", time.time())
+        fields["durations"] = json.dumps(fields.get("durations") or {})
+        fields["resolved"] = int(bool(fields.get("resolved")))
+        names = [c for c in COLUMNS if c in fields]
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(f"INSERT INTO results ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                             [fields[n] for n in names])
+        finally:
+            conn.close()
+
+    def start_run(self, run_id, framework, indices):
+        """Registers a new run and returns its indices; for an existing run the stored indices are returned."""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO runs (run_id, framework, indices, created_at) VALUES (?, ?, ?, ?)",
+                             (run_id, framework, json.dumps(list(indices)), time.time()))
+                row = conn.execute("SELECT indices FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row["indices"])
+
+    def finished_indices(self, run_id):
+        return {r["task_index"] for r in self.records(run_id) if r["status"] == "ok"}
+
+    def unresolved_indices(self, framework, exclude_run=None):
+        """Indices whose latest evaluated result of ``framework`` (outside ``exclude_run``) was not resolved."""
+        latest = {}
+        for record in self.records(framework=framework):
+            if record["run_id"] != exclude_run and record["fail_to_pass_total"] is not None:
+                latest[record["task_index"]] = record["resolved"]
+        return {index for index, resolved in latest.items() if not resolved}
+
+    def records(self, run_id=None, framework=None, latest_only=True):
+        query, params = "SELECT * FROM results WHERE 1=1", []
+        if latest_only:
+            query += " AND id IN (SELECT MAX(id) FROM results GROUP BY run_id, task_index)"
+        if run_id:
+            query += " AND run_id = ?"
+            params.append(run_id)
+        if framework:
+            query += " AND framework = ?"
+            params.append(framework)
+        conn = self._connect()
+        try:
+            rows = conn.execute(query + " ORDER BY id", params).fetchall()
+        finally:
+            conn.close()
+        result = []
+        for row in rows:
+            record = dict(row)
+            record["durations"] = json.loads(record["durations"])
+            result.append(record)
+        return result
+
+    def latest_run(self, framework=None):
+        query, params = "SELECT run_id FROM runs", []
+        if framework:
+            query += " WHERE framework = ?"
+            params.append(framework)
+        conn = self._connect()
+        try:
+            row = conn.execute(query + " ORDER BY created_at DESC LIMIT 1", params).fetchone()
+        finally:
+            conn.close()
+        return row["run_id"] if row else None
+
+
+def is_resolved(tests_status):
+    """SWE-Bench's definition: all FAIL_TO_PASS tests pass now (at least one) and no PASS_TO_PASS test broke."""
+    f2p, p2p = tests_status["FAIL_TO_PASS"], tests_status["PASS_TO_PASS"]
+    return bool(f2p["success"]) and not f2p["failure"] and not p2p["failure"]
+
+
+def record_instance(store, run_id, framework, instance):
+    """Stores a finished ``common.pipeline.Instance``."""
+    fields = dict(run_id=run_id, framework=framework, task_index=instance.index,
+                  instance_id=instance.instance_id or None, status=instance.status,
+                  error=instance.error or None, durations=instance.timings,
+                  total_duration=sum(instance.timings.values()), model=instance.model or None)
+    fields["prompt_tokens"], fields["completion_tokens"] = normalize_usage(instance.usage)
+    if instance.tests_status:
+        f2p, p2p = instance.tests_status["FAIL_TO_PASS"], instance.tests_status["PASS_TO_PASS"]
+        fields.update(fail_to_pass_passed=len(f2p["success"]),
+                      fail_to_pass_total=len(f2p["success"]) + len(f2p["failure"]),
+                      pass_to_pass_passed=len(p2p["success"]),
+                      pass_to_pass_total=len(p2p["success"]) + len(p2p["failure"]))
+        fields["resolved"] = is_resolved(instance.tests_status)
+    store.record(**fields)
+
+
+def percentile(values, p):
+    """Nearest-rank percentile, ``p`` in 0..100."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def summarize(records):
+    summary = {"instances": len(records), "statuses": {}, "resolved": 0, "stages": {}, "tokens": {}}
+    stage_values = {}
+    prompt, completion = [], []
+    for record in records:
+        summary["statuses"][record["status"]] = summary["statuses"].get(record["status"], 0) + 1
+        summary["resolved"] += record["resolved"]
+        for stage, seconds in record["durations"].items():
+            stage_values.setdefault(stage, []).append(seconds)
+        if record["total_duration"] is not None:
+            stage_values.setdefault("total", []).append(record["total_duration"])
+        if record["prompt_tokens"] is not None:
+            prompt.append(record["prompt_tokens"])
+        if record["completion_tokens"] is not None:
+            completion.append(record["completion_tokens"])
+    summary["resolve_rate"] = summary["resolved"] / len(records) if records else 0.0
+    for stage, values in stage_values.items():
+        summary["stages"][stage] = {"n": len(values), "p50": percentile(values, 50),
+                                    "p90": percentile(values, 90), "p95": percentile(values, 95),
+                                    "max": max(values)}
+    if prompt or completion:
+        summary["tokens"] = {"prompt_avg": sum(prompt) / len(prompt) if prompt else None,
+                             "completion_avg": sum(completion) / len(completion) if completion else None}
+    return summary
+
+
+def print_report(summary):
+    print(f"Instances: {summary['instances']}  resolved: {summary['resolved']} "
+          f"({summary['resolve_rate']:.1%})  " + "  ".join(f"{k}: {v}" for k, v in sorted(summary["statuses"].items())))
+    print(f"{'stage':<10}{'n':>6}{'p50':>10}{'p90':>10}{'p95':>10}{'max':>10}")
+    for stage, s in summary["stages"].items():
+        print(f"{stage:<10}{s['n']:>6}{s['p50']:>10.1f}{s['p90']:>10.1f}{s['p95']:>10.1f}{s['max']:>10.1f}")
+    if summary["tokens"]:
+        t = summary["tokens"]
+        print(f"Tokens per instance: prompt {t['prompt_avg'] or 0:.0f}  completion {t['completion_avg'] or 0:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the SWE-Bench results store")
+    parser.add_argument("command", choices=["summary", "list"])
+    parser.add_argument("--db", default=RESULTS_DB)
+    parser.add_argument("--run", help="run id, 'latest' for the most recent run (default: all runs)")
+    parser.add_argument("--framework")
+    parser.add_argument("--all-attempts", action="store_true", help="include superseded records of retried instances")
+    parser.add_argument("--json", action="store_true", help="print machine readable output")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    run_id = store.latest_run(args.framework) if args.run == "latest" else args.run
+    records = store.records(run_id, args.framework, latest_only=not args.all_attempts)
+    if args.command == "list":
+        if args.json:
+            print(json.dumps(records, indent=2))
+            return
+        for r in records:
+            counts = (f"F2P {r['fail_to_pass_passed']}/{r['fail_to_pass_total']} "
+                      f"P2P {r['pass_to_pass_passed']}/{r['pass_to_pass_total']}"
+                      if r["fail_to_pass_total"] is not None else r["error"])
+            print(f"{r['run_id']}  {r['framework']:<8} #{r['task_index']:<4} {r['instance_id'] or '-':<32} "
+                  f"{r['status']:<8} {counts}")
+        return
+    summary = summarize(records)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Model routing and escalation for the LLM requests of both frameworks.
+
+The model an agent asks for is only a default. For every request the router
+picks a tier (``cheap`` or ``strong`` by default, see ``DEFAULT_POLICY``) and
+rewrites the model in the request:
+
+- the agent's role, recognized by a regex on the system prompt, gives the start
+  tier (``roles``; ``requested`` keeps the model configured in the agent, the
+  default for the planner, the coder and the tester start on ``cheap``),
+- it escalates to ``strong`` when validation failed: an earlier attempt of the
+  instance was not resolved by the test service (``--attempts`` of the
+  pipeline), the instance was unresolved in a previous run of the same
+  framework, or the agent's own ``run_tests`` call reported failures,
+- it also escalates for large prompts (``large_prompt_tokens``, 0 = off), after
+  several failed tool calls in a row (``tool_errors``) and when the watchdog
+  (``common/watchdog.py``) escalates a stalled agent.
+
+Routing is opt-in: ``LLM_ROUTING=on`` uses the defaults, a path to a JSON file
+merges the file over the defaults, and without it (or ``LLM_ROUTING=off``) the
+models hard-wired in the agents are used. Each
+request records the requested and the routed model in the trace, and the report
+compares the actual cost with what the requested models would have cost::
+
+    python -m common.routing report --trace crewai/trace.jsonl --run latest-run-id
+"""
+import argparse
+import contextvars
+import json
+import os
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from common.context_budget import prompt_tokens
+
+LLM_ROUTING = os.environ.get("LLM_ROUTING", "off")
+
+DEFAULT_POLICY = {
+    "tiers": {"cheap": "gpt-4o-mini", "strong": "gpt-4o"},
+    "default_tier": "cheap",
+    "escalation_tier": "strong",
+    # role name -> {"match": regex on the system prompt, "tier": start tier}
+    "roles": {
+        "planner": {"match": "Planner|teamleader", "tier": "requested"},
+        "coder": {"match": "Software Engineer|Coder Agent|Write the actual Code", "tier": "cheap"},
+        "tester": {"match": "Quality Control|Tester Agent|Ensure that the code", "tier": "cheap"},
+    },
+    "escalate_after_attempts": 1,  # attempts on the start tier before escalating
+    "escalate_on_previous_failure": True,
+    "escalate_on_test_failure": True,
+    "large_prompt_tokens": 0,
+    "tool_errors": 3,
+    # USD per million input / output tokens, for the savings report
+    "prices": {"gpt-4o": [2.5, 10.0], "gpt-4o-mini": [0.15, 0.6]},
+}
+
+_ERROR_RE = re.compile(r"^(Fehler|Error|Edit failed|Patch failed|File not found|Invalid)", re.IGNORECASE)
+
+
+def load_policy(source=LLM_ROUTING):
+    if source in ("off", ""):
+        return None
+    policy = json.loads(json.dumps(DEFAULT_POLICY))
+    if source != "on":
+        with open(source, "r", encoding="utf-8") as f:
+            policy.update(json.load(f))
+    return policy
+
+
+@dataclass
+class RouteContext:
+    """Routing state of one agent attempt of an instance."""
+    instance: int = None
+    attempt: int = 1
+    previous_failure: bool = False
+    test_failure: bool = False
+    cancelled: bool = False  # the attempt was given up, its agents get a final answer
+    branch: int = 0  # number of the speculative attempt, 0 outside of speculative runs
+    budget_share: float = 1.0  # share of the instance's token budget
+    models: set = field(default_factory=set)
+
+
+_route = contextvars.ContextVar("route_context", default=None)
+
+
+@contextmanager
+def route_context(instance, attempt=1, previous_failure=False):
+    """Makes the routing state available to the LLM requests of the enclosed agent run."""
+    context = RouteContext(instance, attempt, previous_failure)
+    token = _route.set(context)
+    try:
+        yield context
+    finally:
+        _route.reset(token)
+
+
+def current_route():
+    return _route.get()
+
+
+def note_test_result(failed):
+    """Called by the test tool: failed tests escalate the rest of the attempt."""
+    context = _route.get()
+    if context is not None and failed:
+        context.test_failure = True
+
+
+def _system_prompt(body):
+    items = body.get("messages") if isinstance(body.get("messages"), list) else body.get("input")
+    texts = [body.get("instructions") or ""]
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and item.get("role") in ("system", "developer"):
+            content = item.get("content")
+            texts.append(content if isinstance(content, str) else json.dumps(content))
+    return "\n".join(texts)
+
+
+def _tool_outputs(body):
+    items = body.get("messages") if isinstance(body.get("messages"), list) else body.get("input")
+    outputs = []
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        if item.get("role") == "tool" and isinstance(item.get("content"), str):
+            outputs.append(item["content"])
+        elif item.get("type") == "function_call_output" and isinstance(item.get("output"), str):
+            outputs.append(item["output"])
+    return outputs
+
+
+class Router:
+    def __init__(self, policy):
+        self.policy = policy
+        self.roles = [(name, re.compile(role["match"]), role["tier"]) for name, role in policy["roles"].items()]
+
+    def role(self, body):
+        system = _system_prompt(body)
+        for name, pattern, tier in self.roles:
+            if pattern.search(system):
+                return name, tier
+        return None, self.policy["default_tier"]
+
+    def route(self, body, context=None, stalled=False):
+        """Returns ``(model, role, reason)`` for a request body; ``stalled`` escalates as well."""
+        policy = self.policy
+        role, tier = self.role(body)
+        reason = f"role:{role}" if role else "default"
+        escalate = None
+        if context is not None:
+            if context.attempt > policy["escalate_after_attempts"]:
+                escalate = f"attempt:{context.attempt}"
+            elif context.previous_failure and policy["escalate_on_previous_failure"]:
+                escalate = "previous_failure"
+            elif context.test_failure and policy["escalate_on_test_failure"]:
+                escalate = "test_failure"
+        if escalate is None and stalled:
+            escalate = "stall"
+        if escalate is None and policy["large_prompt_tokens"] and prompt_tokens(body) > policy["large_prompt_tokens"]:
+            escalate = "large_prompt"
+        if escalate is None and policy["tool_errors"]:
+            recent = _tool_outputs(body)[-policy["tool_errors"]:]
+            if len(recent) == policy["tool_errors"] and all(_ERROR_RE.match(o.strip()) for o in recent):
+                escalate = "tool_errors"
+        if escalate:
+            tier, reason = policy["escalation_tier"], escalate
+        # a tier that is not configured, like "requested", keeps the model of the agent
+        return policy["tiers"].get(tier, body.get("model")), role, reason
+
+
+def cost(model, prompt, completion, prices):
+    price = prices.get(model)
+    if price is None or prompt is None:
+        return None
+    return (prompt * price[0] + (completion or 0) * price[1]) / 1_000_000
+
+
+def savings(spans, prices):
+    """Cost of the routed requests compared with the requested models, and estimated latency saved."""
+    llm = [s for s in spans if s["kind"] == "llm" and s.get("prompt_tokens") is not None]
+    # seconds per completion token of every model, to estimate the latency of the model not used
+    rate = {}
+    for s in llm:
+        if s.get("cache") is None and s.get("completion_tokens"):
+            rate.setdefault(s.get("model"), []).append(s["duration"] / s["completion_tokens"])
+    rate = {model: sum(v) / len(v) for model, v in rate.items()}
+    rows = {}
+    for s in llm:
+        requested, model = s.get("requested_model") or s.get("model"), s.get("model")
+        row = rows.setdefault((requested, model), {"requested": requested, "model": model, "requests": 0,
+                                                   "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0,
+                                                   "baseline_cost": 0.0, "latency": 0.0, "baseline_latency": 0.0})
+        row["requests"] += 1
+        row["prompt_tokens"] += s["prompt_tokens"]
+        row["completion_tokens"] += s.get("completion_tokens") or 0
+        row["cost"] += cost(model, s["prompt_tokens"], s.get("completion_tokens"), prices) or 0.0
+        row["baseline_cost"] += cost(requested, s["prompt_tokens"], s.get("completion_tokens"), prices) or 0.0
+        row["latency"] += s["duration"]
+        if requested != model and requested in rate and s.get("completion_tokens"):
+            row["baseline_latency"] += rate[requested] * s["completion_tokens"]
+        else:
+            row["baseline_latency"] += s["duration"]
+    return sorted(rows.values(), key=lambda r: -r["requests"])
+
+
+def print_savings(rows):
+    print(f"{'requested':<16}{'routed to':<16}{'requests':>9}{'prompt tok':>12}{'compl tok':>11}"
+          f"{'cost $':>10}{'baseline $':>12}{'latency s':>11}{'baseline s':>12}")
+    for r in rows:
+        print(f"{str(r['requested'])[:15]:<16}{str(r['model'])[:15]:<16}{r['requests']:>9}{r['prompt_tokens']:>12}"
+              f"{r['completion_tokens']:>11}{r['cost']:>10.3f}{r['baseline_cost']:>12.3f}{r['latency']:>11.1f}"
+              f"{r['baseline_latency']:>12.1f}")
+    actual, baseline = sum(r["cost"] for r in rows), sum(r["baseline_cost"] for r in rows)
+    latency, baseline_latency = sum(r["latency"] for r in rows), sum(r["baseline_latency"] for r in rows)
+    print(f"Cost ${actual:.3f} instead of ${baseline:.3f} (saved ${baseline - actual:.3f}), "
+          f"LLM time {latency:.0f}s instead of ~{baseline_latency:.0f}s")
+
+
+def main():
+    from common.tracing import TRACE_FILE, load_spans
+
+    parser = argparse.ArgumentParser(description="Cost and latency savings of model routing")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--trace", default=TRACE_FILE)
+    parser.add_argument("--run", help="only requests of this run id")
+    parser.add_argument("--policy", default=LLM_ROUTING, help="routing policy file with the prices")
+    args = parser.parse_args()
+    policy = load_policy("on" if args.policy in ("off", "") else args.policy)
+    print_savings(savings(load_spans(args.trace, args.run), policy["prices"]))
+
+
+if __name__ == "__main__":
+    main()
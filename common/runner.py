@@ -0,0 +1,57 @@
+"""Sweep settings, command line arguments and the final summary.
+
+The instances themselves are scheduled by ``common.pipeline.Pipeline``.
+"""
+import argparse
+import os
+from dataclasses import dataclass, field
+
+DEFAULT_CONCURRENCY = int(os.environ.get("SWEEP_CONCURRENCY", "4"))
+DEFAULT_TIMEOUT = float(os.environ.get("SWEEP_TIMEOUT", "1800"))  # seconds per instance
+DEFAULT_ATTEMPTS = int(os.environ.get("SWEEP_ATTEMPTS", "1"))
+
+
+@dataclass
+class InstanceOutcome:
+    index: int
+    status: str = "pending"  # ok | error | timeout | cancelled
+    duration: float = 0.0
+    error: str = ""
+    result: object = field(default=None, repr=False)
+
+
+def print_summary(outcomes, wall_time):
+    counts = {}
+    for outcome in outcomes:
+        counts[outcome.status] = counts.get(outcome.status, 0) + 1
+    busy = sum(o.duration for o in outcomes)
+    print("\n=== Sweep summary ===")
+    print(f"Instances: {len(outcomes)}  " + "  ".join(f"{k}: {v}" for k, v in sorted(counts.items())))
+    print(f"Wall time: {wall_time:.1f}s  summed instance time: {busy:.1f}s  "
+          f"speedup: {busy / wall_time if wall_time else 0:.2f}x")
+    for outcome in outcomes:
+        if outcome.status != "ok":
+            print(f"  instance {outcome.index}: {outcome.status} {outcome.error}")
+
+
+def parse_sweep_args(default_start, default_end):
+    parser = argparse.ArgumentParser(description="Run a SWE-Bench-Lite sweep")
+    parser.add_argument("--start", type=int, default=default_start, help="first task index")
+    parser.add_argument("--end", type=int, default=default_end, help="last task index (inclusive)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="number of instances processed at the same time")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="timeout per instance in seconds")
+    parser.add_argument("--prefetch", type=int, default=int(os.environ.get("SWEEP_PREFETCH", "2")),
+                        help="instances fetched and checked out ahead of the agents")
+    parser.add_argument("--eval-workers", type=int, default=int(os.environ.get("SWEEP_EVAL_WORKERS", "2")),
+                        help="number of workers submitting evaluations")
+    parser.add_argument("--resume", metavar="RUN_ID",
+                        help="resume a run ('latest' for the most recent one): finished instances are skipped")
+    parser.add_argument("--attempts", type=int, default=DEFAULT_ATTEMPTS,
+                        help="agent attempts per instance, unresolved instances are retried with the stronger model")
+    parser.add_argument("--speculate", type=int, default=int(os.environ.get("SWEEP_SPECULATE", "1")),
+                        help="parallel fix attempts per instance in separate worktrees, the best one is evaluated")
+    parser.add_argument("--processes", type=int, default=int(os.environ.get("SWEEP_PROCESSES", "0")),
+                        help="run the agents of each instance in a pool of this many worker processes")
+    return parser.parse_args()
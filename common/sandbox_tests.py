@@ -0,0 +1,230 @@
+"""In-loop test execution for the agents' test tool.
+
+Runs a chosen subset of tests, typically the instance's FAIL_TO_PASS ids, in the
+checkout instead of waiting for the SWE-Bench test service after the whole
+crew has finished:
+
+- pytest ids (``tests/test_x.py::TestA::test_b``) are grouped by file and split
+  into shards that run as parallel pytest processes, like ``pytest -n`` without
+  needing pytest-xdist in the project's environment. Bare test names (sympy
+  style) are located with the repository index and selected with ``-k``.
+- Django ids (``test_x (app.tests.Class)``) run through ``tests/runtests.py``
+  with its own ``--parallel``.
+
+Every shard runs in its own session with a timeout (the whole process group is
+killed), without bytecode or pytest cache writes into the checkout, and without
+API keys in the environment. The result is a short summary plus the details of
+failures only, capped at ``TEST_OUTPUT_CHARS``. Tests run with ``TEST_PYTHON``,
+which needs the project's dependencies.
+"""
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from common.repo_index import get_index
+
+TEST_PYTHON = os.environ.get("TEST_PYTHON", sys.executable)
+TEST_TIMEOUT = float(os.environ.get("TEST_TIMEOUT", "300"))  # seconds per shard
+TEST_WORKERS = int(os.environ.get("TEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+TEST_OUTPUT_CHARS = int(os.environ.get("TEST_OUTPUT_CHARS", "6000"))
+TEST_MEMORY_MB = int(os.environ.get("TEST_MEMORY_MB", "0"))  # address space limit per shard, 0 for none
+NOT_FOUND = "not found/not collected"
+
+_SECRET_RE = re.compile(r"KEY|TOKEN|SECRET|PASSWORD", re.IGNORECASE)
+_PYTEST_RESULT_RE = re.compile(r"^(PASSED|FAILED|ERROR|XPASS|XFAIL)\s+(.+?)(?: - (.*))?$", re.MULTILINE)
+_DJANGO_ID_RE = re.compile(r"^(\w+) \(([\w.]+)\)")
+_DJANGO_RESULT_RE = re.compile(r"^(\w+) \(([\w.]+)\)(?:\n[^\n]*)? \.\.\. (ok|FAIL|ERROR|skipped|expected failure|unexpected success)",
+                               re.MULTILINE)
+
+
+@dataclass
+class TestRun:
+    passed: list = field(default_factory=list)
+    failed: list = field(default_factory=list)  # (test id, short reason)
+    details: list = field(default_factory=list)  # failure output blocks
+    timed_out: list = field(default_factory=list)
+    duration: float = 0.0
+    workers: int = 1
+
+
+def _sandbox_env(repo_dir):
+    env = {k: v for k, v in os.environ.items() if not _SECRET_RE.search(k)}
+    env.update(PYTHONDONTWRITEBYTECODE="1", PYTHONUNBUFFERED="1",
+               PYTHONPATH=os.pathsep.join(filter(None, [repo_dir, env.get("PYTHONPATH")])))
+    return env
+
+
+def _limit_resources():
+    import resource
+    limit = TEST_MEMORY_MB * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _limited(command):
+    """``command`` with the memory limit, through ``prlimit`` so no Python code runs between fork and exec."""
+    if TEST_MEMORY_MB and shutil.which("prlimit"):
+        return ["prlimit", f"--as={TEST_MEMORY_MB * 1024 * 1024}", "--", *command], None
+    # preexec_fn is not safe with threads, only used if a limit is set and prlimit is missing
+    return command, (_limit_resources if TEST_MEMORY_MB else None)
+
+
+def _run(command, cwd, env, timeout):
+    """Runs ``command`` in its own session, returns ``(output, timed_out, exit code)``."""
+    command, preexec = _limited(command)
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True, errors="replace", start_new_session=True, preexec_fn=preexec)
+    try:
+        output, _ = process.communicate(timeout=timeout)
+        return output, False, process.returncode
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        output, _ = process.communicate()
+        return output, True, None
+
+
+def _is_django(repo_dir):
+    return os.path.isfile(os.path.join(repo_dir, "tests", "runtests.py"))
+
+
+def django_label(test_id):
+    """``test_x (app.tests.Class)`` -> ``app.tests.Class.test_x``."""
+    match = _DJANGO_ID_RE.match(test_id.strip())
+    if not match:
+        return test_id.strip()
+    name, parent = match.groups()
+    return parent if parent.endswith("." + name) else f"{parent}.{name}"
+
+
+def _locate(repo_dir, name):
+    """Files defining test function ``name``, found with the repository index."""
+    hits, _, _ = get_index(repo_dir).grep(f"def {name}(", limit=20, per_file=1)
+    return sorted({path for path, _, _ in hits if "test" in path.lower()})
+
+
+def plan_pytest_shards(repo_dir, tests, workers):
+    """Splits tests into at most ``workers`` shards of pytest arguments, keeping each file in one shard."""
+    by_file, bare = {}, []
+    for test in tests:
+        if "::" in test or test.endswith(".py"):
+            by_file.setdefault(test.split("::", 1)[0], []).append(test)
+        else:
+            bare.append(test)
+    shards = [[] for _ in range(max(1, min(workers, len(by_file))))] if by_file else []
+    for _, ids in sorted(by_file.items(), key=lambda item: -len(item[1])):
+        min(shards, key=len).extend(ids)
+    if bare:
+        files = sorted({f for name in bare for f in _locate(repo_dir, name)})
+        shards.append(files + ["-k", " or ".join(bare)] if files else ["-k", " or ".join(bare)])
+    return shards
+
+
+def _parse_pytest(output, run, exit_code=None):
+    for outcome, test_id, reason in _PYTEST_RESULT_RE.findall(output):
+        if outcome in ("PASSED", "XFAIL"):
+            run.passed.append(test_id)
+        else:
+            run.failed.append((test_id, reason or outcome.lower()))
+    start = re.search(r"^=+ (FAILURES|ERRORS) =+$", output, re.MULTILINE)
+    end = re.search(r"^=+ (PASSES|short test summary info) =+$", output, re.MULTILINE)
+    if start:
+        run.details.append(output[start.start():end.start() if end else len(output)].strip())
+    if exit_code not in (0, 1, None):
+        # 2 collection errors, 4 usage errors like unknown ids, 5 no tests collected
+        run.details.append(f"[pytest exit code {exit_code}]\n" + output[-2000:].strip())
+    elif not start and run.failed and not run.passed:
+        run.details.append(output[-2000:].strip())  # collection or usage errors
+
+
+def _pytest_reported(test, reported):
+    """Whether the requested pytest id or bare name ``test`` is among the ``reported`` node ids."""
+    if test.endswith(".py"):
+        return any(r.startswith(test + "::") for r in reported)
+    if "::" in test:
+        return any(r == test or r.startswith(test + "[") or r.startswith(test + "::") for r in reported)
+    return any(r.endswith("::" + test) or f"::{test}[" in r for r in reported)
+
+
+def _django_reported(test, reported):
+    label = django_label(test)
+    return any(django_label(r) == label or django_label(r).startswith(label + ".") for r in reported)
+
+
+def _mark_missing(run, tests, reported_by):
+    """Lists requested tests without a result as failed, so an unknown id never looks like a pass."""
+    reported = run.passed + [test_id for test_id, _ in run.failed]
+    for test in tests:
+        if not reported_by(test, reported):
+            run.failed.append((test, NOT_FOUND))
+
+
+def _parse_django(output, run):
+    for name, parent, outcome in _DJANGO_RESULT_RE.findall(output):
+        test_id = f"{name} ({parent})"
+        if outcome in ("ok", "expected failure"):
+            run.passed.append(test_id)
+        elif outcome in ("FAIL", "ERROR", "unexpected success"):
+            run.failed.append((test_id, outcome))
+    blocks = re.findall(r"^={20,}\n((?:FAIL|ERROR): .*?)(?=^={20,}|^-{20,}\nRan |\Z)", output, re.MULTILINE | re.DOTALL)
+    run.details.extend(block.strip() for block in blocks)
+    if not run.passed and not run.failed:
+        run.details.append(output[-2000:].strip())
+
+
+def run_tests(repo_dir, tests, workers=TEST_WORKERS, timeout=TEST_TIMEOUT):
+    """Runs ``tests`` in ``repo_dir`` in parallel shards and returns a ``TestRun``."""
+    repo_dir = os.path.abspath(repo_dir)
+    tests = [t for t in (t.strip() for t in tests) if t]
+    if not tests:
+        raise ValueError("No tests given")
+    env = _sandbox_env(repo_dir)
+    start = time.monotonic()
+    with tempfile.TemporaryDirectory(prefix="agent-tests-") as tmp:
+        if _is_django(repo_dir):
+            run = TestRun(workers=workers)
+            command = [TEST_PYTHON, "runtests.py", "--parallel", str(workers), "--verbosity", "2",
+                       *dict.fromkeys(django_label(t) for t in tests)]
+            output, timed_out, _ = _run(command, os.path.join(repo_dir, "tests"), env, timeout)
+            _parse_django(output, run)
+            if timed_out:
+                run.timed_out.append(" ".join(tests))
+            else:
+                _mark_missing(run, tests, _django_reported)
+        else:
+            shards = plan_pytest_shards(repo_dir, tests, workers)
+            run = TestRun(workers=len(shards))
+            commands = [[TEST_PYTHON, "-m", "pytest", "-p", "no:cacheprovider", "-q", "-rA", "--tb=short",
+                         "--color=no", f"--basetemp={os.path.join(tmp, f'shard{i}')}", *shard]
+                        for i, shard in enumerate(shards)]
+            with ThreadPoolExecutor(max_workers=len(commands)) as pool:
+                results = list(pool.map(lambda c: _run(c, repo_dir, env, timeout), commands))
+            bare = [t for t in tests if "::" not in t and not t.endswith(".py")]
+            for shard, (output, timed_out, exit_code) in zip(shards, results):
+                _parse_pytest(output, run, exit_code)
+                if timed_out:
+                    run.timed_out.append(" ".join(shard))
+                else:
+                    _mark_missing(run, bare if "-k" in shard else shard, _pytest_reported)
+    run.duration = time.monotonic() - start
+    return run
+
+
+def format_test_run(run, max_chars=TEST_OUTPUT_CHARS):
+    """Summary line, failing tests and their output; passing tests are only counted."""
+    lines = [f"Ran {len(run.passed) + len(run.failed)} tests in {run.duration:.1f}s ({run.workers} workers): "
+             f"{len(run.passed)} passed, {len(run.failed)} failed"]
+    for shard in run.timed_out:
+        lines.append(f"TIMEOUT: {shard[:200]}")
+    lines += [f"FAILED {test_id} - {reason}" for test_id, reason in run.failed]
+    text = "\n".join(lines)
+    if run.details:
+        text += "\n\n" + "\n\n".join(run.details)
+    if len(text) > max_chars:
+        text = text[:max_chars] + f"\n[output cut at {max_chars} characters]"
+    return text
@@ -0,0 +1,200 @@
+"""Speculative fix attempts: N agent runs per instance in parallel, the best one wins.
+
+``speculative(agent_stage, n)`` wraps the agent stage of the pipeline. It adds
+``n`` git worktrees of the instance's checkout (``repos/repo_N.try1`` ..., or
+copy-on-write copies where the repo cache uses reflinks), runs
+the agents once in each of them at the same time and scores every attempt with
+fast local checks:
+
+1. the attempt changed something,
+2. every changed Python file compiles,
+3. the instance's FAIL_TO_PASS tests pass (``common/sandbox_tests.py``).
+
+As soon as one attempt passes all checks the others are cancelled; their next
+LLM request is answered with a final answer, so the agents stop right away.
+The patch of the best attempt is applied to the instance's checkout, which
+then goes to the test service as usual, and the worktrees are removed.
+"""
+import asyncio
+import dataclasses
+import os
+import shutil
+import subprocess
+from dataclasses import dataclass
+
+from common.gitutil import git
+from common.repo_cache import shared_repo_cache
+from common.repo_index import drop_index
+from common.routing import current_route, route_context
+from common.sandbox_tests import TEST_TIMEOUT, run_tests
+from common.tracing import span
+from common.watchdog import StalledError, watch
+
+SWEEP_SPECULATE = int(os.environ.get("SWEEP_SPECULATE", "1"))
+
+
+@dataclass
+class Attempt:
+    number: int
+    repo_dir: str
+    instance: object = None
+    patch: str = ""
+    syntax_errors: list = None
+    tests: object = None  # TestRun of the FAIL_TO_PASS tests
+    error: str = ""
+    stalled: str = ""  # reason if the watchdog aborted the attempt
+
+    @property
+    def passed(self):
+        return (bool(self.patch) and not self.syntax_errors and self.tests is not None
+                and bool(self.tests.passed) and not self.tests.failed and not self.tests.timed_out)
+
+    def score(self):
+        tests = self.tests
+        ratio = len(tests.passed) / ((len(tests.passed) + len(tests.failed)) or 1) if tests is not None else 0.0
+        # smaller patches win ties, they are less likely to break PASS_TO_PASS tests
+        return (bool(self.patch), bool(self.patch) and not self.syntax_errors, ratio, not self.error,
+                -len(self.patch))
+
+
+async def _patch(repo_dir):
+    """All changes of the worktree (untracked files included) as a binary diff against HEAD."""
+    await git("add", "--all", cwd=repo_dir)
+    return await git("diff", "--cached", "--binary", "HEAD", cwd=repo_dir)
+
+
+async def _syntax_errors(repo_dir):
+    changed = await git("diff", "--cached", "--name-only", "--diff-filter=AM", "HEAD", cwd=repo_dir)
+    errors = []
+    for path in changed.splitlines():
+        if not path.endswith(".py"):
+            continue
+        try:
+            with open(os.path.join(repo_dir, path), "rb") as f:
+                compile(f.read(), path, "exec", dont_inherit=True)
+        except (SyntaxError, ValueError, OSError) as e:
+            errors.append(f"{path}: {e}")
+    return errors
+
+
+async def score_attempt(attempt, tests):
+    with span("score", "stage", attempt=attempt.number):
+        attempt.patch = await _patch(attempt.repo_dir)
+        if not attempt.patch:
+            return attempt
+        attempt.syntax_errors = await _syntax_errors(attempt.repo_dir)
+        if attempt.syntax_errors or not tests:
+            return attempt
+        try:
+            attempt.tests = await asyncio.to_thread(run_tests, attempt.repo_dir, tests, timeout=TEST_TIMEOUT)
+        except ValueError as e:
+            attempt.error = f"tests: {e}"
+    return attempt
+
+
+async def _run_attempt(agent_stage, instance, attempt, n):
+    # every attempt has its own routing state, so it can be stopped on its own
+    parent = current_route()
+    with route_context(instance.index, instance.attempt, instance.previous_failure) as route, \
+            watch(instance.index, attempt.repo_dir) as watching:
+        route.branch, route.budget_share = attempt.number, 1 / n
+        try:
+            with span("attempt", "stage", attempt=attempt.number):
+                await agent_stage(attempt.instance)
+        except Exception as e:
+            attempt.error = str(e)
+        except asyncio.CancelledError:
+            route.cancelled = True
+            raise
+        finally:
+            if parent is not None:
+                parent.models |= route.models
+            if watching is not None and watching.aborted:
+                attempt.stalled = watching.reason
+    try:
+        return await score_attempt(attempt, instance.fail_tests)
+    except (subprocess.CalledProcessError, OSError) as e:
+        attempt.error = f"score: {e}"
+        return attempt
+
+
+async def _add_worktrees(instance, n):
+    attempts = []
+    for number in range(1, n + 1):
+        path = f"{instance.repo_dir.rstrip(os.sep)}.try{number}"
+        await _remove_worktree(instance.repo_dir, path)
+        if shared_repo_cache().reflinks() and os.path.isdir(os.path.join(instance.repo_dir, ".git")):
+            await shared_repo_cache().layer(instance.repo_dir, path)
+        else:
+            await git("worktree", "add", "--quiet", "--detach", os.path.abspath(path), "HEAD", cwd=instance.repo_dir)
+        copy = dataclasses.replace(instance, repo_dir=path, timings={})
+        attempts.append(Attempt(number, path, copy))
+    return attempts
+
+
+async def _remove_worktree(repo_dir, path):
+    drop_index(path)
+    if not os.path.exists(path):
+        return
+    if os.path.isdir(os.path.join(path, ".git")):  # a copy, not a worktree
+        await asyncio.to_thread(shutil.rmtree, path, ignore_errors=True)
+        return
+    try:
+        await git("worktree", "remove", "--force", os.path.abspath(path), cwd=repo_dir)
+    except subprocess.CalledProcessError:
+        await asyncio.to_thread(shutil.rmtree, path, ignore_errors=True)
+        await git("worktree", "prune", cwd=repo_dir)
+
+
+async def _apply(repo_dir, patch):
+    proc = await asyncio.create_subprocess_exec("git", "apply", "--index", "--binary", "-", cwd=repo_dir,
+                                                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.PIPE)
+    _, stderr = await proc.communicate(patch.encode("utf-8"))
+    if proc.returncode != 0:
+        raise ValueError(stderr.decode("utf-8", errors="replace").strip())
+
+
+def speculative(agent_stage, n=SWEEP_SPECULATE):
+    """Wraps ``agent_stage(instance)`` so it runs ``n`` attempts in parallel and keeps the best one."""
+    if n <= 1:
+        return agent_stage
+
+    async def run(instance):
+        attempts = await _add_worktrees(instance, n)
+        tasks = [asyncio.create_task(_run_attempt(agent_stage, instance, a, n)) for a in attempts]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                attempt = await finished
+                print(f"Test case {instance.index} attempt {attempt.number}: score {attempt.score()[:4]}")
+                if attempt.passed:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for attempt in attempts:
+                await _remove_worktree(instance.repo_dir, attempt.repo_dir)
+        # only reached if the stage was not cancelled, the patches are kept in the attempts
+        done = [t.result() for t in tasks if not t.cancelled() and t.exception() is None]
+        winner = None
+        for attempt in sorted(done, key=lambda a: a.score(), reverse=True):
+            if not attempt.patch:
+                break
+            try:
+                await _apply(instance.repo_dir, attempt.patch)
+            except ValueError as e:
+                print(f"Test case {instance.index}: patch of attempt {attempt.number} does not apply: {e}")
+                continue
+            winner = attempt
+            break
+        if done and all(a.stalled and not a.patch for a in done):
+            raise StalledError(f"all {len(done)} attempts stalled without changes: {done[0].stalled}")
+        best = winner or (max(done, key=lambda a: a.score()) if done else None)
+        if best is None or (best.error and not best.patch):
+            raise RuntimeError(f"All {n} attempts failed" + (f", last error: {best.error}" if best else ""))
+        instance.agent_output = best.instance.agent_output
+        instance.usage = best.instance.usage
+        instance.model = best.instance.model
+        print(f"Test case {instance.index}: using attempt {best.number} of {len(done)} finished")
+    return run
@@ -0,0 +1,330 @@
+"""Shared local tool service for the file, tree and git tools of every framework.
+
+The crewai tools, the openai-agents tools and the n8n workflows used to
+implement reading, writing and listing files each on their own (n8n with a
+sub-workflow and a shell per call). ``ToolService`` holds the operations once,
+with caches that stay warm across calls and instances:
+
+- file contents by path, checked against mtime and size (``common/file_ops.py``),
+- the repository index per checkout (file list, code search, symbols), which
+  also backs the directory tree,
+- ``git status`` per checkout, recomputed only when the git index or an indexed
+  file changed.
+
+Run it as one long-lived process for all frontends::
+
+    python -m common.tool_server --port 8083              # or --socket /tmp/sweep-tools.sock
+    TOOL_SERVER_URL=http://localhost:8083 python main.py   # or unix:///tmp/sweep-tools.sock
+
+Every operation is ``POST /<operation>`` with its arguments as JSON object and
+answers ``{"result": ...}`` or ``{"error": <exception type>, "message": ...}``.
+Paths are absolute, or relative to the repository of the task ``index``
+(``TOOL_REPOS_DIR/repo_<index>``, the layout of the n8n workflows), or to the
+workspace root. Without ``TOOL_SERVER_URL`` the frontends call the same
+operations in-process; ``tools()`` returns whichever applies.
+"""
+import argparse
+import builtins
+import inspect
+import json
+import os
+import re
+import socketserver
+import subprocess
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from common.edit_ops import EditError, apply_edits, apply_edits_many, apply_patch
+from common.file_ops import invalidate, outline, read_many, read_range
+from common.gitutil import git_env, stage_files
+from common.repo_index import drop_index, find_repo_root, get_index, notify_changed
+from common.workspace import resolve
+
+TOOL_SERVER_URL = os.environ.get("TOOL_SERVER_URL", "")
+TOOL_SERVER_TIMEOUT = float(os.environ.get("TOOL_SERVER_TIMEOUT", "120"))
+TOOL_REPOS_DIR = os.environ.get("TOOL_REPOS_DIR", "/repos")
+TOOL_SERVER_REPOS = int(os.environ.get("TOOL_SERVER_REPOS", "64"))  # checkouts kept warm
+TREE_MAX_ENTRIES = int(os.environ.get("TREE_MAX_ENTRIES", "2000"))
+
+OPERATIONS = ("read", "read_many", "outline", "write", "edit", "edit_many", "patch", "stage", "glob", "grep",
+              "definition", "tree", "git_status", "repo_dir")
+
+
+def format_tree(paths, max_entries=TREE_MAX_ENTRIES):
+    """Indented directory tree of relative ``paths``, like ``tree`` without the box drawing."""
+    lines, previous = [], []
+    for path in sorted(paths):
+        parts = path.split("/")
+        common = 0
+        while common < min(len(previous), len(parts) - 1) and previous[common] == parts[common]:
+            common += 1
+        for depth in range(common, len(parts) - 1):
+            lines.append(f"{'  ' * depth}{parts[depth]}/")
+        lines.append(f"{'  ' * (len(parts) - 1)}{parts[-1]}")
+        previous = parts[:-1]
+        if len(lines) >= max_entries:
+            lines.append(f"[tree cut at {max_entries} entries, use find_files or a subdirectory]")
+            break
+    return "\n".join(lines)
+
+
+def _number(value):
+    """Line and byte arguments from n8n can be strings or empty."""
+    return None if value in (None, "") else int(value)
+
+
+class ToolService:
+    """The tool operations with their per-checkout caches; thread-safe, one instance per process."""
+
+    def __init__(self, max_repos=TOOL_SERVER_REPOS):
+        self.max_repos = max_repos
+        self._repos = OrderedDict()  # checkout root -> last status key, status text
+        self._task_dirs = {}
+        self._lock = threading.Lock()
+
+    # -- paths ------------------------------------------------------------
+
+    def repo_dir(self, index):
+        """Checkout of task ``index`` in ``TOOL_REPOS_DIR``: ``repo_<index>`` or its only subdirectory."""
+        index = str(index)
+        with self._lock:
+            cached = self._task_dirs.get(index)
+        if cached and os.path.isdir(cached):
+            return cached
+        base = os.path.join(TOOL_REPOS_DIR, f"repo_{index}")
+        if not os.path.isdir(base):
+            raise FileNotFoundError(base)
+        found = base
+        if not os.path.exists(os.path.join(base, ".git")):
+            subdirs = [d for d in os.listdir(base) if os.path.isdir(os.path.join(base, d))]
+            if len(subdirs) == 1:
+                found = os.path.join(base, subdirs[0])
+        with self._lock:
+            self._task_dirs[index] = found
+        return found
+
+    def _path(self, path, index=None):
+        if path and index not in (None, "") and not os.path.isabs(path):
+            return os.path.normpath(os.path.join(self.repo_dir(index), path))
+        return resolve(path)
+
+    def _touch(self, path):
+        """Marks the checkout of ``path`` as recently used and drops the least recently used ones."""
+        root = find_repo_root(path)
+        with self._lock:
+            self._repos.setdefault(root, (None, None))
+            self._repos.move_to_end(root)
+            evicted = []
+            while len(self._repos) > self.max_repos:
+                evicted.append(self._repos.popitem(last=False)[0])
+        for old in evicted:
+            drop_index(old)
+        return root
+
+    # -- operations -------------------------------------------------------
+
+    def read(self, path, start_line=None, end_line=None, start_byte=None, end_byte=None, cursor=None, index=None):
+        return read_range(self._path(path, index), _number(start_line), _number(end_line), _number(start_byte),
+                          _number(end_byte), cursor or None)
+
+    def read_many(self, files, index=None):
+        return read_many([{**f, "path": self._path(f.get("path"), index)} if isinstance(f, dict)
+                          else self._path(f, index) for f in files])
+
+    def outline(self, path, index=None):
+        return outline(self._path(path, index))
+
+    def write(self, path, content, index=None):
+        path = self._path(path, index)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        invalidate(path)
+        notify_changed(path)
+        return f"File written successfully: {path}"
+
+    def edit(self, path, edits, index=None):
+        return apply_edits(self._path(path, index), edits)
+
+    def edit_many(self, files, index=None):
+        return apply_edits_many([{**f, "path": self._path(f.get("path"), index)} for f in files])
+
+    def patch(self, repo_path, patch, index=None):
+        return apply_patch(self._path(repo_path or ".", index), patch)
+
+    def stage(self, repo_path, file_paths, index=None):
+        return stage_files(self._path(repo_path or ".", index), file_paths)
+
+    def glob(self, repo_path, pattern, limit=50, index=None):
+        repo_path = self._path(repo_path or ".", index)
+        self._touch(repo_path)
+        return get_index(repo_path).glob(pattern, limit)
+
+    def grep(self, repo_path, query, regex=False, path_glob=None, index=None):
+        repo_path = self._path(repo_path or ".", index)
+        self._touch(repo_path)
+        try:
+            return get_index(repo_path).grep(query, regex, path_glob=path_glob)
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression: {e}") from None
+
+    def definition(self, repo_path, name, index=None):
+        repo_path = self._path(repo_path or ".", index)
+        self._touch(repo_path)
+        return get_index(repo_path).find_definition(name)
+
+    def tree(self, repo_path=None, index=None):
+        """Files of the checkout (or of a directory inside it) from the index, as an indented tree."""
+        repo_path = self._path(repo_path or ".", index)
+        if not os.path.isdir(repo_path):
+            raise FileNotFoundError(repo_path)
+        self._touch(repo_path)
+        repo = get_index(repo_path)
+        base = os.path.relpath(os.path.abspath(repo_path), repo.root)
+        paths = repo.live_paths()
+        if base != ".":
+            paths = [os.path.relpath(p, base) for p in paths if p.startswith(base + "/")]
+        return f"[{repo_path}: {len(paths)} files]\n" + format_tree(paths)
+
+    def git_status(self, repo_path=None, index=None):
+        """``git status --short``, cached until the git index or a file of the checkout changes."""
+        root = self._touch(self._path(repo_path or ".", index))
+        repo = get_index(root)
+        repo.refresh()
+        try:
+            key = (os.stat(os.path.join(root, ".git", "index")).st_mtime_ns, repo.version)
+        except OSError:
+            key = (None, repo.version)  # worktrees have a .git file, no caching key for their index
+        with self._lock:
+            cached_key, text = self._repos.get(root, (None, None))
+        if key[0] is not None and cached_key == key:
+            return text
+        result = subprocess.run(["git", "status", "--short"], cwd=root, env=git_env(), capture_output=True,
+                                text=True)
+        if result.returncode != 0:
+            raise ValueError(result.stderr.strip())
+        text = result.stdout.strip() or "nothing to commit, working tree clean"
+        with self._lock:
+            if root in self._repos:
+                self._repos[root] = (key, text)
+        return text
+
+
+class ToolClient:
+    """The operations of a ``ToolService`` in another process, over HTTP or a Unix socket."""
+
+    def __init__(self, url=TOOL_SERVER_URL, timeout=TOOL_SERVER_TIMEOUT):
+        if url.startswith("unix://"):
+            transport = httpx.HTTPTransport(uds=url[len("unix://"):])
+            url = "http://tools"
+        else:
+            transport = httpx.HTTPTransport(retries=2)
+        self._client = httpx.Client(base_url=url.rstrip("/"), transport=transport, timeout=timeout)
+
+    def call(self, operation, **arguments):
+        response = self._client.post(f"/{operation}", json=arguments)
+        body = response.json()
+        if "error" in body:
+            raise _error_type(body["error"])(body["message"])
+        return body["result"]
+
+    def __getattr__(self, operation):
+        if operation not in OPERATIONS:
+            raise AttributeError(operation)
+        return lambda *args, **kwargs: self.call(operation, **dict(zip(_PARAMETERS[operation], args)), **kwargs)
+
+    def close(self):
+        self._client.close()
+
+
+def _error_type(name):
+    if name == "EditError":
+        return EditError
+    error = getattr(builtins, name, None)
+    return error if isinstance(error, type) and issubclass(error, Exception) else RuntimeError
+
+
+_PARAMETERS = {name: list(inspect.signature(getattr(ToolService, name)).parameters)[1:] for name in OPERATIONS}
+
+_tools = None
+_tools_lock = threading.Lock()
+
+
+def tools():
+    """The tool operations of this process: a client of ``TOOL_SERVER_URL`` or the in-process service."""
+    global _tools
+    with _tools_lock:
+        if _tools is None:
+            _tools = ToolClient() if TOOL_SERVER_URL else ToolService()
+        return _tools
+
+
+class ToolHandler(BaseHTTPRequestHandler):
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        operation = self.path.strip("/").split("?", 1)[0]
+        if operation not in OPERATIONS:
+            return self._reply(404, {"error": "ValueError", "message": f"Unknown operation {operation}"})
+        try:
+            arguments = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(arguments, dict):
+                raise ValueError("Arguments must be a JSON object")
+            result = getattr(self.server.service, operation)(**arguments)
+        except TypeError as e:
+            return self._reply(400, {"error": "ValueError", "message": str(e)})
+        except (FileNotFoundError, EditError, ValueError) as e:
+            return self._reply(400, {"error": type(e).__name__, "message": str(e)})
+        except Exception as e:
+            return self._reply(500, {"error": type(e).__name__, "message": str(e)})
+        self._reply(200, {"result": result})
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class UnixToolServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def tool_server(host="127.0.0.1", port=8083, socket_path=None, verbose=False):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixToolServer(socket_path, ToolHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ToolHandler)
+    server.service = ToolService()
+    server.verbose = verbose
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the file, tree and git tools to all agent frameworks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8083)
+    parser.add_argument("--socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+    server = tool_server(args.host, args.port, args.socket, args.verbose)
+    print(f"Tool server on {'unix://' + args.socket if args.socket else f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Span instrumentation for sweeps of both frameworks.
+
+Pipeline stages (fetch, checkout with its clone and index steps, agent,
+evaluate), every LLM request (one agent turn) and every tool call are recorded
+as spans with duration, token counts and bytes. Spans are appended as JSON lines
+to ``TRACE_FILE`` (default ``trace.jsonl`` next to the results store, empty to
+disable); the instance a span belongs to is taken from the enclosing stage span,
+also across ``asyncio.to_thread``.
+
+Report of the hot stages, LLM calls and tools::
+
+    python -m common.tracing report --trace crewai/trace.jsonl [--run RUN_ID] [--instance 3]
+"""
+import argparse
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from common.results import normalize_usage, percentile
+
+TRACE_FILE = os.environ.get("TRACE_FILE", "trace.jsonl")
+
+_current = contextvars.ContextVar("current_span", default=None)
+_ids = itertools.count(1)
+_tool_observers = []
+
+
+class Tracer:
+    def __init__(self, path=TRACE_FILE):
+        self.path = path
+        self.run_id = None
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        if not self.path:
+            return
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+_tracer = Tracer()
+
+
+def tracer():
+    return _tracer
+
+
+def init_worker_tracing(run_id):
+    """For worker processes writing to the same trace: the run id of the parent and span ids of their own."""
+    global _ids
+    _tracer.run_id = run_id
+    _ids = itertools.count(os.getpid() * 10_000_000 + 1)
+
+
+class Span:
+    def __init__(self, name, kind, instance=None, **attrs):
+        parent = _current.get()
+        self.id = next(_ids)
+        self.parent = parent.id if parent else None
+        self.instance = instance if instance is not None else (parent.instance if parent else None)
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update({k: v for k, v in attrs.items() if v is not None})
+
+
+def current_span():
+    """The innermost open span of this task or thread, None outside of spans."""
+    return _current.get()
+
+
+@contextmanager
+def span(name, kind, instance=None, **attrs):
+    """Records the enclosed block as a span; works in sync code, coroutines and threads."""
+    current = Span(name, kind, instance, **attrs)
+    token = _current.set(current)
+    started, start = time.time(), time.monotonic()
+    status = "ok"
+    try:
+        yield current
+    except BaseException as e:
+        status = "cancelled" if not isinstance(e, Exception) else "error"
+        current.set(error=f"{type(e).__name__}: {e}"[:300])
+        raise
+    finally:
+        _current.reset(token)
+        _tracer.emit({"run_id": _tracer.run_id, "id": current.id, "parent": current.parent,
+                      "instance": current.instance, "kind": current.kind, "name": current.name,
+                      "start": started, "duration": time.monotonic() - start, "status": status, **current.attrs})
+
+
+def _size(value):
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, (dict, list, tuple)):
+        return len(json.dumps(value, default=str))
+    if hasattr(value, "model_dump_json"):
+        return len(value.model_dump_json())
+    return len(str(value))
+
+
+def observe_tools(callback):
+    """Registers ``callback(name, args, kwargs, result)``, called after every ``traced_tool`` call."""
+    _tool_observers.append(callback)
+
+
+def traced_tool(name):
+    """Decorator recording a tool call with the size of its arguments and result.
+
+    Goes below the framework's tool decorator; signature and docstring are kept
+    so the generated tool schema does not change.
+    """
+    def decorator(fn):
+        def finish(s, args, kwargs, result):
+            s.set(bytes_out=_size(result))
+            for observer in _tool_observers:
+                observer(name, args, kwargs, result)
+            return result
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, "tool", bytes_in=sum(map(_size, args)) + sum(map(_size, kwargs.values()))) as s:
+                    return finish(s, args, kwargs, await fn(*args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, "tool", bytes_in=sum(map(_size, args)) + sum(map(_size, kwargs.values()))) as s:
+                return finish(s, args, kwargs, fn(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def record_llm_response(current, request, response):
+    """Adds model, token usage, bytes and cache state of an LLM HTTP exchange to ``current``."""
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        body = {}
+    # the routing transport records the model the request was actually sent to
+    model = current.attrs.get("model") or body.get("model")
+    current.name = model or current.name
+    current.set(model=model, status_code=response.status_code, bytes_in=len(request.content or b""),
+                cache=response.headers.get("x-llm-cache"))
+    try:
+        usage = response.json().get("usage")
+    except ValueError:
+        usage = None
+    current.set(bytes_out=len(response.content))
+    prompt, completion = normalize_usage(usage)
+    current.set(prompt_tokens=prompt, completion_tokens=completion)
+
+
+def load_spans(path, run_id=None, instance=None):
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partially written line of a killed run
+            if run_id and record.get("run_id") != run_id:
+                continue
+            if instance is not None and record.get("instance") != instance:
+                continue
+            spans.append(record)
+    return spans
+
+
+def summarize_spans(spans):
+    """Aggregates spans per ``(kind, name)``, sorted by total time."""
+    groups = {}
+    for s in spans:
+        groups.setdefault((s["kind"], s["name"]), []).append(s)
+    rows = []
+    for (kind, name), items in groups.items():
+        durations = [s["duration"] for s in items]
+        rows.append({"kind": kind, "name": name, "n": len(items), "total": sum(durations),
+                     "p50": percentile(durations, 50), "p95": percentile(durations, 95),
+                     "errors": sum(1 for s in items if s["status"] != "ok"),
+                     "prompt_tokens": sum(s.get("prompt_tokens") or 0 for s in items),
+                     "completion_tokens": sum(s.get("completion_tokens") or 0 for s in items),
+                     "bytes_in": sum(s.get("bytes_in") or 0 for s in items),
+                     "bytes_out": sum(s.get("bytes_out") or 0 for s in items),
+                     "queue_wait": sum(s.get("queue_wait") or 0 for s in items),
+                     "max_queue_depth": max((s.get("queue_depth") or 0 for s in items), default=0),
+                     "retries": sum(s.get("retries") or 0 for s in items)})
+    rows.sort(key=lambda r: r["total"], reverse=True)
+    return rows
+
+
+def print_span_report(rows):
+    print(f"{'kind':<7}{'name':<22}{'n':>6}{'total s':>10}{'p50':>8}{'p95':>8}{'err':>5}"
+          f"{'prompt tok':>12}{'compl tok':>11}{'KB in':>9}{'KB out':>9}{'wait s':>8}{'depth':>6}{'retry':>6}")
+    for r in rows:
+        print(f"{r['kind']:<7}{r['name'][:21]:<22}{r['n']:>6}{r['total']:>10.1f}{r['p50']:>8.2f}{r['p95']:>8.2f}"
+              f"{r['errors']:>5}{r['prompt_tokens']:>12}{r['completion_tokens']:>11}"
+              f"{r['bytes_in'] / 1024:>9.1f}{r['bytes_out'] / 1024:>9.1f}"
+              f"{r['queue_wait']:>8.1f}{r['max_queue_depth']:>6}{r['retries']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a sweep trace")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--trace", default=TRACE_FILE)
+    parser.add_argument("--run", help="only spans of this run id")
+    parser.add_argument("--instance", type=int, help="only spans of this task index")
+    parser.add_argument("--json", action="store_true", help="print machine readable output")
+    args = parser.parse_args()
+    rows = summarize_spans(load_spans(args.trace, args.run, args.instance))
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_span_report(rows)
+
+
+if __name__ == "__main__":
+    main()
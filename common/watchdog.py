@@ -0,0 +1,251 @@
+"""Stall detection for agent runs.
+
+Every agent attempt has a ``Watch`` that sees its tool calls (through
+``traced_tool``) and its LLM requests (through the transport chain of
+``common/llm_client.py``). At every turn it looks for unproductive patterns
+since the last successful edit:
+
+- the same tool call with the same arguments ``WATCHDOG_REPEAT`` times,
+- the same file (or the same range of it) read ``WATCHDOG_REPEAT`` times,
+- still no change in the working tree after ``WATCHDOG_NO_DIFF_TURNS`` turns,
+- a prompt that grew ``WATCHDOG_GROWTH`` times over ``WATCHDOG_PATIENCE`` turns.
+
+On a stall the agents first get a nudge (a message appended to the request),
+if the same stall still holds ``WATCHDOG_PATIENCE`` or more turns later the
+request is routed to the strong model, and after another ``WATCHDOG_PATIENCE``
+turns every request is answered with a final answer. A repeated call or read
+only holds while the agent keeps repeating it. An aborted attempt without changes
+ends the instance with status ``stalled`` and the reason as error, instead of
+running into ``max_turns`` or the timeout; with ``--speculate`` that happens
+when every attempt was aborted without changes. Any successful edit resets the watch.
+``WATCHDOG=off`` disables it.
+"""
+import contextvars
+import json
+import os
+import subprocess
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from common.tracing import current_span, observe_tools
+
+WATCHDOG = os.environ.get("WATCHDOG", "on") != "off"
+WATCHDOG_REPEAT = int(os.environ.get("WATCHDOG_REPEAT", "3"))
+WATCHDOG_NO_DIFF_TURNS = int(os.environ.get("WATCHDOG_NO_DIFF_TURNS", "15"))
+WATCHDOG_GROWTH = float(os.environ.get("WATCHDOG_GROWTH", "2.0"))
+WATCHDOG_PATIENCE = int(os.environ.get("WATCHDOG_PATIENCE", "4"))
+
+NUDGE = ("Note from the supervisor: {reason}. You are not making progress. Stop exploring, make the change "
+         "to the files now with the edit tools, or give your final answer if you cannot fix the problem.")
+ABORT_ANSWER = ("Thought: I am not making progress on this task.\n"
+                "Final Answer: Stopped, no progress ({reason}).")
+
+_EDIT_TOOLS = ("edit", "write", "diff", "patch")
+_ERROR_PREFIXES = ("fehler", "error", "edit failed", "patch failed", "file not found", "directory not found")
+
+_watch = contextvars.ContextVar("watch", default=None)
+
+
+class StalledError(RuntimeError):
+    pass
+
+
+_RANGE_KEYS = ("start_line", "end_line", "start_byte", "end_byte", "cursor")
+
+
+def _reads(args, kwargs):
+    """``(path, range)`` of every file a read tool call reads; paging through a file reads other ranges."""
+    targets = []
+
+    def visit(value):
+        if hasattr(value, "model_dump"):
+            value = value.model_dump()
+        if isinstance(value, dict):
+            if isinstance(value.get("path"), str):
+                span = tuple(value.get(k) for k in _RANGE_KEYS)
+                targets.append((os.path.normpath(value["path"]), span if any(v is not None for v in span) else None))
+            else:
+                for v in value.values():
+                    visit(v)
+        elif isinstance(value, (list, tuple)):
+            for v in value:
+                visit(v)
+
+    if args and isinstance(args[0], str):  # read_file(path, start_line, ...) called with positional arguments
+        visit({**dict(zip(("path", *_RANGE_KEYS), args)), **kwargs})
+    else:
+        visit([*args, kwargs])
+    return targets
+
+
+def _canonical(args, kwargs):
+    def plain(value):
+        return value.model_dump() if hasattr(value, "model_dump") else value
+    return json.dumps([[plain(a) for a in args], {k: plain(v) for k, v in kwargs.items()}],
+                      sort_keys=True, default=str)
+
+
+class Watch:
+    """Progress of one agent attempt in ``repo_dir``."""
+
+    def __init__(self, instance, repo_dir):
+        self.instance = instance
+        self.repo_dir = repo_dir
+        self.turns = 0
+        self.level = 0  # 0 watching, 1 nudged, 2 escalated, 3 aborted
+        self.level_turn = 0
+        self.reason = None
+        self.condition = None  # the stall the current level is about
+        self._calls = Counter()
+        self._reads = Counter()
+        self._recent = set()  # keys of ``_calls`` and ``_reads`` counted since the last request
+        self._edit_turn = 0
+        self._edit_tokens = None
+        self._edits = 0
+        self._tree_clean = None  # result of the last background ``git status`` since the last edit
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def aborted(self):
+        return self.level >= 3
+
+    @property
+    def escalated(self):
+        return self.level >= 2
+
+    def tool_call(self, name, args, kwargs, result):
+        failed = isinstance(result, str) and result.strip().lower().startswith(_ERROR_PREFIXES)
+        with self._lock:
+            if any(word in name for word in _EDIT_TOOLS) and not failed:
+                self._calls.clear()
+                self._reads.clear()
+                self._recent.clear()
+                self._edit_turn, self._edit_tokens = self.turns, None
+                self._edits, self._tree_clean = self._edits + 1, None
+                self.level, self.reason, self.condition = 0, None, None
+                return
+            call = (name, _canonical(args, kwargs))
+            self._calls[call] += 1
+            self._recent.add(("call", call))
+            if "read" in name:
+                for target in _reads(args, kwargs):
+                    self._reads[target] += 1
+                    self._recent.add(("read", target))
+
+    def _clean_tree(self):
+        try:
+            status = subprocess.run(["git", "status", "--porcelain"], cwd=self.repo_dir, capture_output=True,
+                                    text=True, timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            return False
+        return status.returncode == 0 and not status.stdout.strip()
+
+    def _probe_tree(self):
+        """Checks the working tree in a thread, requests run on the event loop of openai-agents."""
+        if self._probing:
+            return
+        self._probing, edits = True, self._edits
+
+        def probe():
+            clean = self._clean_tree()
+            with self._lock:
+                if self._edits == edits:
+                    self._tree_clean = clean
+                self._probing = False
+        threading.Thread(target=probe, daemon=True).start()
+
+    def _stall(self, tokens):
+        """Returns ``(condition, reason)`` of a stall that still holds in this turn, or None.
+
+        Repeated calls and reads only count if the agent repeated them again since the last request. If
+        several stalls hold, the one the watch already reacted to comes first.
+        """
+        stalls = []
+        recent, self._recent = self._recent, set()
+        repeats = [(self._calls[key], key) for kind, key in recent if kind == "call"]
+        count, call = max(repeats, default=(0, None), key=lambda r: r[0])
+        if count >= WATCHDOG_REPEAT:
+            stalls.append((("call", call), f"called {call[0]} {count} times with the same arguments"))
+        reads = [(self._reads[key], key) for kind, key in recent if kind == "read"]
+        count, target = max(reads, default=(0, None), key=lambda r: r[0])
+        if count >= WATCHDOG_REPEAT:
+            part = "" if target[1] is None else " (same range)"
+            stalls.append((("read", target),
+                           f"read {os.path.basename(target[0])}{part} {count} times without changing anything"))
+        idle = self.turns - self._edit_turn
+        if self._edit_tokens is None:
+            self._edit_tokens = tokens
+        if idle >= WATCHDOG_PATIENCE and tokens >= WATCHDOG_GROWTH * self._edit_tokens:
+            stalls.append((("growth",),
+                           f"the conversation grew from {self._edit_tokens} to {tokens} tokens without an edit"))
+        # the tree is probed one turn ahead, so the request never waits for git
+        ahead = self.turns + 1 - WATCHDOG_NO_DIFF_TURNS
+        if ahead >= 0 and idle + 1 >= WATCHDOG_NO_DIFF_TURNS and ahead % WATCHDOG_PATIENCE == 0:
+            self._probe_tree()
+        if (self.turns >= WATCHDOG_NO_DIFF_TURNS and idle >= WATCHDOG_NO_DIFF_TURNS
+                and (self.turns - WATCHDOG_NO_DIFF_TURNS) % WATCHDOG_PATIENCE == 0 and self._tree_clean):
+            stalls.append((("no diff",), f"no change in the working tree after {self.turns} turns"))
+        stalls.sort(key=lambda stall: stall[0] != self.condition)
+        return stalls[0] if stalls else None
+
+    def on_request(self, tokens):
+        """Called before every LLM request; returns None, ``("nudge", reason)`` or ``("abort", reason)``."""
+        with self._lock:
+            self.turns += 1
+            if self.aborted:
+                return "abort", self.reason
+            stall = self._stall(tokens)
+            if stall is None:
+                return None
+            condition, reason = stall
+            if self.level == 0:
+                self.level, self.level_turn, self.reason, self.condition = 1, self.turns, reason, condition
+                action = "nudge"
+            elif condition != self.condition:
+                # another stall, its patience window starts now
+                self.level_turn, self.reason, self.condition = self.turns, reason, condition
+                return None
+            elif self.turns - self.level_turn >= WATCHDOG_PATIENCE:
+                self.level, self.level_turn, self.reason = self.level + 1, self.turns, reason
+                action = "abort" if self.aborted else "escalate"
+            else:
+                return None
+        print(f"[watchdog] instance {self.instance}: {reason} (turn {self.turns}, {action})")
+        current = current_span()
+        if current:
+            current.set(stall=reason, stall_action=action)
+        return action, reason
+
+    def check(self):
+        """Raises ``StalledError`` if the attempt was aborted and left the working tree unchanged."""
+        if self.aborted and self._clean_tree():
+            raise StalledError(f"stalled after {self.turns} turns: {self.reason}")
+
+
+@contextmanager
+def watch(instance, repo_dir):
+    """Watches the agent run in the enclosed block."""
+    if not WATCHDOG:
+        yield None
+        return
+    current = Watch(instance, repo_dir)
+    token = _watch.set(current)
+    try:
+        yield current
+    finally:
+        _watch.reset(token)
+
+
+def current_watch():
+    return _watch.get()
+
+
+def _observe(name, args, kwargs, result):
+    current = _watch.get()
+    if current is not None:
+        current.tool_call(name, args, kwargs, result)
+
+
+observe_tools(_observe)
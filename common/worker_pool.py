@@ -0,0 +1,91 @@
+"""Runs the agent stage of every instance in a pool of worker processes.
+
+With ``--processes N`` the pipeline keeps fetching, checking out, evaluating
+and logging in the parent, but hands each checked-out instance to one of N
+worker processes (``spawn``, so no state of the parent's event loop or threads
+is inherited). The worker indexes the checkout, localizes the issue, runs the
+agents (speculative attempts included) and scores them, so the CPU-bound work
+of concurrent instances runs on separate cores instead of sharing one GIL.
+Each instance's result is sent back as soon as it is finished and logged by
+the parent right away.
+
+Workers get the parent's workspace root and run id, write their spans to the
+same trace file and share the LLM rate limits evenly.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from common.repo_index import drop_index
+from common.results import normalize_usage
+from common.routing import current_route, route_context
+from common.speculative import speculative
+from common.tracing import init_worker_tracing, span
+from common.watchdog import StalledError, watch
+from common.workspace import set_workspace_root, workspace_root
+
+SWEEP_PROCESSES = int(os.environ.get("SWEEP_PROCESSES", "0"))
+
+
+def _init_worker(root, run_id, processes):
+    set_workspace_root(root)
+    init_worker_tracing(run_id)
+    from common.llm_client import llm_scheduler  # only workers that run agents need the LLM client
+    llm_scheduler().share(processes)
+
+
+async def _run(agent_stage, speculate, timeout, instance):
+    from common.pipeline import prepare_workspace
+    with span("worker", "stage", instance.index, pid=os.getpid()):
+        try:
+            await asyncio.to_thread(prepare_workspace, instance)
+            with route_context(instance.index, instance.attempt, instance.previous_failure) as route, \
+                    watch(instance.index, instance.repo_dir) as watching:
+                try:
+                    await asyncio.wait_for(speculative(agent_stage, speculate)(instance), timeout)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"Agent stage timed out after {timeout:.0f}s") from None
+                if watching is not None:
+                    await asyncio.to_thread(watching.check)
+        finally:
+            drop_index(instance.repo_dir)
+    prompt, completion = normalize_usage(instance.usage)
+    return {"agent_output": None if instance.agent_output is None else str(instance.agent_output),
+            "usage": {"prompt_tokens": prompt, "completion_tokens": completion},
+            "model": instance.model, "models": route.models, "candidates": instance.candidates}
+
+
+def _run_instance(agent_stage, speculate, timeout, instance):
+    """Entry point in the worker process, returns the fields set by the agent stage."""
+    return asyncio.run(_run(agent_stage, speculate, timeout, instance))
+
+
+class WorkerPool:
+    def __init__(self, agent_stage, processes, speculate=1, timeout=None, run_id=None):
+        self.agent_stage = agent_stage
+        self.speculate = speculate
+        self.timeout = timeout
+        self.executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker,
+                                            initargs=(workspace_root(), run_id, processes))
+
+    async def __call__(self, instance):
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor, _run_instance, self.agent_stage, self.speculate,
+                                                self.timeout, instance)
+        except TimeoutError:
+            instance.status = "timeout"
+            raise
+        except StalledError:
+            instance.status = "stalled"
+            raise
+        route = current_route()
+        if route is not None:
+            route.models |= result.pop("models")
+        for name, value in result.items():
+            setattr(instance, name, value)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
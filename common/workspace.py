@@ -0,0 +1,53 @@
+"""Workspace root for the paths the agents pass to the tools.
+
+The tools never depend on the process' working directory: absolute paths are
+used as they are, relative ones (``repos/repo_3/setup.py``) are resolved
+against the workspace root of the current instance. The root defaults to
+``WORKSPACE_ROOT`` or the directory the sweep was started in. It is a context
+variable, so every instance, worker thread and worker process has its own.
+"""
+import contextvars
+import os
+from contextlib import contextmanager
+
+WORKSPACE_ROOT = os.path.abspath(os.environ.get("WORKSPACE_ROOT") or os.getcwd())
+
+_root = contextvars.ContextVar("workspace_root", default=WORKSPACE_ROOT)
+
+
+def workspace_root():
+    return _root.get()
+
+
+def set_workspace_root(root):
+    """Sets the root for the current context, e.g. in the initializer of a worker process."""
+    _root.set(os.path.abspath(root))
+
+
+@contextmanager
+def workspace(root):
+    token = _root.set(os.path.abspath(root))
+    try:
+        yield _root.get()
+    finally:
+        _root.reset(token)
+
+
+def resolve(path):
+    """Absolute path of ``path``, relative paths are taken relative to the workspace root."""
+    if not path:
+        return path
+    path = os.path.expanduser(path)
+    return os.path.normpath(path if os.path.isabs(path) else os.path.join(_root.get(), path))
+
+
+def resolve_files(files):
+    """``resolve`` for the file lists of the batch tools: paths or dictionaries with a ``path``."""
+    resolved = []
+    for entry in files:
+        if isinstance(entry, dict) and isinstance(entry.get("path"), str):
+            entry = {**entry, "path": resolve(entry["path"])}
+        elif isinstance(entry, str):
+            entry = resolve(entry)
+        resolved.append(entry)
+    return resolved
@@ -4,6 +4,7 @@ from langchain.llms import OpenAI, Ollama
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 from customTools import FileTools
+from common.llm_client import LLM_API_KEY, LLM_BASE_URL, llm_async_http_client, llm_http_client
 
 
 # This is an example of how to define custom agents.
@@ -22,14 +23,20 @@ class CustomAgents:
        self.GPT4O_Proxy = ChatOpenAI(
            model_name="gpt-4o",
            temperature=0.7,
-           openai_api_base="http://188.245.32.59:4000/v1",
-           openai_api_key="sk-"
+           openai_api_base=LLM_BASE_URL,
+           openai_api_key=LLM_API_KEY,
+           http_client=llm_http_client(),
+           http_async_client=llm_async_http_client(),
+           max_retries=0  # retried with backoff by common/rate_limit.py
        )
        self.GPT4OMINI_Proxy = ChatOpenAI(
            model_name="gpt-4o-mini",
            temperature=0.7,
-           openai_api_base="http://188.245.32.59:4000/v1",
-           openai_api_key="sk-"
+           openai_api_base=LLM_BASE_URL,
+           openai_api_key=LLM_API_KEY,
+           http_client=llm_http_client(),
+           http_async_client=llm_async_http_client(),
+           max_retries=0  # retried with backoff by common/rate_limit.py
        )
 
     def plannerAgent(self):
@@ -40,7 +47,9 @@ class CustomAgents:
             You have also many experience in coding.
             """),
             goal=dedent(f"""Breakdown a Problem into coding tasks to fix the Problem"""),
-            tools=[FileTools.read_file, FileTools.write_file, FileTools.git_add],
+            tools=[FileTools.read_file, FileTools.read_files, FileTools.read_file_range, FileTools.file_outline,
+                   FileTools.find_files, FileTools.grep_code, FileTools.find_definition,
+                   FileTools.edit_file, FileTools.edit_files, FileTools.apply_diff, FileTools.write_file, FileTools.git_add],
             allow_delegation=False,
             verbose=True,
             llm=self.GPT4O_Proxy,
@@ -57,7 +66,9 @@ class CustomAgents:
             Write the actual Code to fix the Problem to the codefiles. 
             Make sure the fix is minimal and only touches what's necessary to resolve the failing tests.
             """),
-            tools=[FileTools.read_file, FileTools.write_file, FileTools.git_add],
+            tools=[FileTools.read_file, FileTools.read_files, FileTools.read_file_range, FileTools.file_outline,
+                   FileTools.find_files, FileTools.grep_code, FileTools.find_definition,
+                   FileTools.edit_file, FileTools.edit_files, FileTools.apply_diff, FileTools.write_file, FileTools.git_add],
             allow_delegation=False,
             verbose=True,
             llm=self.GPT4OMINI_Proxy,
@@ -75,7 +86,10 @@ class CustomAgents:
             Ensure that the code does the job that it is supposed to do and fixes the Problem. 
             The fix will be verified by running the affected tests.
             """),
-            tools=[FileTools.read_file, FileTools.write_file, FileTools.git_add],
+            tools=[FileTools.read_file, FileTools.read_files, FileTools.read_file_range, FileTools.file_outline,
+                   FileTools.find_files, FileTools.grep_code, FileTools.find_definition,
+                   FileTools.edit_file, FileTools.edit_files, FileTools.apply_diff, FileTools.write_file, FileTools.run_tests,
+                   FileTools.git_add],
             allow_delegation=False,
             verbose=True,
             llm=self.GPT4OMINI_Proxy,
@@ -1,31 +1,106 @@
 from langchain.tools import tool
-import subprocess
 import os
 
+from common.edit_ops import EditError
+from common.repo_index import format_definitions, format_grep
+from common.routing import note_test_result
+from common.sandbox_tests import TEST_TIMEOUT, format_test_run, run_tests
+from common.tool_server import tools
+from common.tracing import traced_tool
+from common.workspace import resolve, resolve_files
+
 class FileTools:
 
     @tool("Read a file from the local filesystem")
+    @traced_tool("read_file")
     def read_file(path: str) -> str:
         """
         Reads the content of a file. The path must be relative or absolute.
         Useful for viewing the current status of a code file or configuration file.
         Make sure that you add the path given bevor with directory to the filepath.
         example: '{repository path}/{path to the file inside the repository}'
+        Large files are cut off; read the rest with the ranged read tool and the cursor given at the end.
         """
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return f.read()
+            return tools().read(resolve(path))
+        except FileNotFoundError:
+            return f"Fehler: Datei nicht gefunden: {path}"
+        except Exception as e:
+            return f"Fehler beim Lesen der Datei: {str(e)}"
+
+    @tool("Read a part of a file from the local filesystem")
+    @traced_tool("read_file_range")
+    def read_file_range(data: dict) -> str:
+        """Reads only a slice of a file. Use the outline tool first to find the lines you need.
+        Expects a dictionary with:
+        - 'path': path to the file, including the repository path.
+        - 'start_line' / 'end_line': line range, 1-based and inclusive (optional).
+        - 'start_byte' / 'end_byte': byte range instead of lines (optional).
+        - 'cursor': continuation cursor from a previous truncated read, e.g. 'line:400' (optional).
+
+        example:
+        {
+            "path": "{repository path}/django/db/models/query.py",
+            "start_line": 120,
+            "end_line": 180
+        }
+        """
+        path = data.get("path")
+        if not path:
+            return "Fehler: 'path' muss angegeben sein."
+        try:
+            return tools().read(resolve(path), data.get("start_line"), data.get("end_line"),
+                                data.get("start_byte"), data.get("end_byte"), data.get("cursor"))
+        except FileNotFoundError:
+            return f"Fehler: Datei nicht gefunden: {path}"
+        except Exception as e:
+            return f"Fehler beim Lesen der Datei: {str(e)}"
+
+    @tool("Read several files at once")
+    @traced_tool("read_files")
+    def read_files(data: dict) -> str:
+        """Reads several files or parts of files in one call, much faster than reading them one by one.
+        Expects a dictionary with:
+        - 'files': list of paths (including the repository path) or of dictionaries with 'path' and
+          optionally 'start_line' / 'end_line' or 'cursor' like the ranged read tool.
+
+        example:
+        {
+            "files": ["{repository path}/setup.py",
+                      {"path": "{repository path}/django/db/models/query.py", "start_line": 120, "end_line": 180}]
+        }
+        """
+        files = data.get("files")
+        if not files:
+            return "Fehler: 'files' muss angegeben sein."
+        try:
+            return tools().read_many(resolve_files(files))
+        except Exception as e:
+            return f"Fehler beim Lesen der Dateien: {str(e)}"
+
+    @tool("List the classes and functions of a file")
+    @traced_tool("file_outline")
+    def file_outline(path: str) -> str:
+        """
+        Returns the outline of a code file: every class and function with its line numbers.
+        Much cheaper than reading the whole file, use it to decide which lines to read.
+        example: '{repository path}/{path to the file inside the repository}'
+        """
+        try:
+            return tools().outline(resolve(path))
         except FileNotFoundError:
             return f"Fehler: Datei nicht gefunden: {path}"
         except Exception as e:
             return f"Fehler beim Lesen der Datei: {str(e)}"
 
     @tool("Write content to a file on the local filesystem")
+    @traced_tool("write_file")
     def write_file(data: dict) -> str:
         """Writes content to a file.
         Expects a dictionary with:
         - 'path': path to the file. Make sure that you add the path given bevor with directory to the filepath.
         - 'content': content of the file, attention the file will be completely replaced
+        Only use this for new files. To change an existing file use the edit tool, it is much cheaper.
 
         example:
         {
@@ -39,49 +114,195 @@ class FileTools:
             return "Fehler: 'path' und 'content' müssen angegeben sein."
 
         try:
-            with open(path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            tools().write(resolve(path), content)
             return f"Inhalt erfolgreich in {path} geschrieben."
         except Exception as e:
             return f"Fehler beim Schreiben in die Datei: {str(e)}"
 
+    @tool("Edit a file with search and replace")
+    @traced_tool("edit_file")
+    def edit_file(data: dict) -> str:
+        """Changes parts of an existing file without rewriting it.
+        Expects a dictionary with:
+        - 'path': path to the file, including the repository path.
+        - 'edits': list of hunks, each with 'search' (exact text from the file, unique, with a few lines
+          of context) and 'replace' (the new text).
+        All hunks are applied or none. Python files must still compile, otherwise nothing is written.
+
+        example:
+        {
+            "path": "{repository path}/src/module.py",
+            "edits": [{"search": "    return a + b", "replace": "    return a - b"}]
+        }
+        """
+        path = data.get("path")
+        edits = data.get("edits")
+        if not path or not edits:
+            return "Fehler: 'path' und 'edits' müssen angegeben sein."
+        try:
+            return tools().edit(resolve(path), edits)
+        except EditError as e:
+            return f"Fehler, nichts geändert: {e}"
+        except Exception as e:
+            return f"Fehler beim Bearbeiten der Datei: {str(e)}"
+
+    @tool("Edit several files with search and replace")
+    @traced_tool("edit_files")
+    def edit_files(data: dict) -> str:
+        """Changes several existing files in one call, all files or none.
+        Expects a dictionary with:
+        - 'files': list of dictionaries with 'path' (including the repository path) and 'edits' like the edit tool.
+
+        example:
+        {
+            "files": [
+                {"path": "{repository path}/src/a.py", "edits": [{"search": "old line", "replace": "new line"}]},
+                {"path": "{repository path}/src/b.py", "edits": [{"search": "foo(1)", "replace": "foo(2)"}]}
+            ]
+        }
+        """
+        files = data.get("files")
+        if not files:
+            return "Fehler: 'files' muss angegeben sein."
+        try:
+            return tools().edit_many(resolve_files(files))
+        except EditError as e:
+            return f"Fehler, nichts geändert: {e}"
+        except Exception as e:
+            return f"Fehler beim Bearbeiten der Dateien: {str(e)}"
+
+    @tool("Apply a unified diff to a repository")
+    @traced_tool("apply_diff")
+    def apply_diff(data: dict) -> str:
+        """Applies a patch in unified diff format (like `git diff` output) to the repository.
+        Expects a dictionary with:
+        - 'repo_path': path to the Git repository (e.g. 'repos/repo_{number}')
+        - 'patch': the unified diff, file paths relative to the repository
+        The patch is applied to all files or to none.
+        """
+        repo_path = data.get("repo_path")
+        patch = data.get("patch")
+        if not repo_path or not patch:
+            return "Fehler: 'repo_path' und 'patch' müssen angegeben sein."
+        try:
+            return tools().patch(resolve(repo_path), patch)
+        except EditError as e:
+            return f"Fehler, nichts geändert: {e}"
+        except Exception as e:
+            return f"Fehler beim Anwenden des Patches: {str(e)}"
+
+    @tool("Find files in a repository")
+    @traced_tool("find_files")
+    def find_files(data: dict) -> str:
+        """Finds files by name or glob pattern using the repository index (fast, ranked).
+        Expects a dictionary with:
+        - 'repo_path': path to the Git repository (e.g. 'repos/repo_{number}')
+        - 'pattern': file name or glob, e.g. 'query.py', '*.py' or 'django/db/*/query*.py'
+        """
+        repo_path = data.get("repo_path")
+        pattern = data.get("pattern")
+        if not repo_path or not pattern:
+            return "Fehler: 'repo_path' und 'pattern' müssen angegeben sein."
+        try:
+            matches, total = tools().glob(resolve(repo_path), pattern)
+        except Exception as e:
+            return f"Fehler bei der Suche: {str(e)}"
+        if not matches:
+            return f"Keine Datei gefunden für: {pattern}"
+        result = "\n".join(os.path.join(repo_path, m) for m in matches)
+        if total > len(matches):
+            result += f"\n[{len(matches)} von {total} Treffern]"
+        return result
+
+    @tool("Search the code of a repository")
+    @traced_tool("grep_code")
+    def grep_code(data: dict) -> str:
+        """Searches the content of all files of the repository and returns matching lines ranked by file.
+        Expects a dictionary with:
+        - 'repo_path': path to the Git repository (e.g. 'repos/repo_{number}')
+        - 'query': text to search for
+        - 'regex': true if the query is a regular expression (optional)
+        - 'path_glob': only search files matching this glob, e.g. '*.py' (optional)
+        """
+        repo_path = data.get("repo_path")
+        query = data.get("query")
+        if not repo_path or not query:
+            return "Fehler: 'repo_path' und 'query' müssen angegeben sein."
+        try:
+            hits, total, files = tools().grep(resolve(repo_path), query, bool(data.get("regex")),
+                                              path_glob=data.get("path_glob"))
+            return format_grep(hits, total, files, repo_path)
+        except Exception as e:
+            return f"Fehler bei der Suche: {str(e)}"
+
+    @tool("Find where a class or function is defined")
+    @traced_tool("find_definition")
+    def find_definition(data: dict) -> str:
+        """Looks up where a class, function or method is defined, e.g. 'QuerySet' or 'QuerySet.filter'.
+        Expects a dictionary with:
+        - 'repo_path': path to the Git repository (e.g. 'repos/repo_{number}')
+        - 'name': name of the class or function
+        """
+        repo_path = data.get("repo_path")
+        name = data.get("name")
+        if not repo_path or not name:
+            return "Fehler: 'repo_path' und 'name' müssen angegeben sein."
+        try:
+            return format_definitions(tools().definition(resolve(repo_path), name), name, repo_path)
+        except Exception as e:
+            return f"Fehler bei der Suche: {str(e)}"
+
+    @tool("Run tests of the repository")
+    @traced_tool("run_tests")
+    def run_tests(data: dict) -> str:
+        """Runs selected tests in the repository in parallel and returns a summary with the failures only.
+        Use it to verify a fix before finishing, e.g. with the failing tests named in the task.
+        Expects a dictionary with:
+        - 'repo_path': path to the Git repository (e.g. 'repos/repo_{number}')
+        - 'tests': list of test ids, e.g. ["tests/test_x.py::TestA::test_b"] or ["test_b (app.tests.TestA)"]
+        - 'timeout': seconds until the test run is aborted (optional)
+        """
+        repo_path = data.get("repo_path")
+        tests = data.get("tests")
+        if isinstance(tests, str):
+            tests = [t for t in tests.splitlines() if t.strip()]
+        if not repo_path or not tests:
+            return "Fehler: 'repo_path' und 'tests' müssen angegeben sein."
+        try:
+            timeout = float(data.get("timeout") or TEST_TIMEOUT)
+            run = run_tests(resolve(repo_path), tests, timeout=timeout)
+            note_test_result(bool(run.failed or run.timed_out))
+            return format_test_run(run)
+        except Exception as e:
+            return f"Fehler beim Ausführen der Tests: {str(e)}"
+
     @tool("Execute git add command")
+    @traced_tool("git_add")
     def git_add(inputs: dict) -> str:
         """
-        Executes `git add` for a specific file or an entire folder.
-        Useful if an agent has changed a file and wants to prepare it for a commit.
+        Executes `git add` for one file or an explicit list of files in a single call (deleted files included).
+        Useful if an agent has changed files and wants to prepare them for a commit.
 
         Input:
             {
                 "repo_path": "Path to the Git repository (e.g. '/repos/repo_{number}')",
-                "file_path": "Path to the file relative to repo_path (e.g. 'src/main.py')"
+                "file_paths": ["Paths of the files relative to repo_path (e.g. 'src/main.py')"]
             }
+        'file_path' with a single path is accepted as well.
 
         Output:
             Success message or error message in the event of problems.
         """
+        repo_path = inputs.get("repo_path")
+        file_paths = inputs.get("file_paths") or ([inputs["file_path"]] if inputs.get("file_path") else [])
+        if isinstance(file_paths, str):
+            file_paths = [file_paths]
+        if not repo_path or not file_paths:
+            return "Fehler: repo_path und file_paths müssen angegeben werden."
         try:
-            repo_path = inputs.get("repo_path")
-            file_path = inputs.get("file_path")
-
-            if not repo_path or not file_path:
-                return "Fehler: repo_path und file_path müssen angegeben werden."
-
-            abs_repo_path = os.path.abspath(repo_path)
-            full_file_path = os.path.join(abs_repo_path, file_path)
-
-            if not os.path.exists(full_file_path):
-                return f"Fehler: Datei existiert nicht: {full_file_path}"
-
-            subprocess.run(
-                ["git", "add", file_path],
-                cwd=abs_repo_path,
-                check=True
-            )
-
-            return f"Datei erfolgreich zur Git-Staging-Area hinzugefügt: {file_path}"
-
-        except subprocess.CalledProcessError as e:
+            staged = tools().stage(resolve(repo_path), file_paths)
+            return f"Dateien erfolgreich zur Git-Staging-Area hinzugefügt: {', '.join(staged)}"
+        except ValueError as e:
             return f"Fehler beim Ausführen von git add: {e}"
         except Exception as e:
             return f"Unerwarteter Fehler: {str(e)}"
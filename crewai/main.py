@@ -1,25 +1,31 @@
 import os
+import sys
 import asyncio
-import json
 import re
 
-import requests
-import subprocess
-
 from crewai import Agent, Task, Crew, Process
 
 from textwrap import dedent
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 from agents import CustomAgents
 from tasks import CustomTasks
+from common.http_client import close_shared_client
+from common.localize import format_candidates
+from common.pipeline import Pipeline
+from common.runner import parse_sweep_args
 
 
-API_URL = "http://localhost:8081/task/index/"  # API endpoint for SWE-Bench-Lite
-LOG_FILE = "results.log"
+RESULTS_DB = "results.db"
 
 class FixCrew:
-    def __init__(self, directory, issue):
+    def __init__(self, directory, issue, tests=(), candidates=""):
         self.directory = directory
         self.issue = issue
+        self.tests = tests
+        self.candidates = candidates
+        self.usage_metrics = None
+        self.model = None
 
     def run(self):
         # Define your custom agents and tasks in agents.py and tasks.py
@@ -30,12 +36,14 @@ class FixCrew:
         plannerAgent = agents.plannerAgent()
         coderAgent = agents.coderAgent()
         testAgent = agents.testAgent()
+        self.model = ",".join(sorted({agent.llm.model_name for agent in (plannerAgent, coderAgent, testAgent)}))
 
         # Custom tasks include agent name and variables as input
         planFix = tasks.planFix(
             plannerAgent,
             self.directory,
             self.issue,
+            self.candidates,
         )
 
         implementFix = tasks.implementFix(
@@ -48,6 +56,7 @@ class FixCrew:
             testAgent,
             self.directory,
             self.issue,
+            self.tests,
         )
 
         # Define your custom crew here
@@ -58,99 +67,36 @@ class FixCrew:
         )
 
         result = crew.kickoff()
+        self.usage_metrics = getattr(crew, "usage_metrics", None)
         return result
 
 
-async def handle_task(index):
-    api_url = f"{API_URL}{index}"
-    print(f"Fetching test case {index} from {api_url}...")
-    repo_dir = os.path.join("repos", f"repo_{index}")  # Use unique repo directory per task
-    start_dir = os.getcwd()  # Remember original working directory
+async def handle_task(instance):
+    # crew.kickoff() is synchronous, run it in a worker thread so other instances keep going
+    fixCrew = FixCrew(instance.repo_dir, instance.issue, instance.fail_tests,
+                      format_candidates(instance.candidates, instance.repo_dir))
+    instance.agent_output = await asyncio.to_thread(fixCrew.run)
+    instance.usage = fixCrew.usage_metrics
+    instance.model = fixCrew.model
+    print(instance.agent_output)
+
 
+async def main(args):
     try:
-        response = requests.get(api_url)
-        if response.status_code != 200:
-            raise Exception(f"Invalid response: {response.status_code}")
-
-        testcase = response.json()
-        issue = testcase["Problem_statement"]
-        git_clone = testcase["git_clone"]
-        fail_tests = json.loads(testcase.get("FAIL_TO_PASS", "[]"))
-        pass_tests = json.loads(testcase.get("PASS_TO_PASS", "[]"))
-        instance_id = testcase["instance_id"]
-
-        # Extract repo URL and commit hash
-        parts = git_clone.split("&&")
-        clone_part = parts[0].strip()
-        checkout_part = parts[-1].strip() if len(parts) > 1 else None
-
-        repo_url = clone_part.split()[2]
-
-        print(f"Cloning repository {repo_url} into {repo_dir}...")
-        env = os.environ.copy()
-        env["GIT_TERMINAL_PROMPT"] = "0"
-        subprocess.run(["git", "clone", repo_url, repo_dir], check=True, env=env)
-
-        if checkout_part:
-            commit_hash = checkout_part.split()[-1]
-            print(f"Checking out commit: {commit_hash}")
-            subprocess.run(["git", "checkout", commit_hash], cwd=repo_dir, check=True, env=env)
-
-        fixCrew = FixCrew(repo_dir, issue)
-        result = fixCrew.run()
-        print(result)
-
-        print(f"Calling SWE-Bench REST service with repo: {repo_dir}")
-        test_payload = {
-            "instance_id": instance_id,
-            "repoDir": f"/repos/repo_{index}",  # mount with docker
-            "FAIL_TO_PASS": fail_tests,
-            "PASS_TO_PASS": pass_tests
-        }
-        res = requests.post("http://localhost:8082/test", json=test_payload)
-        res.raise_for_status()
-        result_raw = res.json().get("harnessOutput", "{}")
-        result_json = json.loads(result_raw)
-        if not result_json:
-            raise ValueError("No data in harnessOutput – possible evaluation error or empty result")
-        instance_id = next(iter(result_json))
-        tests_status = result_json[instance_id]["tests_status"]
-        fail_pass_results = tests_status["FAIL_TO_PASS"]
-        fail_pass_total = len(fail_pass_results["success"]) + len(fail_pass_results["failure"])
-        fail_pass_passed = len(fail_pass_results["success"])
-        pass_pass_results = tests_status["PASS_TO_PASS"]
-        pass_pass_total = len(pass_pass_results["success"]) + len(pass_pass_results["failure"])
-        pass_pass_passed = len(pass_pass_results["success"])
-
-        # Log results
-        os.chdir(start_dir)
-        with open(LOG_FILE, "a", encoding="utf-8") as log:
-            log.write(f"\n--- TESTCASE {index} ---\n")
-            log.write(f"FAIL_TO_PASS passed: {fail_pass_passed}/{fail_pass_total}\n")
-            log.write(f"PASS_TO_PASS passed: {pass_pass_passed}/{pass_pass_total}\n")
-        print(f"Test case {index} completed and logged.")
-
-    except Exception as e:
-        os.chdir(start_dir)
-        with open(LOG_FILE, "a", encoding="utf-8") as log:
-            log.write(f"\n--- TESTCASE {index} ---\n")
-            log.write(f"Error: {e}\n")
-        print(f"Error in test case {index}: {e}")
-
-    except Exception as e:
-        os.chdir(start_dir)
-        with open(LOG_FILE, "a", encoding="utf-8") as log:
-            log.write(f"\n--- TESTCASE {index} ---\n")
-            log.write(f"Error: {e}\n")
-        print(f"Error in test case {index}: {e}")
+        pipeline = Pipeline(handle_task, "crewai", RESULTS_DB, concurrency=args.concurrency, timeout=args.timeout,
+                            prefetch=args.prefetch, eval_workers=args.eval_workers, run_id=args.resume,
+                            attempts=args.attempts, speculate=args.speculate,
+                            processes=args.processes)
+        await pipeline.run(range(args.start, args.end + 1))
+    finally:
+        await close_shared_client()
 
 
 # This is the main function that you will use to run your custom crew.
 if __name__ == "__main__":
     print("## Welcome to Crew AI Template")
     print("-------------------------------")
-    for i in range(1, 31):
-        print(i)
-        asyncio.run(handle_task(i))
+    args = parse_sweep_args(1, 30)
+    asyncio.run(main(args))
 
 
@@ -1,6 +1,7 @@
 # To know more about the Task class, visit: https://docs.crewai.com/concepts/tasks
 from crewai import Task
 from textwrap import dedent
+import json
 
 
 class CustomTasks:
@@ -28,7 +29,7 @@ class CustomTasks:
         )
 
 
-    def planFix(self, agent, directory, issue):
+    def planFix(self, agent, directory, issue, candidates=""):
         return Task(
             description=dedent(
                 f"""
@@ -40,6 +41,9 @@ class CustomTasks:
             - issue: {issue}
             - directory: {directory}
 
+            Start by reading the most promising of these locations (several at once with the batch read tool):
+            {candidates or "No candidates found, search the repository."}
+
             {self.__tip_section()}
             """
             ),
@@ -60,6 +64,8 @@ class CustomTasks:
 
             **Notes**
             - The fix should be minimally invasive.
+            - Change existing files with the edit tool, only write complete files for new files.
+            - Read or edit several files in one step with the batch tools, and stage all changed files with one git add.
             - No unnecessary formatting or restructuring.
             - All changes must be syntactically correct and testable.
             - The changed files musst be added to git via git add
@@ -71,7 +77,7 @@ class CustomTasks:
             agent=agent,
         )
 
-    def reviewFix(self, agent, directory, issue):
+    def reviewFix(self, agent, directory, issue, tests=()):
         return Task(
             description=dedent(
                 f"""
@@ -86,7 +92,8 @@ class CustomTasks:
             You can understand the bug as follows: 
             `{issue}`
 
-            If possible, run automated tests (`pytest` or other relevant frameworks) and provide feedback.
+            Run the failing tests with the test tool and provide feedback. If tests fail, fix the code and run them again.
+            Tests that must pass after the fix: {json.dumps(list(tests))}
 
             {self.__tip_section()}
             """
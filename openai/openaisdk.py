@@ -1,39 +1,107 @@
 from agents import Agent, Runner, function_tool
 import os
-import subprocess
+import sys
 import asyncio
 import json
-import requests
 from dotenv import load_dotenv
 from agents import set_default_openai_client, set_default_openai_key, set_tracing_disabled
 from openai import AsyncOpenAI
+from pydantic import BaseModel
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.edit_ops import EditError
+from common.http_client import close_shared_client
+from common.localize import format_candidates
+from common.llm_client import LLM_API_KEY, LLM_BASE_URL, llm_async_http_client
+from common.repo_index import find_repo_root, format_definitions, format_grep
+from common.routing import note_test_result
+from common.sandbox_tests import TEST_TIMEOUT, format_test_run, run_tests as run_test_subset
+from common.tool_server import tools
+from common.tracing import traced_tool
+from common.workspace import resolve, resolve_files
+from common.pipeline import Pipeline
+from common.runner import parse_sweep_args
 
-API_URL = "http://localhost:8081/task/index/"  # API endpoint for SWE-Bench-Lite
-LOG_FILE = "results.log"
+
+RESULTS_DB = "results.db"
 
 set_tracing_disabled(True)
-set_default_openai_key("sk-")
-custom_client = AsyncOpenAI(base_url="http://188.245.32.59:4000/v1", api_key="sk-")
+set_default_openai_key(LLM_API_KEY)
+# Retries with backoff happen in the rate limited transport (common/rate_limit.py)
+custom_client = AsyncOpenAI(base_url=LLM_BASE_URL, api_key=LLM_API_KEY, http_client=llm_async_http_client(),
+                            max_retries=0)
 set_default_openai_client(custom_client)
 
+# openai-agents runs sync tools on the event loop of the pipeline; every tool that reads, indexes or runs
+# git does that in a thread, so it does not block the other instances
+
 @function_tool()
-def read_file(path: str) -> str:
-    """Read the contents of a file.
+@traced_tool("read_file")
+async def read_file(path: str, start_line: int | None = None, end_line: int | None = None,
+              start_byte: int | None = None, end_byte: int | None = None, cursor: str | None = None) -> str:
+    """Read the contents of a file, or only a range of it. Large files are cut off,
+    continue reading with the cursor given at the end of the output.
 
         Args:
             path: The path to the file to read.
+            start_line: First line to read, 1-based (optional).
+            end_line: Last line to read, inclusive (optional).
+            start_byte: First byte to read, instead of a line range (optional).
+            end_byte: Byte offset to stop reading at (optional).
+            cursor: Continuation cursor of a previous truncated read, e.g. 'line:400' (optional).
         """
     print("filereader:" + path)
+    path = resolve(path)
+    if not os.path.exists(path):
+        return f"File not found: {path}"
+    try:
+        return await asyncio.to_thread(tools().read, path, start_line, end_line, start_byte, end_byte, cursor)
+    except ValueError as e:
+        return str(e)
+
+
+class FileRange(BaseModel):
+    path: str
+    start_line: int | None = None
+    end_line: int | None = None
+    cursor: str | None = None
+
+
+@function_tool()
+@traced_tool("read_files")
+async def read_files(files: list[FileRange]) -> str:
+    """Read several files or line ranges in one call, much faster than reading them one by one.
+
+        Args:
+            files: The files to read. Leave out start_line/end_line to read a whole file (large files are cut off).
+        """
+    print("filereader: " + " ".join(f.path for f in files))
+    try:
+        return await asyncio.to_thread(tools().read_many, resolve_files([f.model_dump() for f in files]))
+    except ValueError as e:
+        return str(e)
+
+
+@function_tool()
+@traced_tool("file_outline")
+async def file_outline(path: str) -> str:
+    """List the classes and functions of a code file with their line numbers.
+    Use it to find the lines you need before reading a large file.
+
+        Args:
+            path: The path to the file.
+        """
+    print("outline:" + path)
+    path = resolve(path)
     if not os.path.exists(path):
         return f"File not found: {path}"
-    with open(path, "r") as f:
-        return f.read()
+    return await asyncio.to_thread(tools().outline, path)
 
 
 @function_tool(name_override="write_file_tool",
-               description_override="Write or overwrites a complete file with given contet. Make sure you give the complete path to file. If the file already exists the tool overwrites it, make sure that the file is completed")
-def write_file(path: str, content: str) -> str:
+               description_override="Write or overwrites a complete file with given contet. Make sure you give the complete path to file. If the file already exists the tool overwrites it, make sure that the file is completed. To change an existing file use edit_file, it is much cheaper.")
+@traced_tool("write_file")
+async def write_file(path: str, content: str) -> str:
     """Writes conent to a file. The given content will be replace the comlete file.
 
             Args:
@@ -41,64 +109,187 @@ def write_file(path: str, content: str) -> str:
                 content: The content to write.
             """
     print("filewriter:" + path)
-    with open(path, "w") as f:
-        f.write(content)
-    return f"File written successfully: {path}"
+    return await asyncio.to_thread(tools().write, resolve(path), content)
+
+
+class Edit(BaseModel):
+    search: str
+    replace: str
+
+
+@function_tool()
+@traced_tool("edit_file")
+async def edit_file(path: str, edits: list[Edit]) -> str:
+    """Change parts of an existing file with search/replace hunks instead of rewriting it.
+    All hunks are applied or none, Python files must still compile.
+
+        Args:
+            path: The path to the file to change.
+            edits: Hunks to apply. 'search' is the exact, unique text from the file (include a few lines of context), 'replace' the new text.
+        """
+    print("fileeditor:" + path)
+    path = resolve(path)
+    try:
+        return await asyncio.to_thread(tools().edit, path, [edit.model_dump() for edit in edits])
+    except EditError as e:
+        return f"Edit failed, nothing changed: {e}"
+
+
+class FileEdits(BaseModel):
+    path: str
+    edits: list[Edit]
+
+
+@function_tool()
+@traced_tool("edit_files")
+async def edit_files(files: list[FileEdits]) -> str:
+    """Change several existing files with search/replace hunks in one call, all files or none.
+
+        Args:
+            files: For every file its path and the hunks to apply, like edit_file.
+        """
+    print("fileeditor: " + " ".join(f.path for f in files))
+    try:
+        return await asyncio.to_thread(tools().edit_many, resolve_files([f.model_dump() for f in files]))
+    except EditError as e:
+        return f"Edit failed, nothing changed: {e}"
 
 
 @function_tool()
-def git_add(repo_path: str, file_path: str) -> str:
-    """Adds all changed files to the git repository.
+@traced_tool("apply_diff")
+async def apply_diff(repo_path: str, patch: str) -> str:
+    """Apply a patch in unified diff format (like `git diff` output) to the repository, to all files or none.
+
+        Args:
+            repo_path: The path to the repository.
+            patch: The unified diff, file paths relative to the repository.
+        """
+    print("patch:" + repo_path)
+    repo_path = resolve(repo_path)
+    try:
+        return await asyncio.to_thread(tools().patch, repo_path, patch)
+    except EditError as e:
+        return f"Patch failed, nothing changed: {e}"
+
+
+@function_tool()
+@traced_tool("git_add")
+async def git_add(repo_path: str, file_paths: list[str]) -> str:
+    """Adds exactly the given changed files to the staging area of the git repository, in one call.
 
             Args:
                 repo_path: The path to the repository.
+                file_paths: Paths of the files relative to the repository (deleted files included).
             """
-    print("git add")
-    full_path = os.path.join(repo_path, file_path)
-    if not os.path.exists(full_path):
-        return f"file doesn't exist: {full_path}"
+    print("git add: " + " ".join(file_paths))
     try:
-        subprocess.run(["git", "add", "."], cwd=repo_path, check=True)
-        return f"all files added to staging area successfully:"
-    except subprocess.CalledProcessError as e:
+        staged = await asyncio.to_thread(tools().stage, resolve(repo_path), file_paths)
+        return f"files added to staging area successfully: {', '.join(staged)}"
+    except ValueError as e:
         return f"error executing git add: {str(e)}"
 
 @function_tool()
-def find_file(directory: str, filename: str, recursive: bool = True) -> str:
+@traced_tool("find_file")
+async def find_file(directory: str, filename: str, recursive: bool = True) -> str:
     """
-    Searches a file i a given directory and returns the complete path.
+    Searches a file in a given directory and returns the complete paths of the best matches.
 
     Args:
           directory: The path to the directory where to search.
-          filename: The name of the file to search.
+          filename: The name of the file to search, glob patterns like '*.py' are allowed.
           recursive: Whether to search for subdirectories.
     """
     print("findfile: " + directory + "/" + filename)
+    directory = resolve(directory)
     if not os.path.isdir(directory):
         return f"Directory not found: {directory}"
 
-    for root, dirs, files in os.walk(directory):
-        if filename in files:
-            print("ez:" + os.path.join(root, filename))
-            return os.path.join(root, filename)
-        if not recursive:
-            break  # Nur Top-Level-Verzeichnis durchsuchen
+    root = find_repo_root(directory)
+    base = os.path.abspath(directory)
+    matches, _ = await asyncio.to_thread(tools().glob, directory, filename, limit=1000)
+    paths = [os.path.join(root, m) for m in matches]
+    paths = [p for p in paths if (p.startswith(base + os.sep) if recursive else os.path.dirname(p) == base)]
+    if not paths:
+        return f"File '{filename}' not found in {directory}"
+    return "\n".join(os.path.join(directory, os.path.relpath(p, os.path.abspath(directory))) for p in paths[:10])
+
+
+@function_tool()
+@traced_tool("grep_code")
+async def grep_code(repo_path: str, query: str, regex: bool = False, path_glob: str | None = None) -> str:
+    """
+    Searches the content of all files of the repository and returns matching lines ranked by file.
+
+    Args:
+          repo_path: The path to the repository.
+          query: The text to search for.
+          regex: Whether the query is a regular expression.
+          path_glob: Only search files matching this glob, e.g. '*.py' (optional).
+    """
+    print("grep: " + repo_path + " " + query)
+    repo_path = resolve(repo_path)
+    if not os.path.isdir(repo_path):
+        return f"Directory not found: {repo_path}"
+    try:
+        hits, total, files = await asyncio.to_thread(tools().grep, repo_path, query, regex, path_glob=path_glob)
+    except ValueError as e:
+        return str(e)
+    return format_grep(hits, total, files, repo_path)
+
 
-    return f"File '{filename}' not found in {directory}"
+@function_tool()
+@traced_tool("find_definition")
+async def find_definition(repo_path: str, name: str) -> str:
+    """
+    Finds where a class, function or method is defined, e.g. 'QuerySet' or 'QuerySet.filter'.
+
+    Args:
+          repo_path: The path to the repository.
+          name: The name of the class or function.
+    """
+    print("definition: " + repo_path + " " + name)
+    repo_path = resolve(repo_path)
+    if not os.path.isdir(repo_path):
+        return f"Directory not found: {repo_path}"
+    definitions = await asyncio.to_thread(tools().definition, repo_path, name)
+    return format_definitions(definitions, name, repo_path)
+
+@function_tool()
+@traced_tool("run_tests")
+async def run_tests(repo_path: str, tests: list[str], timeout: float | None = None) -> str:
+    """
+    Runs selected tests of the repository in parallel and returns a summary with the failures only.
+    Use it to verify a fix, e.g. with the failing tests named in the task.
+
+    Args:
+          repo_path: The path to the repository.
+          tests: Test ids, e.g. 'tests/test_x.py::TestA::test_b' or 'test_b (app.tests.TestA)'.
+          timeout: Seconds until the test run is aborted (optional).
+    """
+    print("tests: " + repo_path + " " + " ".join(tests))
+    repo_path = resolve(repo_path)
+    if not os.path.isdir(repo_path):
+        return f"Directory not found: {repo_path}"
+    try:
+        run = await asyncio.to_thread(run_test_subset, repo_path, tests, timeout=timeout or TEST_TIMEOUT)
+        note_test_result(bool(run.failed or run.timed_out))
+        return format_test_run(run)
+    except ValueError as e:
+        return str(e)
 
 coderAgent = Agent(
     name="Coder Agent",
     handoff_description="Used to produce code to fix problems in code.",
     instructions="Write the actual Code to fix the Problem to the codefiles. Make sure the fix is minimal and only touches what's necessary to resolve the failing tests.",
-    tools=[write_file, read_file, find_file],
+    tools=[edit_file, edit_files, apply_diff, write_file, read_file, read_files, file_outline, find_file, grep_code, find_definition],
     model="gpt-4o-mini"
 )
 
 testerAgent = Agent(
     name="Tester Agent",
     handoff_description="Used to check whether written code is valid.",
-    instructions=" Ensure that the code does the job that it is supposed to do and fixes the Problem.",
-    tools=[read_file, write_file, find_file],
+    instructions=" Ensure that the code does the job that it is supposed to do and fixes the Problem. Run the failing tests with run_tests and report the failures.",
+    tools=[read_file, read_files, file_outline, edit_file, edit_files, apply_diff, write_file, find_file, grep_code, find_definition, run_tests],
     model="gpt-4o-mini"
 )
 
@@ -106,92 +297,32 @@ plannerAgent = Agent(
     name="Plan Agent",
     instructions="You are the teamleader of a team of developers. You get probles taht you have to fix. Read in broken files with the read_file_tool. Breakdown a given Problem into coding tasks to fix it. After making a plan hand the coding tasks to the Coder Agent. You can verify his work using the Tester Agent. If there are furthermore errors hand the task again to the Coder Agent. When all the work is done use the git add tool to the changed files.",
     handoffs=[coderAgent, testerAgent],
-    tools=[git_add,read_file, find_file],
+    tools=[git_add, read_file, read_files, file_outline, find_file, grep_code, find_definition],
     model="gpt-4o-mini"
 )
 
-async def run_task(index):
-    api_url = f"{API_URL}{index}"
-    print(f"Fetching test case {index} from {api_url}...")
-    repo_dir = os.path.join("repos", f"repo_{index}")  # Use unique repo directory per task
-    start_dir = os.getcwd()  # Remember original working directory
+async def run_task(instance):
+    print("HIER: " + instance.issue)
+    result = await Runner.run(plannerAgent,
+                      f"Work in the directory: {instance.repo_dir}. This is a Git repository. You can use the `read_file` tool to read it, and `edit_file` to change it (`write_file_tool` only for new files); `read_files` and `edit_files` handle several files in one call. Your goal is to fix the problem described below. The fix will be verified by running the affected tests, the Tester Agent can run them with `run_tests`: {json.dumps(instance.fail_tests)} \n Problem description: \n {instance.issue} \n {format_candidates(instance.candidates, instance.repo_dir)}",
+                              max_turns=50)
+    instance.agent_output = result.final_output
+    instance.usage = getattr(result.context_wrapper, "usage", None)
+    instance.model = plannerAgent.model
+    print(result.final_output)
 
-    try:
-        response = requests.get(api_url)
-        if response.status_code != 200:
-            raise Exception(f"Invalid response: {response.status_code}")
-
-        testcase = response.json()
-        issue = testcase["Problem_statement"]
-        git_clone = testcase["git_clone"]
-        fail_tests = json.loads(testcase.get("FAIL_TO_PASS", "[]"))
-        pass_tests = json.loads(testcase.get("PASS_TO_PASS", "[]"))
-        instance_id = testcase["instance_id"]
-
-        # Extract repo URL and commit hash
-        parts = git_clone.split("&&")
-        clone_part = parts[0].strip()
-        checkout_part = parts[-1].strip() if len(parts) > 1 else None
-
-        repo_url = clone_part.split()[2]
-
-        print(f"Cloning repository {repo_url} into {repo_dir}...")
-        env = os.environ.copy()
-        env["GIT_TERMINAL_PROMPT"] = "0"
-        subprocess.run(["git", "clone", repo_url, repo_dir], check=True, env=env)
-
-        if checkout_part:
-            commit_hash = checkout_part.split()[-1]
-            print(f"Checking out commit: {commit_hash}")
-            subprocess.run(["git", "checkout", commit_hash], cwd=repo_dir, check=True, env=env)
-
-        print("HIER: " + issue)
-        result = await Runner.run(plannerAgent,
-                          f"Work in the directory: repo_{index}. This is a Git repository. You can use the `read_file_tool` to read it, and `write_file_tool` to change it. Your goal is to fix the problem described below. The fix will be verified by running the affected tests. \n Problem description: \n {issue}",
-                                  max_turns=50)
-        print(result.final_output)
-
-        print(f"Calling SWE-Bench REST service with repo: {repo_dir}")
-        test_payload = {
-            "instance_id": instance_id,
-            "repoDir": f"/repos/repo_{index}",  # mount with docker
-            "FAIL_TO_PASS": fail_tests,
-            "PASS_TO_PASS": pass_tests
-        }
-        res = requests.post("http://localhost:8082/test", json=test_payload)
-        res.raise_for_status()
-        result_raw = res.json().get("harnessOutput", "{}")
-        result_json = json.loads(result_raw)
-        if not result_json:
-            raise ValueError("No data in harnessOutput – possible evaluation error or empty result")
-        instance_id = next(iter(result_json))
-        tests_status = result_json[instance_id]["tests_status"]
-        fail_pass_results = tests_status["FAIL_TO_PASS"]
-        fail_pass_total = len(fail_pass_results["success"]) + len(fail_pass_results["failure"])
-        fail_pass_passed = len(fail_pass_results["success"])
-        pass_pass_results = tests_status["PASS_TO_PASS"]
-        pass_pass_total = len(pass_pass_results["success"]) + len(pass_pass_results["failure"])
-        pass_pass_passed = len(pass_pass_results["success"])
-
-        # Log results
-        os.chdir(start_dir)
-        with open(LOG_FILE, "a", encoding="utf-8") as log:
-            log.write(f"\n--- TESTCASE {index} ---\n")
-            log.write(f"FAIL_TO_PASS passed: {fail_pass_passed}/{fail_pass_total}\n")
-            log.write(f"PASS_TO_PASS passed: {pass_pass_passed}/{pass_pass_total}\n")
-        print(f"Test case {index} completed and logged.")
-
-
-    except Exception as e:
-        os.chdir(start_dir)
-        with open(LOG_FILE, "a", encoding="utf-8") as log:
-            log.write(f"\n--- TESTCASE {index} ---\n")
-            log.write(f"Error: {e}\n")
-        print(f"Error in test case {index}: {e}")
 
+async def main(args):
+    try:
+        pipeline = Pipeline(run_task, "openai", RESULTS_DB, concurrency=args.concurrency, timeout=args.timeout,
+                            prefetch=args.prefetch, eval_workers=args.eval_workers, run_id=args.resume,
+                            attempts=args.attempts, speculate=args.speculate,
+                            processes=args.processes)
+        await pipeline.run(range(args.start, args.end + 1))
+    finally:
+        await close_shared_client()
 
 
 if __name__ == "__main__":
-    for i in range(24, 31):
-        print(i)
-        asyncio.run(run_task(i))
+    args = parse_sweep_args(24, 30)
+    asyncio.run(main(args))
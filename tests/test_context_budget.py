@@ -0,0 +1,41 @@
+from common.context_budget import TokenBudget
+from common.llm_client import _budget_key
+from common.routing import RouteContext
+
+
+def test_budget_key_per_attempt():
+    assert _budget_key(3, None) == 3
+    assert _budget_key(None, RouteContext(3)) is None
+    route = RouteContext(3, attempt=2)
+    route.branch = 1
+    assert _budget_key(3, route) == (3, 2, 1)
+
+
+def test_attempts_have_their_own_budget():
+    budget = TokenBudget(limit=100)
+    budget.add((3, 1, 0), 100)
+    assert budget.exhausted((3, 1, 0))
+    assert not budget.exhausted((3, 2, 0))
+    assert not budget.exhausted((4, 1, 0))
+
+
+def test_speculative_share():
+    budget = TokenBudget(limit=100)
+    budget.add((3, 1, 1), 40)
+    assert not budget.exhausted((3, 1, 1))
+    assert budget.exhausted((3, 1, 1), share=1 / 3)
+
+
+def test_reset_forgets_all_attempts_of_an_instance():
+    budget = TokenBudget(limit=100)
+    for key in (3, (3, 1, 0), (3, 2, 1), (4, 1, 0)):
+        budget.add(key, 100)
+    budget.reset(3)
+    assert budget.used(3) == budget.used((3, 1, 0)) == budget.used((3, 2, 1)) == 0
+    assert budget.used((4, 1, 0)) == 100
+
+
+def test_no_limit():
+    budget = TokenBudget(limit=0)
+    budget.add(3, 10 ** 9)
+    assert not budget.exhausted(3)
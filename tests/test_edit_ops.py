@@ -0,0 +1,92 @@
+import subprocess
+
+import pytest
+
+from common import edit_ops
+from common.edit_ops import EditError, apply_edits, apply_edits_many, apply_patch
+
+
+def _git(repo, *args):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=repo,
+                   check=True, capture_output=True)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    (tmp_path / "a.py").write_text("x = 1\ny = 2\n")
+    (tmp_path / "b.py").write_text("z = 3\n")
+    (tmp_path / "latin.txt").write_bytes(b"caf\xe9\nline2\n")
+    _git(tmp_path, "init", "-q")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-qm", "initial")
+    return tmp_path
+
+
+def _status(repo):
+    return subprocess.run(["git", "status", "--porcelain"], cwd=repo, capture_output=True, text=True).stdout
+
+
+def test_apply_edits(repo):
+    result = apply_edits(str(repo / "a.py"), [{"search": "y = 2", "replace": "y = 3"}])
+    assert result.startswith("Applied 1 edit(s)")
+    assert (repo / "a.py").read_text() == "x = 1\ny = 3\n"
+
+
+def test_apply_edits_rejects_syntax_errors(repo):
+    with pytest.raises(EditError, match="Syntax error"):
+        apply_edits(str(repo / "a.py"), [{"search": "y = 2", "replace": "y = ("}])
+    assert _status(repo) == ""
+
+
+def test_apply_edits_many_is_all_or_nothing(repo):
+    files = [{"path": str(repo / "a.py"), "edits": [{"search": "x = 1", "replace": "x = 10"}]},
+             {"path": str(repo / "b.py"), "edits": [{"search": "missing", "replace": "z = 4"}]}]
+    with pytest.raises(EditError, match="not found"):
+        apply_edits_many(files)
+    assert _status(repo) == ""
+
+
+def test_apply_edits_many_restores_written_files(repo, monkeypatch):
+    write_atomic = edit_ops.write_atomic
+
+    def failing(path, content):
+        if path.endswith("b.py"):
+            raise OSError("disk full")
+        write_atomic(path, content)
+    monkeypatch.setattr(edit_ops, "write_atomic", failing)
+    files = [{"path": str(repo / "a.py"), "edits": [{"search": "x = 1", "replace": "x = 10"}]},
+             {"path": str(repo / "b.py"), "edits": [{"search": "z = 3", "replace": "z = 4"}]}]
+    with pytest.raises(OSError):
+        apply_edits_many(files)
+    assert _status(repo) == ""
+
+
+def test_apply_patch(repo):
+    result = apply_patch(str(repo), "--- a/a.py\n+++ b/a.py\n@@ -1,2 +1,2 @@\n x = 1\n-y = 2\n+y = 3\n")
+    assert result == "Patch applied: a.py (+1 -1)"
+    assert (repo / "a.py").read_text() == "x = 1\ny = 3\n"
+
+
+def test_apply_patch_rolls_back_syntax_errors(repo):
+    patch = ("--- a/a.py\n+++ b/a.py\n@@ -1,2 +1,2 @@\n x = 1\n-y = 2\n+y = (\n"
+             "--- a/b.py\n+++ b/b.py\n@@ -1 +1 @@\n-z = 3\n+z = 4\n")
+    with pytest.raises(EditError, match="Syntax error"):
+        apply_patch(str(repo), patch)
+    assert _status(repo) == ""
+
+
+def test_apply_patch_rolls_back_unreadable_files(repo):
+    with pytest.raises(EditError, match="Cannot check latin.txt"):
+        apply_patch(str(repo), "--- a/latin.txt\n+++ b/latin.txt\n@@ -2 +2 @@\n-line2\n+line3\n")
+    assert _status(repo) == ""
+
+
+def test_apply_patch_with_several_files_without_git_headers(repo):
+    patch = ("--- a/a.py\n+++ b/a.py\n@@ -1,2 +1,2 @@\n-x = 1\n+x = 10\n y = 2\n"
+             "--- a/b.py\n+++ b/b.py\n@@ -1 +1 @@\n-z = 3\n+z = 4\n")
+    assert apply_patch(str(repo), patch) == "Patch applied: a.py (+1 -1), b.py (+1 -1)"
+
+
+def test_apply_patch_recounts_wrong_hunk_headers(repo):
+    apply_patch(str(repo), "--- a/a.py\n+++ b/a.py\n@@ -1,5 +1,5 @@\n x = 1\n-y = 2\n+y = 3\n")
+    assert (repo / "a.py").read_text() == "x = 1\ny = 3\n"
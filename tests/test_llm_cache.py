@@ -0,0 +1,33 @@
+import httpx
+
+from common.llm_cache import LLMCache, request_key, stub_response
+
+
+def test_request_key_ignores_field_order_and_user_fields():
+    body = {"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+    reordered = {"temperature": 0, "messages": [{"content": "hi", "role": "user"}], "model": "gpt-4o",
+                 "user": "someone", "metadata": {"run": 1}}
+    assert request_key("/v1/chat/completions", body) == request_key("/v1/chat/completions", reordered)
+
+
+def test_request_key_depends_on_path_and_body():
+    body = {"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}]}
+    key = request_key("/v1/chat/completions", body)
+    assert key != request_key("/v1/responses", body)
+    assert key != request_key("/v1/chat/completions", {**body, "model": "gpt-4o-mini"})
+    assert key != request_key("/v1/chat/completions", {**body, "temperature": 0.5})
+
+
+def test_cache_round_trip_and_prune(tmp_path):
+    cache = LLMCache(str(tmp_path), max_mb=1)
+    assert cache.get("ab" * 32) is None
+    cache.put("ab" * 32, 200, {"ok": True})
+    assert cache.get("ab" * 32)["body"] == {"ok": True}
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.prune(max_bytes=0) == 0
+    assert cache.get("ab" * 32) is None
+
+
+def test_stub_response_ends_the_turn():
+    response = httpx.Response(200, json=stub_response("/v1/chat/completions", {"model": "m"}))
+    assert "Final Answer" in response.json()["choices"][0]["message"]["content"]
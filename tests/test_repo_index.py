@@ -0,0 +1,23 @@
+from common.repo_index import RepoIndex, _is_test_path
+
+
+def test_is_test_path():
+    for path in ("tests/test_x.py", "pkg/tests/util.py", "pkg/test_x.py", "pkg/x_test.py", "conftest.py",
+                 "app/tests.py"):
+        assert _is_test_path(path), path
+    for path in ("contest.py", "attestation/keys.py", "latest_release.py", "pytest_plugin.py", "src/_pytest/plugin.py"):
+        assert not _is_test_path(path), path
+
+
+def test_reindex_drops_old_postings(tmp_path):
+    (tmp_path / "a.py").write_text("def alpha():\n    pass\n")
+    (tmp_path / "b.py").write_text("beta = 1\n")
+    index = RepoIndex(str(tmp_path)).build()
+    (tmp_path / "a.py").write_text("def gamma():\n    pass\n")
+    index.notify_changed(str(tmp_path / "a.py"))
+    assert "alpha" not in index.postings and list(index.postings["gamma"]) == [index.ids["a.py"]]
+    assert index.find_definition("alpha") == [] and index.find_definition("gamma")
+    (tmp_path / "a.py").unlink()
+    index.notify_changed(str(tmp_path / "a.py"))
+    assert "gamma" not in index.postings and index.find_definition("gamma") == []
+    assert index.grep("beta")[0] == [("b.py", 1, "beta = 1")]
@@ -0,0 +1,66 @@
+from common.sandbox_tests import NOT_FOUND, _django_reported, _mark_missing, _parse_django, _parse_pytest, \
+    _pytest_reported
+from common.sandbox_tests import TestRun as Run  # not collected as a test class
+
+PYTEST_OUTPUT = """\
+..F
+=================================== FAILURES ===================================
+___________________________________ test_b ____________________________________
+E   assert 1 == 2
+=========================== short test summary info ============================
+PASSED tests/test_x.py::test_a
+PASSED tests/test_x.py::test_x[a b]
+FAILED tests/test_x.py::test_b - assert 1 == 2
+FAILED tests/test_x.py::test_y[x y] - ValueError: no
+1 failed, 2 passed in 0.10s
+"""
+
+DJANGO_OUTPUT = """\
+test_ok (app.tests.ModelTests) ... ok
+test_bad (app.tests.ModelTests)
+Docstring of the test. ... FAIL
+
+======================================================================
+FAIL: test_bad (app.tests.ModelTests)
+----------------------------------------------------------------------
+AssertionError: 1 != 2
+
+----------------------------------------------------------------------
+Ran 2 tests in 0.010s
+"""
+
+
+def test_parse_pytest_ids_with_spaces():
+    run = Run()
+    _parse_pytest(PYTEST_OUTPUT, run, exit_code=1)
+    assert run.passed == ["tests/test_x.py::test_a", "tests/test_x.py::test_x[a b]"]
+    assert run.failed == [("tests/test_x.py::test_b", "assert 1 == 2"),
+                          ("tests/test_x.py::test_y[x y]", "ValueError: no")]
+    assert run.details and run.details[0].startswith("=") and "assert 1 == 2" in run.details[0]
+
+
+def test_parse_pytest_keeps_unusual_exit_codes():
+    run = Run()
+    _parse_pytest("ERROR: not found: tests/test_x.py::test_c\n", run, exit_code=4)
+    assert run.details[0].startswith("[pytest exit code 4]")
+
+
+def test_mark_missing_pytest():
+    run = Run()
+    _parse_pytest(PYTEST_OUTPUT, run, exit_code=1)
+    _mark_missing(run, ["tests/test_x.py::test_x", "tests/test_x.py::test_c"], _pytest_reported)
+    assert run.failed[-1] == ("tests/test_x.py::test_c", NOT_FOUND)
+    assert len(run.failed) == 3
+    run = Run(passed=["tests/test_x.py::test_x[a b]"])
+    _mark_missing(run, ["test_x", "test_z"], _pytest_reported)
+    assert run.failed == [("test_z", NOT_FOUND)]
+
+
+def test_parse_django():
+    run = Run()
+    _parse_django(DJANGO_OUTPUT, run)
+    assert run.passed == ["test_ok (app.tests.ModelTests)"]
+    assert run.failed == [("test_bad (app.tests.ModelTests)", "FAIL")]
+    assert run.details[0].startswith("FAIL: test_bad")
+    _mark_missing(run, ["test_ok (app.tests.ModelTests)", "test_gone (app.tests.ModelTests)"], _django_reported)
+    assert run.failed[-1] == ("test_gone (app.tests.ModelTests)", NOT_FOUND)
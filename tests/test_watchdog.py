@@ -0,0 +1,86 @@
+import subprocess
+
+import pytest
+
+from common import watchdog
+from common.watchdog import StalledError, Watch
+
+
+def _turns(watch, turns, call=None):
+    """Runs ``turns`` requests, each after ``call(watch)``; returns ``[(turn, action)]``."""
+    actions = []
+    for _ in range(turns):
+        if call:
+            call(watch)
+        action = watch.on_request(1000)
+        if action:
+            actions.append((watch.turns, action[0]))
+    return actions
+
+
+def _grep(watch):
+    watch.tool_call("grep_code", ("repo", "needle"), {}, "repo/a.py:1: needle")
+
+
+def test_repeated_call_escalates_while_it_goes_on(tmp_path):
+    watch = Watch(1, str(tmp_path))
+    assert _turns(watch, 12, _grep) == [(3, "nudge"), (7, "escalate"), (11, "abort"), (12, "abort")]
+    assert watch.aborted and "grep_code" in watch.reason
+
+
+def test_nudge_without_escalation_when_the_agent_stops(tmp_path):
+    watch = Watch(1, str(tmp_path))
+    assert _turns(watch, 3, _grep) == [(3, "nudge")]
+    watch.tool_call("read_file", ("repo/b.py",), {}, "text")
+    assert _turns(watch, 10) == []
+    assert watch.level == 1 and not watch.escalated
+
+
+def test_edit_resets_the_watch(tmp_path):
+    watch = Watch(1, str(tmp_path))
+    _turns(watch, 7, _grep)
+    assert watch.escalated
+    watch.tool_call("edit_file", ("repo/a.py", []), {}, "Applied 1 edit(s) to repo/a.py")
+    assert watch.level == 0 and watch.reason is None
+    assert _turns(watch, 2, _grep) == []
+
+
+def test_failed_edit_does_not_reset(tmp_path):
+    watch = Watch(1, str(tmp_path))
+    _turns(watch, 3, _grep)
+    watch.tool_call("edit_file", ("repo/a.py", []), {}, "Edit failed, nothing changed: not found")
+    assert watch.level == 1
+
+
+def test_paging_through_a_file_is_no_stall(tmp_path):
+    watch = Watch(1, str(tmp_path))
+
+    def page(w, start=[1]):
+        w.tool_call("read_file", ("repo/a.py", start[0], start[0] + 99, None, None, None), {}, "text")
+        start[0] += 100
+    assert _turns(watch, 10, page) == []
+    read_again = lambda w: w.tool_call("read_files", ([{"path": "repo/a.py", "start_line": 1, "end_line": 100}],),
+                                       {}, "text")
+    assert [a for _, a in _turns(watch, 3, read_again)] == ["nudge"]
+    assert "same range" in watch.reason
+
+
+def test_another_stall_restarts_the_patience(tmp_path):
+    watch = Watch(1, str(tmp_path))
+    _turns(watch, 3, _grep)
+    other = lambda w: w.tool_call("find_file", ("repo", "*.py"), {}, "repo/a.py")
+    assert _turns(watch, 6, other) == []  # the third find_file starts a new window at turn 6
+    assert _turns(watch, 1, other) == [(10, "escalate")]
+
+
+def test_no_diff_stall_and_check(tmp_path, monkeypatch):
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    monkeypatch.setattr(watchdog, "WATCHDOG_NO_DIFF_TURNS", 5)
+    monkeypatch.setattr(watchdog, "WATCHDOG_PATIENCE", 2)
+    monkeypatch.setattr(Watch, "_probe_tree", lambda self: setattr(self, "_tree_clean", self._clean_tree()))
+    watch = Watch(1, str(tmp_path))
+    assert _turns(watch, 10) == [(5, "nudge"), (7, "escalate"), (9, "abort"), (10, "abort")]
+    with pytest.raises(StalledError, match="no change in the working tree"):
+        watch.check()
+    (tmp_path / "new.py").write_text("x = 1\n")
+    watch.check()  # the tree changed, the result is evaluated